@@ -2,27 +2,96 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import subprocess
 import threading
-import re
 import os
 import signal
+import struct
+import time
+import collections
+import zlib
+from concurrent.futures.process import BrokenProcessPool
 from functools import partial
 from datetime import datetime
 
+from dd_engine import (CHECKSUM_ALGORITHMS, COPY_CHUNK, ChecksumCache, ChunkHasher, DELTA_SUFFIX, EtaTracker,
+                       HotImageCache, IMAGE_FORMATS, IONICE_CLASSES, ImageLibrary, IoGovernor, JobMetrics,
+                       KernelProgress, LUKS_UNLOCK_MS, MetricsExporter, PARTITION_ENCODINGS, RATE_LIMIT_MAX_MB,
+                       SAMPLE_CHUNK, SAMPLE_COUNT, ThroughputHistory, UNCAPPED_NOTE, URL_CONNECTIONS, VERIFY_CHUNK,
+                       apply_delta, assembly_table_command, blockdev_size, build_merkle, check_assembly_table,
+                       clear_device, copy_status, create_assembly_target, create_delta, dd_command,
+                       describe_counters, describe_layout, describe_probe, describe_sample, device_identity,
+                       device_size, device_topology, discard_zeroes, expect_pattern, expect_source,
+                       expect_zeros, file_identity, fit_gpt_to_device, format_duration, format_size,
+                       hash_workers, hashed, image_partitions, inspect_layout, is_block_device, is_manifest,
+                       is_plain_image, is_qcow2, is_url, list_disks, load_manifest, load_merkle,
+                       load_partition_set, luks_benchmark, luks_cipher_choices, luks_format_command,
+                       manifest_stream, merkle_sidecar, mkfs_tuning, pattern_stream, plan_assembly,
+                       plan_partition_image, probe_device, probe_url, qcow2_stream, qcow2_virtual_size,
+                       read_chunks, read_delta_header, read_partition_table, require_access, resolve_checksum,
+                       restore_partitions, run_dd, sample_verify, server_side_copy, set_thread_ioprio,
+                       source_checksums, store_image, stream_copy, sysfs_size, table_regions, throttled,
+                       trimmed_size, trimmed_stream, tune_pbkdf, url_stream, verify_against, write_assembly,
+                       write_nonzero, write_qcow2, write_stream)
+
+class ProgressBus:
+    """Hand-off between worker threads and the Tk thread.
+
+    Workers post widget option changes and one-shot calls; the Tk thread
+    drains the queue once per frame, keeps only the newest options for
+    each widget and applies them with a single config() call.
+    """
+
+    FRAME_MS = 100
+
+    def __init__(self):
+        self.events = collections.deque()  # append/popleft are atomic
+
+    def post(self, target, options):
+        self.events.append((target, options))
+
+    def call(self, fn, *args):
+        self.events.append((None, (fn, args)))
+
+    def drain(self):
+        merged = {}
+        calls = []
+        while True:
+            try:
+                target, payload = self.events.popleft()
+            except IndexError:
+                break
+            if target is None:
+                calls.append(payload)
+            else:
+                merged.setdefault(target, {}).update(payload)
+        return merged, calls
+
 class DDUtilityApp:
     def __init__(self, root):
         self.root = root
         self.root.title("DD Utility")
         self.root.configure(bg='#1E1E1E')
         
-        # Set window icon
+        # Set window icon; decoded once, the main menu reuses a subsampled copy
+        self.app_icon = None
+        self.menu_icon = None
         try:
             icon_path = "/etc/dd_gui/DD_GUI.png"
             if os.path.exists(icon_path):
-                img = tk.PhotoImage(file=icon_path)
-                self.root.tk.call('wm', 'iconphoto', self.root._w, img)
+                self.app_icon = tk.PhotoImage(file=icon_path)
+                self.menu_icon = self.app_icon.subsample(2, 2)
+                self.root.tk.call('wm', 'iconphoto', self.root._w, self.app_icon)
         except Exception as e:
             print(f"Error loading icon: {e}")
 
+        style = ttk.Style()
+        style.theme_use('clam')
+        style.configure(
+            'custom.Horizontal.TProgressbar',
+            troughcolor='#1E1E1E',
+            background='#a5de37',
+            thickness=10
+        )
+
         self.main_frame = tk.Frame(self.root, bg='#1E1E1E')
         self.main_frame.pack(padx=20, pady=20, fill='both', expand=True)
 
@@ -35,29 +104,53 @@ class DDUtilityApp:
         self.process = None
         self.font = ("Segoe UI", 12, "bold")
         self.disk_selection_font = ("Segoe UI", 14, "bold")
-        self.cancelled = False
+        self.job_cancel = threading.Event()  # set by Cancel; each job gets a fresh one
         self.disk_info = {}
+        self.io_policy = {"io_class": "default", "rate_mb": 0, "adaptive": False}
+        self.io_governor = IoGovernor()
+        self.history = ThroughputHistory()
+        self.eta = None
+        self.metrics = MetricsExporter()
+        self.job_metrics = None
+        self.progress_bus = ProgressBus()
+        self.root.after(ProgressBus.FRAME_MS, self.pump_progress)
+        self.screens = {}  # screen name -> frame, built once and re-packed
+        self.verify_var = tk.BooleanVar(value=True)
+        self.verify_requested = False
+        self.sample_var = tk.BooleanVar(value=False)
+        self.sample_count_var = tk.IntVar(value=SAMPLE_COUNT)
+        self.sample_requested = False
+        self.sample_count = SAMPLE_COUNT
+        self.checksums = ChecksumCache()
+        self.hot_cache = HotImageCache()
+        self.hot_cache_var = tk.BooleanVar(value=False)
+        self.hot_cache_requested = False
+        self.discard_var = tk.BooleanVar(value=False)
+        self.discard_requested = False
+        self.luks_bench = None  # loaded on first use; {} when cryptsetup cannot benchmark
+        self.luks_options = None
+        self.format_lazy_var = tk.BooleanVar(value=True)
+        self.trim_var = tk.BooleanVar(value=False)
+        self.image_table = None  # partition table of the source when imaging stops at the last partition
+        self.format_nodiscard_var = tk.BooleanVar(value=False)
+        self.library_entries = []
+        self.image_library = ImageLibrary(checksums=self.checksums)
+        self.image_library.start(lambda: self.progress_bus.call(self.refresh_image_library))
 
         # Initialize UI
         self.initialize_ui()
 
     def initialize_ui(self):
-        self.clear_ui()
-        self.cancelled = False
-        
-        # Add icon to corner if available
-        try:
-            icon_path = "/etc/dd_gui/DD_GUI.png"
-            if os.path.exists(icon_path):
-                img = tk.PhotoImage(file=icon_path).subsample(2, 2)  # <-- Only this line changes
-                icon_label = tk.Label(self.main_frame, image=img, bg='#1E1E1E')
-                icon_label.image = img  # Keep reference
-                icon_label.pack(pady=10)
-        except Exception as e:
-            print(f"Error loading corner icon: {e}")
+        self.eta = None
+        self.job_metrics = None
+        self.show_screen("main", self.build_main_menu)
+
+    def build_main_menu(self, frame):
+        if self.menu_icon:
+            tk.Label(frame, image=self.menu_icon, bg='#1E1E1E').pack(pady=10)
 
         tk.Label(
-            self.main_frame,
+            frame,
             text="Choose DD Task",
             bg='#1E1E1E',
             fg='#FFFFFF',
@@ -80,24 +173,144 @@ class DDUtilityApp:
             ("Create Partition Table", self.create_partition_table),
             ("Format Disk/Partition", self.format_disk),
             ("Secure Erase Disk", self.secure_erase),
-            ("Create Disk Image", self.create_disk_image)
+            ("Create Disk Image", self.create_disk_image),
+            ("Copy Disk Image", self.copy_disk_image),
+            ("Restore Partitions", self.restore_partition_set),
+            ("Assemble Disk Image", self.assemble_image),
+            ("Image Delta", self.show_delta_options),
+            ("Tree Hash Image", self.tree_hash_image),
+            ("I/O Limits", self.show_io_settings)
         ]
 
         for text, command in tasks:
             tk.Button(
-                self.main_frame,
+                frame,
                 text=text,
                 command=command,
                 **button_options
             ).pack(pady=10)
 
+    def pump_progress(self):
+        # Runs in the Tk thread: one config() per widget per frame, then queued calls
+        merged, calls = self.progress_bus.drain()
+        for widget, options in merged.items():
+            try:
+                widget.config(**options)
+            except tk.TclError:
+                pass  # widget belonged to a screen that is gone
+        for fn, args in calls:
+            fn(*args)
+        self.root.after(ProgressBus.FRAME_MS, self.pump_progress)
+
     def clear_ui(self):
+        # Cached screens are only unpacked; everything else is rebuilt per visit
+        cached = {str(frame) for frame in self.screens.values()}
+        if "progress" in self.screens:
+            self.progress_bar.stop()
         for widget in self.main_frame.winfo_children():
-            widget.destroy()
+            if str(widget) in cached:
+                widget.pack_forget()
+            else:
+                widget.destroy()
+
+    def show_screen(self, name, build):
+        self.clear_ui()
+        frame = self.screens.get(name)
+        if frame is None:
+            frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+            build(frame)
+            self.screens[name] = frame
+        frame.pack(fill='both', expand=True)
+        return frame
+
+    def build_progress_screen(self, frame):
+        self.progress_title = tk.Label(
+            frame,
+            text="",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        )
+        self.progress_title.pack(pady=10)
+
+        self.progress_detail = tk.Label(
+            frame,
+            text="",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 12)
+        )
+        self.progress_detail.pack(pady=5)
+
+        self.progress_bar = ttk.Progressbar(
+            frame,
+            length=500,
+            mode='determinate',
+            style='custom.Horizontal.TProgressbar'
+        )
+        self.progress_bar.pack(pady=10, fill='x')
+
+        self.progress_info = tk.Label(
+            frame,
+            text="",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 12)
+        )
+        self.progress_info.pack(pady=10)
+
+        self.progress_counters = tk.Label(
+            frame,
+            text="",
+            bg='#1E1E1E',
+            fg='#AAAAAA',
+            font=("Segoe UI", 10)
+        )
+        self.progress_counters.pack(pady=5)
+
+        self.rate_frame = self.build_rate_control(frame)
+
+        self.progress_button_frame = tk.Frame(frame, bg='#1E1E1E')
+        self.cancel_button = tk.Button(
+            self.progress_button_frame,
+            text="Cancel",
+            font=self.font,
+            bg='#FF4D00',
+            fg='#FFFFFF',
+            relief='flat'
+        )
+        self.cancel_button.pack(fill='x', padx=10)
 
-    def add_back_button(self):
+    def show_progress_screen(self, title, detail="", info="", mode='determinate',
+                             cancel_command=None, rate_control=False):
+        self.show_screen("progress", self.build_progress_screen)
+        self.progress_title.config(text=title)
+        self.progress_detail.config(text=detail)
+        self.progress_info.config(text=info)
+        self.progress_counters.config(text="")
+        self.progress_bar.config(mode=mode, value=0)
+        if mode == 'indeterminate':
+            self.progress_bar.start()
+
+        if cancel_command:
+            self.cancel_button.config(command=cancel_command)
+            self.progress_button_frame.pack(pady=10)
+        else:
+            self.progress_button_frame.pack_forget()
+
+        self.rate_frame.pack_forget()
+        if rate_control:
+            self.new_io_governor()
+            self.rate_scale.config(state='normal')
+            self.rate_scale.set(self.io_policy["rate_mb"])
+            if cancel_command:
+                self.rate_frame.pack(pady=5, before=self.progress_button_frame)
+            else:
+                self.rate_frame.pack(pady=5)
+
+    def add_back_button(self, parent=None):
         tk.Button(
-            self.main_frame,
+            parent or self.main_frame,
             text="Back",
             command=self.initialize_ui,
             font=self.font,
@@ -132,6 +345,21 @@ class DDUtilityApp:
             print(f"Error opening file manager: {e}")
             return None
 
+    def ask_text(self, title, text):
+        try:
+            result = subprocess.run(
+                ["zenity", "--entry", f"--title={title}", f"--text={text}"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            if result.returncode == 0:
+                return result.stdout.strip()
+            return None
+        except Exception as e:
+            print(f"Error opening input dialog: {e}")
+            return None
+
     def choose_directory(self, title="Select Directory"):
         try:
             result = subprocess.run(
@@ -147,30 +375,11 @@ class DDUtilityApp:
             print(f"Error opening directory selector: {e}")
             return None
 
-    def choose_disk(self, prompt, preselect=None, on_done=None):
+    def choose_disk(self, prompt, preselect=None, on_done=None, op_bytes=None, whole_device=False):
         try:
-            disk_details = subprocess.check_output(
-                ["lsblk", "-dpno", "NAME,SIZE,TYPE,MODEL"]
-            ).decode().strip().split("\n")
-            
-            disk_choices = []
-            disk_info = {}
-            
-            for line in disk_details:
-                if line.startswith('/dev/sd') or line.startswith('/dev/mmcblk') or line.startswith('/dev/loop'):
-                    parts = line.split()
-                    disk_path = parts[0]
-                    disk_size = parts[1]
-                    disk_type = parts[2]
-                    disk_model = ' '.join(parts[3:]) if len(parts) > 3 else 'Unknown'
-                    
-                    display_name = f"{disk_path} ({disk_size}) - {disk_model}"
-                    disk_choices.append(display_name)
-                    disk_info[disk_path] = {
-                        'size': disk_size,
-                        'model': disk_model,
-                        'type': disk_type
-                    }
+            disks = list_disks()
+            disk_choices = [f"{disk['path']} ({disk['size']}) - {disk['model']}" for disk in disks]
+            disk_info = {disk['path']: disk for disk in disks}
 
             def on_select():
                 selection = disk_listbox.curselection()
@@ -216,6 +425,54 @@ class DDUtilityApp:
                 except ValueError:
                     pass
 
+            def on_probe():
+                selection = disk_listbox.curselection()
+                if not selection:
+                    return
+                index = selection[0]
+                disk_path = disk_listbox.get(index).split()[0]
+                probe_label.config(text=f"Probing {disk_path}...")
+                threading.Thread(
+                    target=self.run_probe,
+                    args=(disk_path, allow_write.get(), disk_listbox, index,
+                          disk_choices[index], probe_label, op_bytes, whole_device),
+                    daemon=True
+                ).start()
+
+            probe_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+            probe_frame.pack(pady=5)
+
+            allow_write = tk.BooleanVar(value=False)
+            tk.Checkbutton(
+                probe_frame,
+                text="Allow write tests (data is restored afterwards)",
+                variable=allow_write,
+                bg='#1E1E1E',
+                fg='#FFFFFF',
+                selectcolor='#2C3E50',
+                activebackground='#1E1E1E',
+                font=("Segoe UI", 11)
+            ).pack(side='left', padx=5)
+
+            tk.Button(
+                probe_frame,
+                text="Probe Selected",
+                command=on_probe,
+                font=self.font,
+                bg='#555555',
+                fg='#a5de37',
+                relief='flat'
+            ).pack(side='left', padx=5)
+
+            probe_label = tk.Label(
+                self.main_frame,
+                text="",
+                bg='#1E1E1E',
+                fg='#FFFFFF',
+                font=("Segoe UI", 11)
+            )
+            probe_label.pack()
+
             tk.Button(
                 self.main_frame,
                 text="OK",
@@ -231,29 +488,152 @@ class DDUtilityApp:
         except subprocess.CalledProcessError as e:
             messagebox.showerror("Error", f"Failed to list disks: {e}")
 
+    def run_probe(self, disk_path, allow_write, listbox, index, display_name, label, op_bytes, whole_device):
+        try:
+            result = probe_device(disk_path, allow_write)
+        except OSError as e:
+            self.progress_bus.post(label, {'text': f"Probe of {disk_path} failed: {e}"})
+            return
+        summary = describe_probe(result, result["size"] if whole_device else op_bytes)
+
+        def show():
+            try:
+                listbox.delete(index)
+                listbox.insert(index, f"{display_name} | {summary}")
+                label.config(text="WARNING: markers did not read back, capacity may be fake!"
+                             if result["capacity_ok"] is False else "")
+            except tk.TclError:
+                pass  # picker was closed while probing
+
+        self.progress_bus.call(show)
+
     def file_to_disk(self):
-        self.selected_file = self.choose_file("Select file to flash to disk")
+        self.show_image_library()
+
+    def show_image_library(self):
+        self.clear_ui()
+        tk.Label(
+            self.main_frame,
+            text="Select image to flash",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=self.disk_selection_font
+        ).pack(pady=10)
+
+        listbox_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        listbox_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        scrollbar = tk.Scrollbar(listbox_frame, orient="vertical", bg='#1E1E1E')
+        scrollbar.pack(side='right', fill='y')
+
+        self.library_listbox = tk.Listbox(
+            listbox_frame,
+            selectmode=tk.SINGLE,
+            bg='#2C3E50',
+            fg='#FFFFFF',
+            font=("Segoe UI", 12),
+            width=90,
+            yscrollcommand=scrollbar.set
+        )
+        self.library_listbox.pack(fill='both', expand=True)
+        scrollbar.config(command=self.library_listbox.yview)
+        self.refresh_image_library()
+
+        def on_use():
+            selection = self.library_listbox.curselection()
+            if selection:
+                self.select_source_file(self.library_entries[selection[0]]["path"])
+
+        def on_add_folder():
+            directory = self.choose_directory("Add image folder to library")
+            if directory:
+                self.image_library.add_directory(directory)
+
+        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+        for text, command in (("Use Selected", on_use),
+                              ("Browse...", lambda: self.select_source_file(
+                                  self.choose_file("Select file to flash to disk"))),
+                              ("From URL...", self.select_source_url),
+                              ("Add Folder", on_add_folder)):
+            tk.Button(
+                button_frame,
+                text=text,
+                command=command,
+                font=self.font,
+                bg='#a5de37',
+                fg='#000000',
+                relief='flat'
+            ).pack(side='left', padx=5)
+
+        self.add_back_button()
+
+    def refresh_image_library(self):
+        # Called on the Tk thread, also whenever the scanner reports changes
+        try:
+            listbox = self.library_listbox
+            if not listbox.winfo_exists():
+                return
+        except (AttributeError, tk.TclError):
+            return
+        self.library_entries = self.image_library.entries()
+        listbox.delete(0, tk.END)
+        for entry in self.library_entries:
+            details = [format_size(entry["size"]), entry["format"]]
+            if entry["label"]:
+                details.append(entry["label"])
+            if entry["layout"]:
+                details.append(f"{entry['layout']['table']}, {len(entry['layout']['partitions'])} partitions")
+            listbox.insert(tk.END, f"{os.path.basename(entry['path'])} - {', '.join(details)}")
+        if not self.library_entries:
+            listbox.insert(tk.END, "No indexed images yet - use Add Folder or Browse...")
+
+    def select_source_file(self, path):
+        self.selected_file = path
         if not self.selected_file:
             self.initialize_ui()
             return
-        self.total_size = os.path.getsize(self.selected_file)
-        self.choose_disk("Choose disk to write to:", on_done=self.set_destination_disk)
+        if is_manifest(self.selected_file):
+            self.total_size = load_manifest(self.selected_file)["size"]
+        elif is_qcow2(self.selected_file):
+            self.total_size = qcow2_virtual_size(self.selected_file)
+        else:
+            self.total_size = os.path.getsize(self.selected_file)
+        self.choose_disk("Choose disk to write to:", on_done=self.set_destination_disk, op_bytes=self.total_size)
+
+    def select_source_url(self):
+        url = self.ask_text("Flash from URL", "Image URL (http:// or https://):")
+        if not url:
+            return
+        if not is_url(url):
+            messagebox.showerror("Error", "Enter an http:// or https:// URL")
+            return
+        checksum = self.ask_text("Flash from URL", "Published checksum, or URL of a checksum file (optional):")
+        try:
+            self.source_url = probe_url(url)
+            self.source_url["checksum"] = resolve_checksum(checksum, url) if checksum else None
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot flash from {url}: {e}")
+            return
+        self.selected_file = url
+        # Progress of a compressed download is measured in downloaded bytes
+        self.total_size = self.source_url["size"] or 0
+        self.choose_disk("Choose disk to write to:", on_done=self.set_destination_disk,
+                         op_bytes=None if self.source_url["compression"] else self.source_url["size"])
 
     def disk_to_disk(self):
-        self.choose_disk("Choose disk to read from (source):", on_done=self.set_source_disk)
+        self.choose_disk("Choose disk to read from (source):", on_done=self.set_source_disk, whole_device=True)
 
     def set_source_disk(self, disk_path, disk_info):
         self.selected_source_disk = disk_path
         self.disk_info[disk_path] = disk_info
         try:
-            self.total_size = int(subprocess.check_output(
-                ["sudo", "blockdev", "--getsize64", disk_path]
-            ).strip())
+            self.total_size = blockdev_size(disk_path)
         except subprocess.CalledProcessError as e:
             messagebox.showerror("Error", f"Failed to get size of source disk: {e}")
             self.initialize_ui()
             return
-        self.choose_disk("Choose disk to write to (destination):", on_done=self.set_destination_disk)
+        self.choose_disk("Choose disk to write to (destination):", on_done=self.set_destination_disk,
+                         op_bytes=self.total_size)
 
     def set_destination_disk(self, disk_path, disk_info):
         self.selected_destination_disk = disk_path
@@ -281,6 +661,65 @@ class DDUtilityApp:
             font=("Segoe UI", 14, "bold")
         ).pack(pady=20)
 
+        if self.selected_file:
+            self.prepare_job(self.selected_destination_disk, "flash", COPY_CHUNK, self.total_size)
+            if is_url(self.selected_file):
+                info = self.source_url
+                tk.Label(
+                    self.main_frame,
+                    text=f"Download: {format_size(info['size']) if info['size'] else 'unknown size'}, "
+                         f"{f'{URL_CONNECTIONS} parallel connections' if info['ranges'] else 'single connection'}"
+                         f"{', ' + info['compression'] + ' decompressed on the fly' if info['compression'] else ''}\n"
+                         f"{'Checked against ' + CHECKSUM_ALGORITHMS[len(info['checksum'])] if info['checksum'] else 'No checksum given'}",
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+            report = self.show_layout_summary(self.main_frame, self.selected_file) \
+                if is_plain_image(self.selected_file) else None
+            if is_plain_image(self.selected_file):
+                tk.Checkbutton(
+                    self.main_frame,
+                    text="Verify after writing",
+                    variable=self.verify_var,
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    selectcolor='#2C3E50',
+                    activebackground='#1E1E1E',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+                self.build_sample_options(self.main_frame, "Verify a random sample only")
+                tk.Checkbutton(
+                    self.main_frame,
+                    text="Keep image in RAM cache for repeated flashing",
+                    variable=self.hot_cache_var,
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    selectcolor='#2C3E50',
+                    activebackground='#1E1E1E',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+            # Only offered where cleared blocks are guaranteed to read back as zeros
+            self.discard_var.set(False)
+            if discard_zeroes(self.selected_destination_disk):
+                tk.Checkbutton(
+                    self.main_frame,
+                    text="Discard device first, write only non-zero data",
+                    variable=self.discard_var,
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    selectcolor='#2C3E50',
+                    activebackground='#1E1E1E',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+                if report and report["used"] < report["size"] / 2:
+                    self.discard_var.set(True)
+                    self.show_suggestion(f"Suggested: discard first, only ~{format_size(report['used'])} "
+                                         f"needs writing", report["used"] / report["size"])
+        else:
+            self.prepare_job(self.selected_destination_disk, "clone", COPY_CHUNK, self.total_size)
+            self.show_layout_summary(self.main_frame, self.selected_source_disk)
+
         if not self.selected_file:  # Only show warning for disk operations
             warning_label = tk.Label(
                 self.main_frame,
@@ -314,77 +753,52 @@ class DDUtilityApp:
             relief='flat'
         ).pack(side='right', padx=10)
 
+    def build_sample_options(self, parent, text):
+        frame = tk.Frame(parent, bg='#1E1E1E')
+        frame.pack(pady=5)
+        tk.Checkbutton(
+            frame,
+            text=text,
+            variable=self.sample_var,
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            selectcolor='#2C3E50',
+            activebackground='#1E1E1E',
+            font=("Segoe UI", 12)
+        ).pack(side='left')
+        tk.Label(frame, text="chunks:", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).pack(side='left', padx=5)
+        tk.Spinbox(frame, from_=100, to=1000000, increment=500, textvariable=self.sample_count_var,
+                   width=8).pack(side='left')
+
+    def read_sample_options(self):
+        # Main thread; the worker only sees the plain values
+        self.sample_requested = self.sample_var.get()
+        try:
+            self.sample_count = max(0, int(self.sample_count_var.get()))
+        except (tk.TclError, ValueError):
+            self.sample_count = SAMPLE_COUNT
+
     def show_progress(self):
-        self.clear_ui()
+        self.verify_requested = bool(self.selected_file) and self.verify_var.get()
+        self.read_sample_options()
+        self.sample_requested = self.verify_requested and self.sample_requested
+        self.hot_cache_requested = bool(self.selected_file) and self.hot_cache_var.get()
+        self.discard_requested = bool(self.selected_file) and self.discard_var.get()
+        # Read-back verification opens the written disk in-process
+        if self.verify_requested and not self.confirm_direct_access(read=[self.selected_destination_disk]):
+            return
         if self.selected_file:
             self.task_message = f"Flashing {os.path.basename(self.selected_file)} to {self.selected_destination_disk}"
         else:
             self.task_message = f"Cloning {self.selected_source_disk} to {self.selected_destination_disk}"
 
-        tk.Label(
-            self.main_frame,
-            text=self.task_message,
-            bg='#1E1E1E',
-            fg='#FFFFFF',
-            font=("Segoe UI", 14, "bold")
-        ).pack(pady=10)
-
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure(
-            'custom.Horizontal.TProgressbar',
-            troughcolor='#1E1E1E',
-            background='#a5de37',
-            thickness=10
-        )
-
-        self.progress_bar = ttk.Progressbar(
-            self.main_frame,
-            length=500,
-            mode='determinate',
-            style='custom.Horizontal.TProgressbar'
-        )
-        self.progress_bar.pack(pady=10, fill='x')
-
-        self.progress_info = tk.Label(
-            self.main_frame,
-            text="Copied: 0 MB, 0% Done",
-            bg='#1E1E1E',
-            fg='#FFFFFF',
-            font=("Segoe UI", 12)
-        )
-        self.progress_info.pack(pady=10)
-
-        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
-        button_frame.pack(pady=10)
+        self.show_progress_screen(self.task_message, info="Copied: 0 MB, 0% Done",
+                                  cancel_command=self.cancel_dd, rate_control=True)
 
-        self.cancel_button = tk.Button(
-            button_frame,
-            text="Cancel",
-            command=self.cancel_dd,
-            font=self.font,
-            bg='#FF4D00',
-            fg='#FFFFFF',
-            relief='flat'
-        )
-        self.cancel_button.pack(fill='x', padx=10)
+        self.start_job(self.execute_dd)
 
-        threading.Thread(target=self.execute_dd).start()
-
-    def update_progress(self, line):
-        match = re.search(r'(\d+) bytes', line)
-        if match:
-            copied_bytes = int(match.group(1))
-            copied_mb = copied_bytes / (1024 * 1024)
-            if self.total_size > 0:
-                progress_percentage = min((copied_bytes / self.total_size) * 100, 100)
-                copied_mb_formatted = f"{int(copied_mb):04d}"
-                self.root.after(0, self.progress_bar.config, {'value': progress_percentage})
-                self.root.after(0, self.progress_info.config, {
-                    'text': f"Copied: {copied_mb_formatted} MB, {progress_percentage:.0f}% Done"
-                })
-
-    def execute_dd(self):
+    def execute_dd(self, cancel):
         if self.selected_file and self.selected_destination_disk:
             src = self.selected_file
             dest = self.selected_destination_disk
@@ -394,70 +808,397 @@ class DDUtilityApp:
         else:
             return
 
+        governor = self.io_governor
+        read_from = src
+        if self.hot_cache_requested and is_plain_image(src):
+            read_from = self.hot_cache.lookup(src)
+            if read_from is None:
+                # Miss: the in-process copy fills the cache during this flash
+                self.execute_engine_flash(cancel, src, dest)
+                return
+        if self.discard_requested or is_url(src) or is_manifest(src) or is_qcow2(src):
+            self.execute_engine_flash(cancel, read_from, dest, verify_source=src)
+            return
+        summary = None
+        # The rate slider stays live for the whole job, so dd always gets a cgroup when one can be set up
+        if not governor.attach_cgroup([read_from, dest]):
+            if self.can_open_directly([read_from], [dest]):
+                # No cgroup, but the token bucket can cap an in-process copy
+                self.execute_engine_flash(cancel, read_from, dest, verify_source=src)
+                return
+            summary = self.rate_control_unavailable()
+
+        job_done = self.begin_io_job([read_from, dest], cancel)
         try:
-            self.process = subprocess.Popen(
-                ["sudo", "dd", f"if={src}", f"of={dest}", "bs=4M", "conv=fdatasync", "status=progress"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            while True:
-                if self.cancelled:
-                    break
-                    
-                line = self.process.stderr.readline()
-                if not line:
-                    break
-                self.root.after(0, self.update_progress, line.strip())
-            
-            self.process.wait()
-            if self.cancelled:
-                self.root.after(0, self.show_operation_result, 
-                              "Operation cancelled", 
-                              False)
-            elif self.process.returncode == 0:
-                self.root.after(0, self.show_operation_result, 
-                              "Operation completed successfully", 
-                              True)
-            else:
-                raise subprocess.CalledProcessError(self.process.returncode, self.process.args)
+            run_dd(dd_command(read_from, dest, conv="fdatasync", wrap=governor.wrap_command),
+                   lambda n: self.report_copied_bytes(n, "Copied"), cancel.is_set,
+                   started=self.attach_process)
+            if not cancel.is_set():
+                self.finish_flash(cancel, src, dest, summary)
         except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode().strip() if e.stderr else str(e)
-            self.root.after(0, self.show_operation_result, 
+            error_msg = e.stderr or str(e)
+            self.progress_bus.call(self.show_job_result, cancel, 
                           f"Operation failed: {error_msg}", 
                           False)
         finally:
             self.process = None
+            job_done.set()
+            governor.release()
+
+    def execute_engine_flash(self, cancel, src, dest, verify_source=None):
+        # In-process copy for sources dd cannot read directly, or when a rate cap needs the token bucket;
+        # verify_source is the original image when src is its hot cache copy
+        verify_source = verify_source or src
+        governor = self.io_governor
+        job_done = self.begin_io_job([src, dest], cancel)
+        should_stop = cancel.is_set
+        progress = lambda n: self.report_copied_bytes(n, "Copied")
+        try:
+            require_access(read=[src], write=[dest])
+            if is_url(src):
+                info = self.source_url
+                if info["compression"]:
+                    # The download size is the only known total, so progress follows the download
+                    chunks = url_stream(info, info["checksum"], lambda n: self.report_copied_bytes(n, "Downloaded"),
+                                        should_stop)
+                    progress = None
+                else:
+                    chunks = url_stream(info, info["checksum"], None, should_stop)
+            elif is_manifest(src):
+                chunks = manifest_stream(load_manifest(src), should_stop)
+            elif is_qcow2(src):
+                chunks = qcow2_stream(src, should_stop)
+            else:
+                chunks = read_chunks(src, COPY_CHUNK, should_stop)
+            hasher = None
+            if src == verify_source and is_plain_image(src) and not self.checksums.get(src):
+                # Hash the source on the way through so verify never has to read it again
+                identity = file_identity(src)
+                hasher = ChunkHasher()
+                chunks = hashed(chunks, hasher)
+            if self.hot_cache_requested and src == verify_source and is_plain_image(src):
+                chunks = self.hot_cache.fill(src, chunks)
+            summary = None
+            if self.discard_requested:
+                self.progress_bus.post(self.progress_title, {'text': f"Discarding {dest}"})
+                clear_device(dest,
+                             lambda done, size: self.progress_bus.post(self.progress_info, {
+                                 'text': f"Discarded: {done // (1024 * 1024)} of {size // (1024 * 1024)} MB"}),
+                             should_stop)
+                self.progress_bus.post(self.progress_title, {'text': self.task_message})
+                if not should_stop():
+                    written, covered = write_nonzero(throttled(chunks, governor.limiter), dest, progress)
+                    summary = (f"Wrote {written // (1024 * 1024)} of {covered // (1024 * 1024)} MB "
+                               f"({written / max(covered, 1):.0%}), zero chunks skipped")
+            else:
+                write_stream(throttled(chunks, governor.limiter), dest, progress)
+            if is_url(src) and self.source_url["checksum"]:
+                summary = "\n".join(filter(None, [summary, "Published checksum matched"]))
+            if not should_stop():
+                if hasher:
+                    self.checksums.put(src, identity, *hasher.result())
+                self.finish_flash(cancel, verify_source, dest, summary)
+        except (OSError, ValueError, zlib.error) as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Operation failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def finish_flash(self, cancel, src, dest, summary=None):
+        # Worker thread, after a successful write
+        note = f"\n{summary}" if summary else ""
+        if not (self.verify_requested and is_plain_image(src)):
+            note += self.fit_partition_table(dest)
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Operation completed successfully{note}",
+                          True)
+            return
+        self.progress_bus.post(self.progress_title, {'text': f"Verifying {dest}"})
+        should_stop = cancel.is_set
+        if self.sample_requested:
+            self.finish_sampled_verify(cancel, src, dest, note)
+            return
+        # A tree sidecar next to the image saves hashing the source
+        tree = load_merkle(src)
+        if tree:
+            reference = (f"Merkle root: {tree['root'].hex()}", tree["leaves"])
+        else:
+            reference = source_checksums(src, self.checksums,
+                                         lambda n: self.report_copied_bytes(n, "Hashing source", track=False),
+                                         should_stop)
+            if reference is None:
+                return
+            reference = (f"SHA-256: {reference[0]}", reference[1])
+        chunk_size = tree["leaf_size"] if tree else VERIFY_CHUNK
+        size = os.path.getsize(src)
+        bad = verify_against(dest, reference[1], size,
+                             lambda n: self.report_copied_bytes(n, "Verifying", track=False),
+                             should_stop, chunk_size)
+        if self.job_metrics:
+            self.job_metrics.add_verified(size)
+        if should_stop():
+            return
+        if bad:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Verification failed: {len(bad)} of {len(reference[1])} chunks differ\n"
+                          f"(first at offset {bad[0] * chunk_size})",
+                          False)
+        else:
+            note += self.fit_partition_table(dest)
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Operation completed and verified successfully\n{reference[0]}{note}",
+                          True)
 
-    def cancel_dd(self):
-        if hasattr(self, 'process') and self.process:
-            self.process.send_signal(signal.SIGINT)
-            self.process = None
-        self.cancelled = True
-        self.initialize_ui()
+    def finish_sampled_verify(self, cancel, src, dest, note):
+        size = os.path.getsize(src)
+        chunk_size, check = expect_source(src, self.checksums)
+        with open(src, "rb") as f:
+            table = read_partition_table(f)
+        regions = table_regions(table, size) if table and table["partitions"] else ()
+        result = self.run_sample_verify(cancel, dest, size, chunk_size, check, regions)
+        if cancel.is_set():
+            return
+        if result["bad"]:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Verification failed: {describe_sample(result, chunk_size)}",
+                          False)
+        else:
+            note += self.fit_partition_table(dest)
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Operation completed and spot-checked\n{describe_sample(result, chunk_size)}{note}",
+                          True)
 
-    def create_partition_table(self):
-        def on_disk_selected(disk_path, disk_info):
-            self.selected_source_disk = disk_path
-            self.disk_info[disk_path] = disk_info
-            self.show_partition_table_options()
+    def run_sample_verify(self, cancel, dest, size, chunk_size, check, regions):
+        # Worker thread; progress is against the bytes the sample will read
+        self.total_size = min(size, (self.sample_count + len(regions) + 2) * chunk_size)
+        result = sample_verify(dest, size, chunk_size, check, self.sample_count, regions,
+                               lambda n: self.report_copied_bytes(n, "Sampling", track=False),
+                               cancel.is_set)
+        if self.job_metrics:
+            self.job_metrics.add_verified(int(result["coverage"] * size))
+        return result
+
+    def fit_partition_table(self, dest):
+        # Images cut at their last partition carry a GPT sized for the image, not the device
+        if not is_block_device(dest):
+            return ""
+        try:
+            return "\nBackup GPT moved to the end of the device" if fit_gpt_to_device(dest) else ""
+        except OSError:
+            return ""
 
-        self.choose_disk("Select disk to create partition table:", on_done=on_disk_selected)
+    def rate_control_unavailable(self):
+        # Worker thread: dd runs without a cgroup, so the slider could not change anything
+        self.progress_bus.post(self.rate_scale, {'state': 'disabled'})
+        return UNCAPPED_NOTE if self.io_governor.limited else None
 
-    def show_partition_table_options(self):
-        self.clear_ui()
+    def can_open_directly(self, read=(), write=()):
+        try:
+            require_access(read, write)
+        except PermissionError:
+            return False
+        return True
+
+    def confirm_direct_access(self, read=(), write=()):
+        try:
+            require_access(read, write)
+        except PermissionError as e:
+            messagebox.showerror("Error", str(e))
+            return False
+        return True
+
+    def new_io_governor(self):
+        policy = self.io_policy
+        self.io_governor = IoGovernor(policy["io_class"], policy["rate_mb"] * 1024 * 1024, policy["adaptive"])
+        return self.io_governor
+
+    def begin_io_job(self, paths, cancel):
+        # ionice applies per thread for in-process copies; dd gets it through wrap_command
+        set_thread_ioprio(self.io_governor.io_class)
+        job_done = threading.Event()
+        if self.io_governor.adaptive:
+            threading.Thread(target=self.io_governor.watch,
+                             args=(paths, lambda: job_done.is_set() or cancel.is_set()),
+                             daemon=True).start()
+        counters = KernelProgress(paths, self.current_pid)
+        threading.Thread(target=counters.run,
+                         args=(lambda sample: self.progress_bus.post(self.progress_counters,
+                                                                     {'text': describe_counters(sample)}),
+                               lambda: job_done.is_set() or cancel.is_set()),
+                         daemon=True).start()
+        return job_done
+
+    def current_pid(self):
+        process = getattr(self, 'process', None)
+        return process.pid if process else None
+
+    def prepare_job(self, device, operation, block_size, total_bytes, reads=True):
+        # Called from confirmation screens; shows the prediction from earlier runs
+        self.job_metrics = JobMetrics(operation, device, reads=reads)
+        self.eta = EtaTracker(self.history, device_identity(device), operation, block_size, total_bytes)
+        predicted = self.eta.predicted_total()
+        if predicted is not None:
+            tk.Label(
+                self.main_frame,
+                text=f"Expected duration: ~{format_duration(predicted)} (from {len(self.eta.records)} earlier runs)",
+                bg='#1E1E1E',
+                fg='#FFFFFF',
+                font=("Segoe UI", 12)
+            ).pack(pady=5)
+
+    def show_layout_summary(self, parent, path):
+        # Reads only partition tables and superblocks, so it is cheap enough for a confirmation screen
+        try:
+            report = inspect_layout(path)
+        except OSError:
+            return None
         tk.Label(
-            self.main_frame,
-            text=f"Select partition table type for {self.selected_source_disk}",
+            parent,
+            text=describe_layout(report),
             bg='#1E1E1E',
             fg='#FFFFFF',
-            font=("Segoe UI", 14, "bold")
-        ).pack(pady=20)
+            font=("Segoe UI", 11),
+            justify=tk.LEFT
+        ).pack(pady=5)
+        return report
 
-        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
-        button_frame.pack(pady=10)
+    def show_suggestion(self, text, time_fraction=None):
+        # time_fraction scales the history-based prediction to the data the suggested mode moves
+        predicted = self.eta.predicted_total() if self.eta and time_fraction is not None else None
+        if predicted is not None:
+            text += f" (~{format_duration(predicted * time_fraction)})"
+        tk.Label(
+            self.main_frame,
+            text=text,
+            bg='#1E1E1E',
+            fg='#a5de37',
+            font=("Segoe UI", 12, "bold")
+        ).pack(pady=5)
 
-        tk.Button(
+    def track_progress(self, done_bytes):
+        job_metrics = self.job_metrics
+        if job_metrics:
+            job_metrics.observe(done_bytes)
+        eta = self.eta
+        remaining = eta.update(done_bytes) if eta else None
+        return "" if remaining is None else f", ETA {format_duration(remaining)}"
+
+    def build_rate_control(self, parent):
+        frame = tk.Frame(parent, bg='#1E1E1E')
+        tk.Label(
+            frame,
+            text="Bandwidth limit (MB/s, 0 = none):",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 11)
+        ).pack(side='left', padx=5)
+        self.rate_scale = tk.Scale(
+            frame,
+            from_=0,
+            to=RATE_LIMIT_MAX_MB,
+            resolution=10,
+            orient='horizontal',
+            length=250,
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            highlightthickness=0,
+            command=lambda value: self.io_governor.set_cap(int(value) * 1024 * 1024)
+        )
+        self.rate_scale.pack(side='left')
+        return frame
+
+    def show_io_settings(self):
+        self.show_screen("io_settings", self.build_io_settings_screen)
+        self.io_class_var.set(self.io_policy["io_class"])
+        self.rate_mb_var.set(self.io_policy["rate_mb"])
+        self.adaptive_var.set(self.io_policy["adaptive"])
+
+    def build_io_settings_screen(self, frame):
+        tk.Label(
+            frame,
+            text="I/O Limits for disk operations",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        ).pack(pady=20)
+
+        settings_frame = tk.Frame(frame, bg='#1E1E1E')
+        settings_frame.pack(pady=10)
+
+        self.io_class_var = tk.StringVar()
+        self.rate_mb_var = tk.IntVar()
+        self.adaptive_var = tk.BooleanVar()
+
+        tk.Label(settings_frame, text="I/O priority:", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).grid(row=0, column=0, sticky='w', pady=5)
+        tk.OptionMenu(settings_frame, self.io_class_var, *IONICE_CLASSES).grid(row=0, column=1, sticky='w')
+
+        tk.Label(settings_frame, text="Bandwidth limit (MB/s, 0 = none):", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).grid(row=1, column=0, sticky='w', pady=5)
+        tk.Spinbox(settings_frame, from_=0, to=RATE_LIMIT_MAX_MB, increment=10, textvariable=self.rate_mb_var,
+                   width=8).grid(row=1, column=1, sticky='w')
+
+        tk.Checkbutton(settings_frame, text="Back off when other disks are busy", variable=self.adaptive_var,
+                       bg='#1E1E1E', fg='#FFFFFF', selectcolor='#2C3E50', activebackground='#1E1E1E',
+                       font=("Segoe UI", 12)).grid(row=2, column=0, columnspan=2, sticky='w', pady=5)
+
+        tk.Button(
+            frame,
+            text="Save",
+            command=self.save_io_settings,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat'
+        ).pack(pady=10)
+
+        self.add_back_button(frame)
+
+    def save_io_settings(self):
+        try:
+            rate = min(max(0, int(self.rate_mb_var.get())), RATE_LIMIT_MAX_MB)
+        except (tk.TclError, ValueError):
+            rate = 0
+        self.io_policy = {"io_class": self.io_class_var.get(), "rate_mb": rate, "adaptive": self.adaptive_var.get()}
+        self.initialize_ui()
+
+    def attach_process(self, process):
+        # run_dd hands over its dd process so Cancel can signal it
+        self.process = process
+
+    def cancel_dd(self):
+        if hasattr(self, 'process') and self.process:
+            self.process.send_signal(signal.SIGINT)
+            self.process = None
+        self.cancel_job()
+
+    def create_partition_table(self):
+        def on_disk_selected(disk_path, disk_info):
+            self.selected_source_disk = disk_path
+            self.disk_info[disk_path] = disk_info
+            self.show_partition_table_options()
+
+        self.choose_disk("Select disk to create partition table:", on_done=on_disk_selected)
+
+    def show_partition_table_options(self):
+        self.show_screen("partition_table", self.build_partition_table_screen)
+        self.partition_table_title.config(text=f"Select partition table type for {self.selected_source_disk}")
+
+    def build_partition_table_screen(self, frame):
+        self.partition_table_title = tk.Label(
+            frame,
+            text="",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        )
+        self.partition_table_title.pack(pady=20)
+
+        button_frame = tk.Frame(frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+
+        tk.Button(
             button_frame,
             text="MBR (msdos)",
             command=lambda: self.confirm_partition_table("msdos"),
@@ -479,7 +1220,7 @@ class DDUtilityApp:
             width=15
         ).pack(side='left', padx=10)
 
-        self.add_back_button()
+        self.add_back_button(frame)
 
     def confirm_partition_table(self, table_type):
         self.clear_ui()
@@ -524,60 +1265,480 @@ class DDUtilityApp:
         ).pack(side='right', padx=10)
 
     def create_actual_partition_table(self, table_type):
+        self.show_progress_screen(f"Creating {table_type} partition table on {self.selected_source_disk}...",
+                                  info="Working...", mode='indeterminate')
+
+        self.start_job(self.run_create_partition_table, table_type)
+
+    def run_create_partition_table(self, cancel, table_type):
+        job_done = self.begin_io_job([self.selected_source_disk], cancel)
+        try:
+            self.run_tool(["sudo", "parted", "-s", self.selected_source_disk, "mklabel", table_type])
+            self.progress_bus.call(self.show_job_result, cancel, 
+                          f"Successfully created {table_type} partition table on {self.selected_source_disk}", 
+                          True)
+        except subprocess.CalledProcessError as e:
+            error_msg = e.stderr.decode().strip() if e.stderr else str(e)
+            self.progress_bus.call(self.show_job_result, cancel, 
+                          f"Failed to create partition table: {error_msg}", 
+                          False)
+        finally:
+            job_done.set()
+
+    def assemble_image(self):
+        spec = self.choose_file("Select a layout spec (JSON)")
+        if not spec:
+            return
+        self.assembly_spec = spec
         self.clear_ui()
         tk.Label(
             self.main_frame,
-            text=f"Creating {table_type} partition table on {self.selected_source_disk}...",
+            text=f"Assemble {os.path.basename(spec)} into:",
             bg='#1E1E1E',
             fg='#FFFFFF',
             font=("Segoe UI", 14, "bold")
         ).pack(pady=20)
 
-        self.progress_info = tk.Label(
+        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+
+        tk.Button(
+            button_frame,
+            text="Image File",
+            command=self.assemble_to_file,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat',
+            width=15
+        ).pack(side='left', padx=10)
+
+        tk.Button(
+            button_frame,
+            text="Disk",
+            command=self.assemble_to_disk,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat',
+            width=15
+        ).pack(side='left', padx=10)
+
+        self.add_back_button()
+
+    def assemble_to_file(self):
+        dest_dir = self.choose_directory("Select directory for the assembled image")
+        if not dest_dir:
+            return
+        name = os.path.splitext(os.path.basename(self.assembly_spec))[0] + ".img"
+        self.confirm_assembly(os.path.join(dest_dir, name), None)
+
+    def assemble_to_disk(self):
+        def on_disk_selected(disk_path, disk_info):
+            self.disk_info[disk_path] = disk_info
+            try:
+                # Assembly writes the disk in-process, not through sudo dd
+                require_access(write=[disk_path])
+                disk_size = device_size(disk_path)
+            except PermissionError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to get disk size: {e}")
+                return
+            self.confirm_assembly(disk_path, disk_size)
+
+        self.choose_disk("Select disk to assemble onto:", on_done=on_disk_selected, whole_device=True)
+
+    def confirm_assembly(self, dest, disk_size):
+        try:
+            self.assembly_plan = plan_assembly(self.assembly_spec, disk_size)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Invalid layout spec: {e}")
+            return
+        self.assembly_dest = dest
+        plan = self.assembly_plan
+
+        self.clear_ui()
+        tk.Label(
             self.main_frame,
-            text="Working...",
+            text=f"You are about to write a {plan['table']} layout ({format_size(plan['size'])}) to:\n{dest}",
             bg='#1E1E1E',
             fg='#FFFFFF',
-            font=("Segoe UI", 12)
-        )
-        self.progress_info.pack(pady=10)
+            font=("Segoe UI", 14, "bold")
+        ).pack(pady=20)
 
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure(
-            'custom.Horizontal.TProgressbar',
-            troughcolor='#1E1E1E',
-            background='#a5de37',
-            thickness=10
-        )
+        for p in plan["partitions"]:
+            source = os.path.basename(p["image"]) if p["image"] else "empty"
+            tk.Label(
+                self.main_frame,
+                text=f"#{p['number']} {p['name']}: {format_size(p['size'])} at {format_size(p['start'])} <- {source}",
+                bg='#1E1E1E',
+                fg='#FFFFFF',
+                font=("Segoe UI", 12)
+            ).pack(anchor='w', padx=40)
 
-        self.progress_bar = ttk.Progressbar(
+        self.prepare_job(dest, "assemble", COPY_CHUNK, plan["write_bytes"], reads=False)
+
+        tk.Label(
             self.main_frame,
-            length=500,
-            mode='indeterminate',
-            style='custom.Horizontal.TProgressbar'
-        )
-        self.progress_bar.pack(pady=10, fill='x')
-        self.progress_bar.start()
+            text=f"WARNING: This will destroy all data on {dest}!",
+            bg='#1E1E1E',
+            fg='#FF4D00',
+            font=("Segoe UI", 12, "bold")
+        ).pack(pady=10)
 
-        threading.Thread(target=lambda: self.run_create_partition_table(table_type)).start()
+        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
 
-    def run_create_partition_table(self, table_type):
+        tk.Button(
+            button_frame,
+            text="Cancel",
+            command=self.initialize_ui,
+            font=self.font,
+            bg='#FF4D00',
+            fg='#FFFFFF',
+            relief='flat'
+        ).pack(side='left', padx=10)
+
+        tk.Button(
+            button_frame,
+            text="Assemble",
+            command=self.execute_assembly,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat'
+        ).pack(side='right', padx=10)
+
+    def execute_assembly(self):
+        self.total_size = self.assembly_plan["write_bytes"]
+        self.show_progress_screen(f"Assembling {os.path.basename(self.assembly_spec)}",
+                                  detail=f"Writing to: {self.assembly_dest}",
+                                  info="Creating partition table...",
+                                  cancel_command=self.cancel_operation)
+        self.start_job(self.run_assembly)
+
+    def run_assembly(self, cancel):
+        plan, dest = self.assembly_plan, self.assembly_dest
+        job_done = self.begin_io_job([dest], cancel)
         try:
-            result = subprocess.run(
-                ["sudo", "parted", "-s", self.selected_source_disk, "mklabel", table_type],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            self.root.after(0, self.show_operation_result, 
-                          f"Successfully created {table_type} partition table on {self.selected_source_disk}", 
-                          True)
+            create_assembly_target(plan, dest)
+            # Image files are fresh holes: zero ranges stay sparse instead of being written
+            fresh = not is_block_device(dest)
+            cmd = assembly_table_command(plan, dest)
+            self.run_tool(cmd if fresh else ["sudo"] + cmd)
+            check_assembly_table(plan, dest)
+            write_assembly(plan, dest, fresh,
+                           lambda n: self.report_copied_bytes(n, "Assembling"),
+                           cancel.is_set)
+            if not cancel.is_set():
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Assembled {len(plan['partitions'])} partitions into {dest}",
+                              True)
         except subprocess.CalledProcessError as e:
             error_msg = e.stderr.decode().strip() if e.stderr else str(e)
-            self.root.after(0, self.show_operation_result, 
-                          f"Failed to create partition table: {error_msg}", 
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Failed to create partition table: {error_msg}",
+                          False)
+        except (OSError, ValueError, zlib.error) as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Assembly failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def tree_hash_image(self):
+        path = self.choose_file("Select an image to hash or check")
+        if not path:
+            return
+        self.total_size = os.path.getsize(path)
+        tree = load_merkle(path)
+        self.show_progress_screen(f"{'Checking' if tree else 'Hashing'} {os.path.basename(path)}",
+                                  detail=f"Tree: {merkle_sidecar(path)}",
+                                  info="Starting...",
+                                  cancel_command=self.cancel_operation)
+        self.start_job(self.run_tree_hash, path, tree)
+
+    def run_tree_hash(self, cancel, path, tree):
+        # With a sidecar the image is checked against it, otherwise the sidecar is written
+        job_done = self.begin_io_job([path], cancel)
+        started = time.monotonic()
+        checking = tree is not None
+        bad = []
+        try:
+            progress = lambda n: self.report_copied_bytes(n, "Hashing", track=False)
+            workers = hash_workers(path)
+            if checking:
+                bad = verify_against(path, tree["leaves"], tree["size"], progress,
+                                     cancel.is_set, tree["leaf_size"])
+            else:
+                tree = build_merkle(path, progress, cancel.is_set, workers)
+            if cancel.is_set() or tree is None:
+                return
+            if bad:
+                offsets = ", ".join(str(i * tree["leaf_size"]) for i in bad[:5])
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"{len(bad)} of {len(tree['leaves'])} chunks do not match the tree\n"
+                              f"at offsets {offsets}{' ...' if len(bad) > 5 else ''}",
+                              False)
+            else:
+                rate = self.total_size / max(time.monotonic() - started, 0.001) / (1024 * 1024)
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"{'Image matches its tree' if checking else 'Tree written'}\n"
+                              f"Merkle root: {tree['root'].hex()}\n"
+                              f"{len(tree['leaves'])} leaves on {workers} process(es), {rate:.0f} MB/s",
+                              True)
+        except (OSError, BrokenProcessPool) as e:
+            # A hashing worker that dies (OOM killer, signal) breaks the whole pool
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Hashing failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def show_delta_options(self):
+        self.show_screen("delta", self.build_delta_screen)
+
+    def build_delta_screen(self, frame):
+        tk.Label(
+            frame,
+            text="Image delta: ship and flash only the chunks that changed",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        ).pack(pady=20)
+
+        button_frame = tk.Frame(frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+
+        tk.Button(
+            button_frame,
+            text="Create Delta",
+            command=self.create_image_delta,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat',
+            width=15
+        ).pack(side='left', padx=10)
+
+        tk.Button(
+            button_frame,
+            text="Apply Delta",
+            command=self.apply_image_delta,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat',
+            width=15
+        ).pack(side='left', padx=10)
+
+        self.add_back_button(frame)
+
+    def create_image_delta(self):
+        old = self.choose_file("Select the old image")
+        if not old:
+            return
+        new = self.choose_file("Select the new image")
+        if not new:
+            return
+        dest_dir = self.choose_directory("Select directory for the delta")
+        if not dest_dir:
+            return
+        # Named after the new image, which is what applying it to a file produces
+        dest = os.path.join(dest_dir, os.path.splitext(os.path.basename(new))[0] + DELTA_SUFFIX)
+        self.total_size = device_size(new)
+        self.show_progress_screen(f"Creating delta {os.path.basename(dest)}",
+                                  detail=f"From: {old}\nTo: {new}",
+                                  info="Comparing images...",
+                                  cancel_command=self.cancel_operation)
+        self.start_job(self.run_create_delta, old, new, dest)
+
+    def run_create_delta(self, cancel, old, new, dest):
+        job_done = self.begin_io_job([old, new], cancel)
+        try:
+            result = create_delta(old, new, dest,
+                                  lambda n: self.report_copied_bytes(n, "Comparing"),
+                                  cancel.is_set)
+            if result is not None:
+                share = result["patch_size"] / max(result["new_size"], 1) * 100
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Delta written to:\n{dest}\n{result['changed']} changed chunks, "
+                              f"{format_size(result['patch_size'])} ({share:.1f}% of the new image)"
+                              + (f"\n{format_size(result['skipped'])} skipped using the tree sidecars"
+                                 if result["skipped"] else ""),
+                              True)
+        except OSError as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Delta creation failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def apply_image_delta(self):
+        patch = self.choose_file("Select an image delta")
+        if not patch:
+            return
+        try:
+            with open(patch, "rb") as f:
+                self.delta_header = read_delta_header(f)
+        except (OSError, ValueError, struct.error) as e:
+            messagebox.showerror("Error", f"Cannot read the delta: {e}")
+            return
+        self.delta_path = patch
+
+        self.clear_ui()
+        tk.Label(
+            self.main_frame,
+            text=f"Apply {os.path.basename(patch)} to:",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        ).pack(pady=20)
+
+        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+
+        tk.Button(
+            button_frame,
+            text="Disk",
+            command=self.apply_delta_to_disk,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat',
+            width=15
+        ).pack(side='left', padx=10)
+
+        tk.Button(
+            button_frame,
+            text="Old Image File",
+            command=self.apply_delta_to_file,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat',
+            width=15
+        ).pack(side='left', padx=10)
+
+        self.add_back_button()
+
+    def apply_delta_to_disk(self):
+        def on_disk_selected(disk_path, disk_info):
+            self.disk_info[disk_path] = disk_info
+            self.confirm_apply_delta(disk_path, None)
+
+        self.choose_disk("Select disk holding the old image:", on_done=on_disk_selected,
+                         op_bytes=self.delta_header["new_size"], whole_device=True)
+
+    def apply_delta_to_file(self):
+        old = self.choose_file("Select the old image")
+        if not old:
+            return
+        name = os.path.splitext(os.path.basename(self.delta_path))[0] + ".img"
+        self.confirm_apply_delta(os.path.join(os.path.dirname(old), name), old)
+
+    def confirm_apply_delta(self, target, old):
+        header = self.delta_header
+        self.clear_ui()
+        tk.Label(
+            self.main_frame,
+            text=f"You are about to patch:\n{old or target}" + (f"\ninto:\n{target}" if old else ""),
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        ).pack(pady=20)
+
+        tk.Label(
+            self.main_frame,
+            text=f"{header['changed']} changed chunks of {format_size(header['chunk_size'])}, "
+                 f"new image {format_size(header['new_size'])}\n"
+                 "Every touched block is hash-checked before anything is written.",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 12)
+        ).pack(pady=10)
+
+        if not old:
+            tk.Label(
+                self.main_frame,
+                text="WARNING: The disk must hold the old image; changed blocks will be overwritten!",
+                bg='#1E1E1E',
+                fg='#FF4D00',
+                font=("Segoe UI", 12, "bold")
+            ).pack(pady=10)
+
+        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+
+        tk.Button(
+            button_frame,
+            text="Cancel",
+            command=self.initialize_ui,
+            font=self.font,
+            bg='#FF4D00',
+            fg='#FFFFFF',
+            relief='flat'
+        ).pack(side='left', padx=10)
+
+        tk.Button(
+            button_frame,
+            text="Apply",
+            command=lambda: self.execute_apply_delta(target, old),
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat'
+        ).pack(side='right', padx=10)
+
+    def execute_apply_delta(self, target, old):
+        self.show_progress_screen(f"Applying {os.path.basename(self.delta_path)}",
+                                  detail=f"Target: {target}",
+                                  info="Checking touched blocks...",
+                                  cancel_command=self.cancel_operation)
+        self.start_job(self.run_apply_delta, target, old)
+
+    def run_apply_delta(self, cancel, target, old):
+        job_done = self.begin_io_job([target], cancel)
+        try:
+            if old:
+                self.total_size = device_size(old)
+                progress = lambda n: self.report_copied_bytes(n, "Copying old image", track=False)
+                server_side_copy(old, target, progress) or stream_copy(old, target, progress, cancel.is_set)
+                if cancel.is_set():
+                    return
+            header = self.delta_header
+            self.total_size = header["changed"] * header["chunk_size"]
+            result = apply_delta(self.delta_path, target,
+                                 lambda n: self.report_copied_bytes(n, "Patching"),
+                                 cancel.is_set)
+            if result is not None:
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Patched {target}: {format_size(result['written'])} written"
+                              + (f", {result['applied']} chunks were already up to date" if result["applied"] else ""),
+                              True)
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Patching failed: {e}",
                           False)
+        finally:
+            job_done.set()
+
+    def run_tool(self, cmd, input=None):
+        # Popen rather than run so the kernel-counter sampler can find the process tree
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        try:
+            _, stderr = self.process.communicate(input=input.encode() if input is not None else None)
+            if self.process.returncode != 0:
+                raise subprocess.CalledProcessError(self.process.returncode, self.process.args, stderr=stderr)
+        finally:
+            self.process = None
 
     def format_disk(self):
         def on_disk_selected(disk_path, disk_info):
@@ -588,14 +1749,18 @@ class DDUtilityApp:
         self.choose_disk("Select disk/partition to format:", on_done=on_disk_selected)
 
     def show_filesystem_options(self):
-        self.clear_ui()
-        tk.Label(
-            self.main_frame,
-            text=f"Select filesystem for {self.selected_source_disk}",
+        self.show_screen("filesystem", self.build_filesystem_screen)
+        self.filesystem_title.config(text=f"Select filesystem for {self.selected_source_disk}")
+
+    def build_filesystem_screen(self, frame):
+        self.filesystem_title = tk.Label(
+            frame,
+            text="",
             bg='#1E1E1E',
             fg='#FFFFFF',
             font=("Segoe UI", 14, "bold")
-        ).pack(pady=20)
+        )
+        self.filesystem_title.pack(pady=20)
 
         filesystems = [
             ("FAT16", "fat16"), ("FAT32", "fat32"), ("exFAT", "exfat"),
@@ -603,7 +1768,7 @@ class DDUtilityApp:
             ("EXT3", "ext3"), ("EXT4", "ext4"), ("LUKS", "luks")
         ]
 
-        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame = tk.Frame(frame, bg='#1E1E1E')
         button_frame.pack(pady=10)
 
         for i, (label, fs_type) in enumerate(filesystems):
@@ -620,9 +1785,20 @@ class DDUtilityApp:
                 width=10
             ).grid(row=row, column=col, padx=5, pady=5)
 
-        self.add_back_button()
+        self.add_back_button(frame)
 
     def confirm_format_disk(self, fs_type):
+        if fs_type == "luks" and self.luks_bench is None:
+            self.show_progress_screen("Benchmarking ciphers on this host...", info="Working...",
+                                      mode='indeterminate')
+
+            def run_benchmark():
+                self.luks_bench = luks_benchmark() or {}
+                self.progress_bus.call(self.confirm_format_disk, fs_type)
+
+            threading.Thread(target=run_benchmark, daemon=True).start()
+            return
+
         self.clear_ui()
         tk.Label(
             self.main_frame,
@@ -641,6 +1817,41 @@ class DDUtilityApp:
         )
         warning_label.pack(pady=10)
 
+        if fs_type == "luks":
+            self.build_luks_settings()
+        else:
+            _, layout = mkfs_tuning(fs_type, device_topology(self.selected_source_disk))
+            if layout:
+                tk.Label(
+                    self.main_frame,
+                    text=f"Layout: {layout}",
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+            if fs_type.startswith("ext"):
+                tk.Checkbutton(
+                    self.main_frame,
+                    text="Lazy inode table/journal init (faster format)",
+                    variable=self.format_lazy_var,
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    selectcolor='#2C3E50',
+                    activebackground='#1E1E1E',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+            if fs_type.startswith("ext") or fs_type == "btrfs":
+                tk.Checkbutton(
+                    self.main_frame,
+                    text="Skip discard while formatting (faster format)",
+                    variable=self.format_nodiscard_var,
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    selectcolor='#2C3E50',
+                    activebackground='#1E1E1E',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+
         button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
         button_frame.pack(pady=10)
 
@@ -657,92 +1868,106 @@ class DDUtilityApp:
         tk.Button(
             button_frame,
             text="Format",
-            command=lambda: self.format_with_filesystem(fs_type),
+            command=self.start_luks_format if fs_type == "luks" else lambda: self.format_with_filesystem(fs_type),
             font=self.font,
             bg='#a5de37',
             fg='#000000',
             relief='flat'
-        ).pack(side='right', padx=10)
-
-    def format_with_filesystem(self, fs_type):
-        self.clear_ui()
-        tk.Label(
-            self.main_frame,
-            text=f"Formatting {self.selected_source_disk} as {fs_type}...",
-            bg='#1E1E1E',
-            fg='#FFFFFF',
-            font=("Segoe UI", 14, "bold")
-        ).pack(pady=20)
-
-        self.progress_info = tk.Label(
-            self.main_frame,
-            text="Working...",
-            bg='#1E1E1E',
-            fg='#FFFFFF',
-            font=("Segoe UI", 12)
-        )
-        self.progress_info.pack(pady=10)
+        ).pack(side='right', padx=10)
 
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure(
-            'custom.Horizontal.TProgressbar',
-            troughcolor='#1E1E1E',
-            background='#a5de37',
-            thickness=10
-        )
+    def build_luks_settings(self):
+        settings_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        settings_frame.pack(pady=10)
+
+        choices = luks_cipher_choices(self.luks_bench) if self.luks_bench else []
+        self.luks_cipher_rows = {f"{cipher} {bits}-bit ({speed:.0f} MiB/s)": (cipher, bits)
+                                 for cipher, bits, speed in choices}
+        labels = list(self.luks_cipher_rows) or ["cryptsetup default"]
+        self.luks_cipher = tk.StringVar(value=labels[0])  # fastest first
+        self.luks_unlock_ms = tk.IntVar(value=LUKS_UNLOCK_MS)
+        self.luks_passphrase = tk.StringVar()
+        self.luks_passphrase_confirm = tk.StringVar()
+
+        tk.Label(settings_frame, text="Cipher:", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).grid(row=0, column=0, sticky='w', pady=5)
+        tk.OptionMenu(settings_frame, self.luks_cipher, *labels).grid(row=0, column=1, sticky='w')
+
+        tk.Label(settings_frame, text="Target unlock time (ms):", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).grid(row=1, column=0, sticky='w', pady=5)
+        tk.Spinbox(settings_frame, from_=100, to=10000, increment=100, textvariable=self.luks_unlock_ms,
+                   width=8).grid(row=1, column=1, sticky='w')
+
+        tk.Label(settings_frame, text="Passphrase:", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).grid(row=2, column=0, sticky='w', pady=5)
+        tk.Entry(settings_frame, textvariable=self.luks_passphrase, show='*').grid(row=2, column=1, sticky='w')
+
+        tk.Label(settings_frame, text="Confirm passphrase:", bg='#1E1E1E', fg='#FFFFFF',
+                 font=("Segoe UI", 12)).grid(row=3, column=0, sticky='w', pady=5)
+        tk.Entry(settings_frame, textvariable=self.luks_passphrase_confirm, show='*').grid(row=3, column=1, sticky='w')
+
+    def start_luks_format(self):
+        passphrase = self.luks_passphrase.get()
+        if not passphrase:
+            messagebox.showerror("Error", "Enter a passphrase")
+            return
+        if passphrase != self.luks_passphrase_confirm.get():
+            messagebox.showerror("Error", "Passphrases do not match")
+            return
+        try:
+            unlock_ms = max(100, int(self.luks_unlock_ms.get()))
+        except (tk.TclError, ValueError):
+            unlock_ms = LUKS_UNLOCK_MS
+        cipher, key_bits = self.luks_cipher_rows.get(self.luks_cipher.get(), (None, None))
+        self.luks_options = {
+            "cipher": cipher,
+            "key_bits": key_bits,
+            "pbkdf": tune_pbkdf(self.luks_bench, unlock_ms),
+            "passphrase": passphrase,
+        }
+        self.format_with_filesystem("luks")
 
-        self.progress_bar = ttk.Progressbar(
-            self.main_frame,
-            length=500,
-            mode='indeterminate',
-            style='custom.Horizontal.TProgressbar'
-        )
-        self.progress_bar.pack(pady=10, fill='x')
-        self.progress_bar.start()
+    def format_with_filesystem(self, fs_type):
+        self.format_choices = (self.format_lazy_var.get(), self.format_nodiscard_var.get())
+        self.show_progress_screen(f"Formatting {self.selected_source_disk} as {fs_type}...",
+                                  info="Working...", mode='indeterminate')
 
-        threading.Thread(target=lambda: self.run_format_disk(fs_type)).start()
+        self.start_job(self.run_format_disk, fs_type)
 
-    def run_format_disk(self, fs_type):
+    def run_format_disk(self, cancel, fs_type):
+        job_done = self.begin_io_job([self.selected_source_disk], cancel)
         try:
             if fs_type == "luks":
-                process = subprocess.Popen(
-                    ["sudo", "cryptsetup", "luksFormat", self.selected_source_disk],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                process.communicate(input="YES\n")
-                if process.returncode != 0:
-                    raise subprocess.CalledProcessError(process.returncode, process.args)
+                options, self.luks_options = self.luks_options, None
+                self.run_tool(["sudo", *luks_format_command(self.selected_source_disk, options["cipher"],
+                                                            options["key_bits"], options["pbkdf"])],
+                              input=options["passphrase"])
+                if options["cipher"]:
+                    fs_type = f"luks ({options['cipher']}, {options['key_bits']}-bit)"
             else:
+                tuning, _ = mkfs_tuning(fs_type, device_topology(self.selected_source_disk), *self.format_choices)
                 if fs_type.startswith("fat"):
-                    cmd = ["sudo", "mkfs.vfat", "-F", fs_type[3:], self.selected_source_disk]
+                    cmd = ["sudo", "mkfs.vfat", "-F", fs_type[3:], *tuning, self.selected_source_disk]
                 elif fs_type == "exfat":
-                    cmd = ["sudo", "mkfs.exfat", self.selected_source_disk]
+                    cmd = ["sudo", "mkfs.exfat", *tuning, self.selected_source_disk]
                 elif fs_type == "ntfs":
                     cmd = ["sudo", "mkfs.ntfs", "-Q", self.selected_source_disk]
                 elif fs_type.startswith("ext"):
-                    cmd = ["sudo", f"mkfs.{fs_type}", self.selected_source_disk]
+                    cmd = ["sudo", f"mkfs.{fs_type}", *tuning, self.selected_source_disk]
                 elif fs_type == "btrfs":
-                    cmd = ["sudo", "mkfs.btrfs", "-f", self.selected_source_disk]
-                
-                result = subprocess.run(
-                    cmd,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-
-            self.root.after(0, self.show_operation_result, 
+                    cmd = ["sudo", "mkfs.btrfs", "-f", *tuning, self.selected_source_disk]
+
+                self.run_tool(cmd)
+
+            self.progress_bus.call(self.show_job_result, cancel, 
                           f"Successfully formatted {self.selected_source_disk} as {fs_type}", 
                           True)
         except subprocess.CalledProcessError as e:
             error_msg = e.stderr.decode().strip() if e.stderr else str(e)
-            self.root.after(0, self.show_operation_result, 
+            self.progress_bus.call(self.show_job_result, cancel, 
                           f"Failed to format disk: {error_msg}", 
                           False)
+        finally:
+            job_done.set()
 
     def secure_erase(self):
         def on_disk_selected(disk_path, disk_info):
@@ -750,19 +1975,23 @@ class DDUtilityApp:
             self.disk_info[disk_path] = disk_info
             self.show_erase_options()
 
-        self.choose_disk("Select disk to securely erase:", on_done=on_disk_selected)
+        self.choose_disk("Select disk to securely erase:", on_done=on_disk_selected, whole_device=True)
 
     def show_erase_options(self):
-        self.clear_ui()
-        tk.Label(
-            self.main_frame,
-            text=f"Select erase method for {self.selected_source_disk}",
+        self.show_screen("erase", self.build_erase_screen)
+        self.erase_title.config(text=f"Select erase method for {self.selected_source_disk}")
+
+    def build_erase_screen(self, frame):
+        self.erase_title = tk.Label(
+            frame,
+            text="",
             bg='#1E1E1E',
             fg='#FFFFFF',
             font=("Segoe UI", 14, "bold")
-        ).pack(pady=20)
+        )
+        self.erase_title.pack(pady=20)
 
-        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame = tk.Frame(frame, bg='#1E1E1E')
         button_frame.pack(pady=10)
 
         tk.Button(
@@ -795,7 +2024,7 @@ class DDUtilityApp:
             relief='flat'
         ).pack(pady=5)
 
-        self.add_back_button()
+        self.add_back_button(frame)
 
     def confirm_secure_erase(self, source, passes):
         self.clear_ui()
@@ -807,6 +2036,12 @@ class DDUtilityApp:
             font=("Segoe UI", 14, "bold")
         ).pack(pady=20)
 
+        self.prepare_job(self.selected_source_disk, "erase", 1024 * 1024,
+                         sysfs_size(self.selected_source_disk) * passes, reads=False)
+
+        self.sample_var.set(False)
+        self.build_sample_options(self.main_frame, "Verify by sampling afterwards")
+
         warning_label = tk.Label(
             self.main_frame,
             text="WARNING: This will destroy all data on this disk!",
@@ -840,60 +2075,16 @@ class DDUtilityApp:
         ).pack(side='right', padx=10)
 
     def execute_secure_erase(self, source, passes):
-        self.clear_ui()
-        tk.Label(
-            self.main_frame,
-            text=f"Erasing {self.selected_source_disk} with {passes} passes of {source}",
-            bg='#1E1E1E',
-            fg='#FFFFFF',
-            font=("Segoe UI", 14, "bold")
-        ).pack(pady=20)
-
-        self.progress_info = tk.Label(
-            self.main_frame,
-            text="Starting secure erase...",
-            bg='#1E1E1E',
-            fg='#FFFFFF',
-            font=("Segoe UI", 12)
-        )
-        self.progress_info.pack(pady=10)
-
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure(
-            'custom.Horizontal.TProgressbar',
-            troughcolor='#1E1E1E',
-            background='#a5de37',
-            thickness=10
-        )
-
-        self.progress_bar = ttk.Progressbar(
-            self.main_frame,
-            length=500,
-            mode='determinate',
-            style='custom.Horizontal.TProgressbar'
-        )
-        self.progress_bar.pack(pady=10, fill='x')
-
-        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
-        button_frame.pack(pady=10)
-
-        self.cancel_button = tk.Button(
-            button_frame,
-            text="Cancel",
-            command=self.cancel_operation,
-            font=self.font,
-            bg='#FF4D00',
-            fg='#FFFFFF',
-            relief='flat'
-        )
-        self.cancel_button.pack()
+        self.read_sample_options()
+        # Sampling and its seeded last pass work on the disk in-process
+        if self.sample_requested and not self.confirm_direct_access(write=[self.selected_source_disk]):
+            return
+        self.show_progress_screen(f"Erasing {self.selected_source_disk} with {passes} passes of {source}",
+                                  info="Starting secure erase...", cancel_command=self.cancel_operation)
 
         # Get disk size for progress calculation
         try:
-            self.total_size = int(subprocess.check_output(
-                ["sudo", "blockdev", "--getsize64", self.selected_source_disk]
-            ).strip())
+            self.total_size = blockdev_size(self.selected_source_disk)
         except subprocess.CalledProcessError as e:
             self.root.after(0, messagebox.showerror, 
                           "Error", 
@@ -901,61 +2092,69 @@ class DDUtilityApp:
             self.initialize_ui()
             return
 
-        threading.Thread(target=lambda: self.run_erase(source, passes)).start()
+        self.start_job(self.run_erase, source, passes)
 
-    def run_erase(self, source, passes):
+    def run_erase(self, cancel, source, passes):
+        job_done = self.begin_io_job([self.selected_source_disk], cancel)
+        disk = self.selected_source_disk
         try:
+            # Old table areas (including EBRs) are always part of the sample
+            regions = ()
+            if self.sample_requested:
+                with open(disk, "rb") as f:
+                    table = read_partition_table(f)
+                if table and table["partitions"]:
+                    regions = table_regions(table, self.total_size)
+            # Random data cannot be checked afterwards, so a sampled random erase ends with a seeded pattern
+            seed = int.from_bytes(os.urandom(8), "little") if self.sample_requested and source != "/dev/zero" else None
             for i in range(passes):
-                if self.cancelled:
+                if cancel.is_set():
                     break
                     
-                self.root.after(0, self.progress_info.config, 
+                self.progress_bus.post(self.progress_info, 
                               {'text': f"Pass {i+1} of {passes} with {source}"})
-                
-                process = subprocess.Popen(
-                    ["sudo", "dd", f"if={source}", f"of={self.selected_source_disk}", "bs=1M", "status=progress"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                self.process = process
-                
-                while True:
-                    if self.cancelled:
-                        process.terminate()
-                        break
-                        
-                    line = process.stderr.readline()
-                    if not line:
-                        break
-                    
-                    # Update progress
-                    match = re.search(r'(\d+) bytes', line)
-                    if match:
-                        copied_bytes = int(match.group(1))
-                        progress = (i * 100 + (copied_bytes / self.total_size * 100)) / passes
-                        self.root.after(0, self.progress_bar.config, {'value': progress})
-                        self.root.after(0, self.progress_info.config, 
-                                      {'text': f"Pass {i+1} of {passes}: {line.strip()}"})
-                
-                process.wait()
-                if process.returncode != 0 and not self.cancelled:
-                    raise subprocess.CalledProcessError(process.returncode, process.args)
-
-            if self.cancelled:
-                self.root.after(0, self.show_operation_result, 
-                              "Secure erase cancelled", 
-                              False)
+
+                seeded = seed is not None and i == passes - 1
+                def pass_progress(copied_bytes, i=i, what="seeded pattern, " if seeded else ""):
+                    self.progress_bus.post(self.progress_bar,
+                                           {'value': (i * 100 + copied_bytes / self.total_size * 100) / passes})
+                    self.progress_bus.post(self.progress_info,
+                                  {'text': f"Pass {i+1} of {passes}: {what}{copied_bytes // (1024 * 1024)} MB"
+                                           f"{self.track_progress(i * self.total_size + copied_bytes)}"})
+                if seeded:
+                    write_stream(pattern_stream(seed, self.total_size, cancel.is_set), disk, pass_progress)
+                    break
+                run_dd(dd_command(source, disk, block_size="1M"), pass_progress, cancel.is_set,
+                       started=self.attach_process)
+
+            if cancel.is_set():
+                return
+            if self.sample_requested:
+                self.progress_bus.post(self.progress_title, {'text': f"Sampling {disk}"})
+                check = expect_pattern(seed) if seed is not None else expect_zeros()
+                result = self.run_sample_verify(cancel, disk, self.total_size, SAMPLE_CHUNK, check, regions)
+                if not cancel.is_set():
+                    pattern = f"\nLast pass: seeded pattern {seed:016x}" if seed is not None else ""
+                    self.progress_bus.call(self.show_job_result, cancel,
+                                  f"Secure erase {'verification failed' if result['bad'] else 'completed'} "
+                                  f"with {passes} passes\n{describe_sample(result, SAMPLE_CHUNK)}{pattern}",
+                                  not result["bad"])
             else:
-                self.root.after(0, self.show_operation_result, 
+                self.progress_bus.call(self.show_job_result, cancel, 
                               f"Secure erase completed successfully with {passes} passes", 
                               True)
             
         except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode().strip() if e.stderr else str(e)
-            self.root.after(0, self.show_operation_result, 
+            error_msg = e.stderr or str(e)
+            self.progress_bus.call(self.show_job_result, cancel, 
                           f"Secure erase failed: {error_msg}", 
                           False)
+        except OSError as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Secure erase failed: {e}",
+                          False)
+        finally:
+            job_done.set()
 
     def create_disk_image(self):
         def on_disk_selected(disk_path, disk_info):
@@ -963,7 +2162,7 @@ class DDUtilityApp:
             self.disk_info[disk_path] = disk_info
             self.choose_image_destination()
 
-        self.choose_disk("Select disk to create image from:", on_done=on_disk_selected)
+        self.choose_disk("Select disk to create image from:", on_done=on_disk_selected, whole_device=True)
 
     def choose_image_destination(self):
         # Generate default filename
@@ -1029,6 +2228,67 @@ class DDUtilityApp:
             justify=tk.LEFT
         ).pack(anchor='w')
 
+        format_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        format_frame.pack(pady=10)
+        tk.Label(
+            format_frame,
+            text="Image format:",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 12)
+        ).pack(side='left', padx=5)
+        self.image_format = tk.StringVar(value="raw")
+        tk.OptionMenu(format_frame, self.image_format, *IMAGE_FORMATS).pack(side='left')
+
+        self.prepare_job(self.selected_source_disk, "image", COPY_CHUNK, sysfs_size(self.selected_source_disk))
+
+        report = self.show_layout_summary(self.main_frame, self.selected_source_disk)
+        self.trim_var.set(False)
+        if report:
+            table = report["table_info"]
+            trimmed = trimmed_size(table) if table and table["partitions"] else report["size"]
+            tk.Label(
+                self.main_frame,
+                text=f"Estimated image size: raw {format_size(report['size'])}, "
+                     f"qcow2 from {format_size(report['used'])}",
+                bg='#1E1E1E',
+                fg='#FFFFFF',
+                font=("Segoe UI", 12)
+            ).pack(pady=5)
+            if trimmed < report["size"]:
+                tk.Checkbutton(
+                    self.main_frame,
+                    text=f"Image only up to the end of the last partition ({format_size(trimmed)})",
+                    variable=self.trim_var,
+                    bg='#1E1E1E',
+                    fg='#FFFFFF',
+                    selectcolor='#2C3E50',
+                    activebackground='#1E1E1E',
+                    font=("Segoe UI", 12)
+                ).pack(pady=5)
+                if trimmed <= report["size"] * 0.9:
+                    self.trim_var.set(True)
+                    self.show_suggestion(f"Suggested: stop at the last partition, only "
+                                         f"{format_size(trimmed)} is read", trimmed / report["size"])
+            if report["used"] < trimmed / 2:
+                # Reading takes as long either way; qcow2 skips writing the unallocated part
+                self.image_format.set("qcow2")
+                self.show_suggestion(f"Suggested: qcow2, only {format_size(report['used'])} is allocated")
+
+        partitioned = bool(report and report["table"] and report["table_info"]["partitions"])
+        if partitioned:
+            encoding_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+            encoding_frame.pack(pady=5)
+            tk.Label(
+                encoding_frame,
+                text="Per-partition encoding:",
+                bg='#1E1E1E',
+                fg='#FFFFFF',
+                font=("Segoe UI", 12)
+            ).pack(side='left', padx=5)
+            self.partition_encoding = tk.StringVar(value="used blocks")
+            tk.OptionMenu(encoding_frame, self.partition_encoding, *PARTITION_ENCODINGS).pack(side='left')
+
         button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
         button_frame.pack(pady=20)
 
@@ -1052,146 +2312,410 @@ class DDUtilityApp:
             relief='flat'
         ).pack(side='right', padx=10)
 
-    def execute_create_image(self):
+        tk.Button(
+            button_frame,
+            text="Add to Image Store",
+            command=lambda: self.execute_create_image(store=True),
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat'
+        ).pack(side='right', padx=10)
+
+        if partitioned:
+            tk.Button(
+                button_frame,
+                text="Image Partitions",
+                command=self.execute_partition_image,
+                font=self.font,
+                bg='#a5de37',
+                fg='#000000',
+                relief='flat'
+            ).pack(side='right', padx=10)
+
+    def execute_partition_image(self):
+        parent = self.choose_directory("Select directory for the partition images")
+        if not parent:
+            return
+        directory = os.path.join(parent, os.path.splitext(os.path.basename(self.image_path))[0])
+        encoding = self.partition_encoding.get()
+        self.show_progress_screen(f"Imaging partitions of {self.selected_source_disk}",
+                                  detail=f"Saving to: {directory}",
+                                  info="Reading allocation maps...",
+                                  cancel_command=self.cancel_operation)
+        self.start_job(self.run_partition_image, directory, encoding)
+
+    def run_partition_image(self, cancel, directory, encoding):
+        job_done = self.begin_io_job([self.selected_source_disk], cancel)
         try:
-            self.clear_ui()
-            tk.Label(
-                self.main_frame,
-                text=f"Creating disk image from {self.selected_source_disk}",
-                bg='#1E1E1E',
-                fg='#FFFFFF',
-                font=("Segoe UI", 14, "bold")
-            ).pack(pady=20)
+            plan = plan_partition_image(self.selected_source_disk, encoding)
+            self.total_size = plan["read_bytes"]
+            if self.eta:
+                self.eta.total_bytes = self.total_size
+            layout = image_partitions(plan, directory,
+                                      lambda n: self.report_copied_bytes(n, "Imaging partitions"),
+                                      cancel.is_set)
+            if not cancel.is_set():
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Partition images written to:\n{directory}\n"
+                              f"{len(layout['partitions'])} partitions, {format_size(plan['read_bytes'])} read",
+                              True)
+        except (OSError, ValueError, zlib.error) as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Partition imaging failed: {e}",
+                          False)
+        finally:
+            job_done.set()
 
-            tk.Label(
-                self.main_frame,
-                text=f"Saving to: {self.image_path}",
-                bg='#1E1E1E',
-                fg='#FFFFFF',
-                font=("Segoe UI", 12)
-            ).pack(pady=10)
+    def restore_partition_set(self):
+        directory = self.choose_directory("Select a partition image directory")
+        if not directory:
+            return
+        try:
+            self.partition_set = load_partition_set(directory)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Not a partition image directory: {e}")
+            return
+        self.partition_set_dir = directory
+
+        def on_disk_selected(disk_path, disk_info):
+            self.selected_destination_disk = disk_path
+            self.disk_info[disk_path] = disk_info
+            self.show_restore_options()
+
+        self.choose_disk("Select disk to restore to:", on_done=on_disk_selected,
+                         op_bytes=sum(p["size"] for p in self.partition_set["partitions"]), whole_device=True)
+
+    def show_restore_options(self):
+        self.clear_ui()
+        tk.Label(
+            self.main_frame,
+            text=f"Restore partitions from:\n{self.partition_set_dir}\nto:\n{self.selected_destination_disk}",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 14, "bold")
+        ).pack(pady=20)
 
-            self.progress_info = tk.Label(
+        self.restore_vars = {}
+        for p in self.partition_set["partitions"]:
+            var = tk.BooleanVar(value=True)
+            self.restore_vars[p["number"]] = var
+            tk.Checkbutton(
                 self.main_frame,
-                text="Starting disk imaging...",
+                text=f"#{p['number']} {p.get('fs') or 'unknown'}, {format_size(p['size'])} ({p['encoding']})",
+                variable=var,
                 bg='#1E1E1E',
                 fg='#FFFFFF',
+                selectcolor='#2C3E50',
+                activebackground='#1E1E1E',
                 font=("Segoe UI", 12)
-            )
-            self.progress_info.pack(pady=10)
-
-            style = ttk.Style()
-            style.theme_use('clam')
-            style.configure(
-                'custom.Horizontal.TProgressbar',
-                troughcolor='#1E1E1E',
-                background='#a5de37',
-                thickness=10
-            )
+            ).pack(anchor='w', padx=40)
 
-            self.progress_bar = ttk.Progressbar(
-                self.main_frame,
-                length=500,
-                mode='determinate',
-                style='custom.Horizontal.TProgressbar'
-            )
-            self.progress_bar.pack(pady=10, fill='x')
+        tk.Label(
+            self.main_frame,
+            text="All partitions: the partition table is written too.\n"
+                 "A subset: only those partitions are written, into matching partitions on the disk.",
+            bg='#1E1E1E',
+            fg='#FFFFFF',
+            font=("Segoe UI", 11),
+            justify=tk.LEFT
+        ).pack(pady=10)
 
-            button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
-            button_frame.pack(pady=10)
+        self.prepare_job(self.selected_destination_disk, "restore", COPY_CHUNK,
+                         sum(p["size"] for p in self.partition_set["partitions"]), reads=False)
 
-            self.cancel_button = tk.Button(
-                button_frame,
-                text="Cancel",
-                command=self.cancel_operation,
-                font=self.font,
-                bg='#FF4D00',
-                fg='#FFFFFF',
-                relief='flat'
-            )
-            self.cancel_button.pack()
+        tk.Label(
+            self.main_frame,
+            text="WARNING: This will overwrite the selected partitions on the destination disk!",
+            bg='#1E1E1E',
+            fg='#FF4D00',
+            font=("Segoe UI", 12, "bold")
+        ).pack(pady=10)
 
-            # Get disk size for progress calculation
-            self.total_size = int(subprocess.check_output(
-                ["sudo", "blockdev", "--getsize64", self.selected_source_disk]
-            ).strip())
+        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame.pack(pady=10)
+
+        tk.Button(
+            button_frame,
+            text="Cancel",
+            command=self.initialize_ui,
+            font=self.font,
+            bg='#FF4D00',
+            fg='#FFFFFF',
+            relief='flat'
+        ).pack(side='left', padx=10)
+
+        tk.Button(
+            button_frame,
+            text="Restore",
+            command=self.execute_restore_partitions,
+            font=self.font,
+            bg='#a5de37',
+            fg='#000000',
+            relief='flat'
+        ).pack(side='right', padx=10)
+
+    def execute_restore_partitions(self):
+        numbers = [number for number, var in self.restore_vars.items() if var.get()]
+        if not numbers:
+            messagebox.showerror("Error", "Select at least one partition")
+            return
+        self.total_size = sum(p["size"] for p in self.partition_set["partitions"] if p["number"] in numbers)
+        if self.eta:
+            self.eta.total_bytes = self.total_size
+        if len(numbers) == len(self.restore_vars):
+            numbers = None
+        self.show_progress_screen(f"Restoring partitions to {self.selected_destination_disk}",
+                                  detail=f"From: {self.partition_set_dir}",
+                                  info="Starting restore...",
+                                  cancel_command=self.cancel_operation)
+        self.start_job(self.run_restore_partitions, numbers)
+
+    def run_restore_partitions(self, cancel, numbers):
+        job_done = self.begin_io_job([self.selected_destination_disk], cancel)
+        try:
+            restored = restore_partitions(self.partition_set_dir, self.selected_destination_disk, numbers,
+                                          lambda n: self.report_copied_bytes(n, "Restoring"),
+                                          cancel.is_set)
+            if not cancel.is_set():
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Restored {len(restored)} partition(s) to {self.selected_destination_disk}",
+                              True)
+        except (OSError, ValueError, zlib.error) as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Restore failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def execute_create_image(self, store=False):
+        image_format = self.image_format.get()
+        try:
+            if not store:
+                base = os.path.splitext(self.image_path)[0]
+                self.image_path = base + IMAGE_FORMATS[image_format]
+            self.show_progress_screen(f"Creating disk image from {self.selected_source_disk}",
+                                      detail=f"Saving to: {self.image_path}",
+                                      info="Starting disk imaging...",
+                                      cancel_command=self.cancel_operation, rate_control=True)
 
-            threading.Thread(target=self.run_create_image).start()
+            # Get disk size for progress calculation
+            self.total_size = blockdev_size(self.selected_source_disk)
+            if store or self.trim_var.get() or image_format != "raw":
+                # These read the disk in-process rather than through sudo dd
+                require_access(read=[self.selected_source_disk])
+
+            self.image_table = None
+            if not store and self.trim_var.get():
+                with open(self.selected_source_disk, "rb") as f:
+                    self.image_table = read_partition_table(f)
+                if self.image_table and self.image_table["partitions"]:
+                    self.total_size = min(trimmed_size(self.image_table), self.total_size)
+                    if self.eta:
+                        self.eta.total_bytes = self.total_size
+                else:
+                    self.image_table = None
+
+            if store:
+                self.start_job(self.run_store_image)
+            elif image_format != "raw" or self.image_table:
+                self.start_job(self.run_engine_create_image, image_format)
+            else:
+                self.start_job(self.run_create_image)
 
         except subprocess.CalledProcessError as e:
             self.root.after(0, messagebox.showerror, 
                           "Error", 
                           f"Failed to get disk size: {e}")
             self.initialize_ui()
+        except PermissionError as e:
+            self.root.after(0, messagebox.showerror, "Error", str(e))
+            self.initialize_ui()
         except Exception as e:
             self.root.after(0, messagebox.showerror, 
                           "Error", 
                           f"Failed to start disk imaging: {e}")
             self.initialize_ui()
 
-    def run_create_image(self):
+    def report_copied_bytes(self, copied_bytes, prefix, track=True):
+        if self.total_size > 0:
+            progress_percentage, text = copy_status(copied_bytes, self.total_size, prefix)
+            self.progress_bus.post(self.progress_bar, {'value': progress_percentage})
+            self.progress_bus.post(self.progress_info,
+                          {'text': f"{text}{self.track_progress(copied_bytes) if track else ''}"})
+
+    def run_create_image(self, cancel):
+        governor = self.io_governor
+        job_done = None
         try:
-            process = subprocess.Popen(
-                ["sudo", "dd", f"if={self.selected_source_disk}", f"of={self.image_path}", "bs=4M", "status=progress"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            self.process = process
-            
-            while True:
-                if self.cancelled:
-                    process.terminate()
-                    # Remove partially created image
-                    if os.path.exists(self.image_path):
-                        os.remove(self.image_path)
-                    break
-                    
-                line = process.stderr.readline()
-                if not line:
-                    break
-                
-                # Update progress
-                match = re.search(r'(\d+) bytes', line)
-                if match:
-                    copied_bytes = int(match.group(1))
-                    progress_percentage = min((copied_bytes / self.total_size) * 100, 100)
-                    self.root.after(0, self.progress_bar.config, {'value': progress_percentage})
-                    self.root.after(0, self.progress_info.config, 
-                                  {'text': f"Creating image: {line.strip()}"})
-            
-            process.wait()
-            if self.cancelled:
-                self.root.after(0, self.show_operation_result, 
-                              "Disk imaging cancelled", 
-                              False)
-            elif process.returncode == 0:
-                self.root.after(0, self.show_operation_result, 
-                              f"Disk image created successfully at:\n{self.image_path}", 
+            # Loop devices backed by a file on a CoW filesystem can be cloned instantly
+            method = server_side_copy(self.selected_source_disk, self.image_path,
+                                      lambda n: self.report_copied_bytes(n, "Creating image"))
+            if method:
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Disk image created successfully ({method}) at:\n{self.image_path}",
                               True)
+                return
+
+            note = ""
+            if not governor.attach_cgroup([self.selected_source_disk]):
+                if self.can_open_directly([self.selected_source_disk]):
+                    self.run_engine_create_image(cancel, "raw")
+                    return
+                uncapped = self.rate_control_unavailable()
+                note = f"\n{uncapped}" if uncapped else ""
+
+            job_done = self.begin_io_job([self.selected_source_disk], cancel)
+            run_dd(dd_command(self.selected_source_disk, self.image_path, wrap=governor.wrap_command),
+                   lambda n: self.report_copied_bytes(n, "Creating image"), cancel.is_set,
+                   started=self.attach_process)
+            if cancel.is_set():
+                # Remove partially created image
+                if os.path.exists(self.image_path):
+                    os.remove(self.image_path)
             else:
-                raise subprocess.CalledProcessError(process.returncode, process.args)
+                self.progress_bus.call(self.show_job_result, cancel, 
+                              f"Disk image created successfully at:\n{self.image_path}{note}", 
+                              True)
             
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode().strip() if e.stderr else str(e)
+        except (subprocess.CalledProcessError, OSError) as e:
+            error_msg = getattr(e, 'stderr', None) or str(e)
             # Remove failed image file if it exists
             if os.path.exists(self.image_path):
                 os.remove(self.image_path)
-            self.root.after(0, self.show_operation_result, 
+            self.progress_bus.call(self.show_job_result, cancel, 
                           f"Disk imaging failed: {error_msg}", 
                           False)
+        finally:
+            if job_done:
+                job_done.set()
+            governor.release()
+
+    def run_engine_create_image(self, cancel, image_format):
+        job_done = self.begin_io_job([self.selected_source_disk], cancel)
+        try:
+            if self.image_table:
+                chunks = trimmed_stream(self.selected_source_disk, self.image_table, self.total_size,
+                                        COPY_CHUNK, cancel.is_set)
+            else:
+                chunks = read_chunks(self.selected_source_disk, COPY_CHUNK, cancel.is_set)
+            chunks = throttled(chunks, self.io_governor.limiter)
+            progress = lambda n: self.report_copied_bytes(n, "Creating image")
+            if image_format == "raw":
+                write_stream(chunks, self.image_path, progress)
+            else:
+                write_qcow2(chunks, self.image_path, self.total_size,
+                            compress=image_format == "qcow2 (compressed)",
+                            progress=progress)
+            if cancel.is_set():
+                if os.path.exists(self.image_path):
+                    os.remove(self.image_path)
+            else:
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Disk image created successfully at:\n{self.image_path}",
+                              True)
+        except OSError as e:
+            if os.path.exists(self.image_path):
+                os.remove(self.image_path)
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Disk imaging failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def run_store_image(self, cancel):
+        store_dir = os.path.dirname(self.image_path)
+        name = os.path.splitext(os.path.basename(self.image_path))[0]
+        job_done = self.begin_io_job([self.selected_source_disk], cancel)
+        try:
+            manifest_path, new_chunks, total_chunks = store_image(
+                self.selected_source_disk, store_dir, name,
+                lambda n: self.report_copied_bytes(n, "Storing image"),
+                cancel.is_set, self.io_governor.limiter)
+            if not cancel.is_set():
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Image stored at:\n{manifest_path}\n"
+                              f"{new_chunks} of {total_chunks} chunks were new",
+                              True)
+        except OSError as e:
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Disk imaging failed: {e}",
+                          False)
+        finally:
+            job_done.set()
+
+    def copy_disk_image(self):
+        self.selected_file = self.choose_file("Select disk image to copy")
+        if not self.selected_file:
+            self.initialize_ui()
+            return
+        dest_dir = self.choose_directory("Select directory for the copy")
+        if not dest_dir:
+            self.initialize_ui()
+            return
+        base, ext = os.path.splitext(os.path.basename(self.selected_file))
+        self.image_path = os.path.join(dest_dir, f"{base}-copy-{datetime.now():%Y%m%d-%H%M%S}{ext}")
+        self.total_size = os.path.getsize(self.selected_file)
+        self.execute_copy_image()
+
+    def execute_copy_image(self):
+        self.show_progress_screen(f"Copying {os.path.basename(self.selected_file)}",
+                                  detail=f"Saving to: {self.image_path}",
+                                  info="Starting copy...", cancel_command=self.cancel_operation)
+
+        self.start_job(self.run_copy_image)
+
+    def run_copy_image(self, cancel):
+        try:
+            method = server_side_copy(self.selected_file, self.image_path,
+                                      lambda n: self.report_copied_bytes(n, "Copied"))
+            if not method:
+                method = "stream"
+                run_dd(dd_command(self.selected_file, self.image_path, conv="sparse", sudo=False),
+                       lambda n: self.report_copied_bytes(n, "Copied"), cancel.is_set,
+                       started=self.attach_process)
+
+            if cancel.is_set():
+                if os.path.exists(self.image_path):
+                    os.remove(self.image_path)
+            else:
+                self.progress_bus.call(self.show_job_result, cancel,
+                              f"Image copied ({method}) to:\n{self.image_path}",
+                              True)
+        except (subprocess.CalledProcessError, OSError) as e:
+            if os.path.exists(self.image_path):
+                os.remove(self.image_path)
+            self.progress_bus.call(self.show_job_result, cancel,
+                          f"Image copy failed: {e}",
+                          False)
+
+    def show_job_result(self, cancel, message, success):
+        # A cancelled job's result would replace whatever screen the user has moved on to
+        if not cancel.is_set():
+            self.show_operation_result(message, success)
 
     def show_operation_result(self, message, success):
-        self.clear_ui()
-        tk.Label(
-            self.main_frame,
-            text=message,
+        if self.eta and success:
+            self.eta.finish()
+        self.eta = None
+        if self.job_metrics:
+            outcome = "success" if success else "failed"
+            self.metrics.record_job(self.job_metrics, outcome)
+            self.job_metrics = None
+        self.show_screen("result", self.build_result_screen)
+        self.result_label.config(text=message, fg='#FFFFFF' if success else '#FF4D00')
+
+    def build_result_screen(self, frame):
+        self.result_label = tk.Label(
+            frame,
+            text="",
             bg='#1E1E1E',
-            fg='#FFFFFF' if success else '#FF4D00',
+            fg='#FFFFFF',
             font=("Segoe UI", 14, "bold")
-        ).pack(pady=20)
+        )
+        self.result_label.pack(pady=20)
 
-        button_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        button_frame = tk.Frame(frame, bg='#1E1E1E')
         button_frame.pack(pady=10)
 
         tk.Button(
@@ -1207,9 +2731,21 @@ class DDUtilityApp:
     def cancel_operation(self):
         if hasattr(self, 'process') and self.process:
             self.process.terminate()
-        self.cancelled = True
+        self.cancel_job()
+
+    def cancel_job(self):
+        # The worker stops at its next should_stop check and posts nothing
+        self.job_cancel.set()
+        if self.job_metrics:
+            self.metrics.record_job(self.job_metrics, "cancelled")
+            self.job_metrics = None
         self.initialize_ui()
 
+    def start_job(self, target, *args):
+        # Tk thread: the worker gets its own cancel event, so later jobs and navigation cannot clear it
+        self.job_cancel = threading.Event()
+        threading.Thread(target=target, args=(self.job_cancel, *args)).start()
+
 def main():
     root = tk.Tk()
     app = DDUtilityApp(root)
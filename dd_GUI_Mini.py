@@ -4,10 +4,11 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import subprocess
 import threading
-import re
 import os
 import signal
 
+from dd_engine import blockdev_size, copy_status, dd_command, list_disks, run_dd
+
 class DDUtilityApp:
     def __init__(self, root):
         self.root = root
@@ -24,6 +25,7 @@ class DDUtilityApp:
         self.total_size = 0  # Total size of source
         self.task_message = ""  # Message to display during operation
         self.process = None  # Reference to the dd process
+        self.cancelled = False
 
         self.font = ("Sans", 11)  # Font for most of the UI
         self.disk_selection_font = ("Sans", 13)  # Larger font for disk selection window
@@ -55,11 +57,7 @@ class DDUtilityApp:
     def choose_disk(self, prompt, preselect=None, on_done=None):
         try:
             # Get device names and sizes, include SD cards and loop devices
-            disk_details = subprocess.check_output(["lsblk", "-dpno", "NAME,SIZE,TYPE"]).decode().strip().split("\n")
-            disk_choices = [
-                f"{line.split()[0]} ({line.split()[1]})" for line in disk_details
-                if line.startswith('/dev/sd') or line.startswith('/dev/mmcblk') or line.startswith('/dev/loop')
-            ]
+            disk_choices = [f"{disk['path']} ({disk['size']})" for disk in list_disks()]
 
             def on_select():
                 selection = disk_listbox.curselection()
@@ -108,7 +106,7 @@ class DDUtilityApp:
             self.selected_source_disk = source
             # Determine total size of source disk
             try:
-                self.total_size = int(subprocess.check_output(["sudo", "blockdev", "--getsize64", source]).strip())
+                self.total_size = blockdev_size(source)
             except subprocess.CalledProcessError as e:
                 messagebox.showerror("Error", f"Failed to get size of source disk: {e}")
                 self.initialize_ui()
@@ -180,20 +178,14 @@ class DDUtilityApp:
         self.cancel_button.pack(fill='x', padx=10)
 
         # Start the dd process in a separate thread
+        self.cancelled = False
         threading.Thread(target=self.execute_dd).start()
 
-    def update_progress(self, line):
-        # Extracting data from dd output
-        match = re.search(r'(\d+) bytes', line)
-        if match:
-            copied_bytes = int(match.group(1))
-            copied_mb = copied_bytes / (1024 * 1024)
-            if self.total_size > 0:
-                progress_percentage = min((copied_bytes / self.total_size) * 100, 100)
-                # Format copied MB to an integer with leading zeros
-                copied_mb_formatted = f"{int(copied_mb):04d}"
-                self.root.after(0, self.progress_bar.config, {'value': progress_percentage})
-                self.root.after(0, self.progress_info.config, {'text': f"Copied: {copied_mb_formatted} MB, {progress_percentage:.0f}% Done"})
+    def update_progress(self, copied_bytes):
+        if self.total_size > 0:
+            progress_percentage, text = copy_status(copied_bytes, self.total_size)
+            self.root.after(0, self.progress_bar.config, {'value': progress_percentage})
+            self.root.after(0, self.progress_info.config, {'text': text})
 
     def execute_dd(self):
         if self.selected_file and self.selected_destination_disk:
@@ -206,22 +198,17 @@ class DDUtilityApp:
             return
 
         try:
-            self.process = subprocess.Popen(
-                ["sudo", "dd", f"if={src}", f"of={dest}", "bs=4M", "conv=fdatasync", "status=progress"],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            while True:
-                line = self.process.stderr.readline()
-                if not line:
-                    break
-                self.root.after(0, self.update_progress, line.strip())
-            self.process.wait()
-            self.root.after(0, self.show_completion_message)
+            run_dd(dd_command(src, dest, conv="fdatasync"), self.update_progress, lambda: self.cancelled,
+                   started=lambda process: setattr(self, 'process', process))
+            if not self.cancelled:
+                self.root.after(0, self.show_completion_message)
         except subprocess.CalledProcessError as e:
-            self.root.after(0, messagebox.showerror, "Error", f"DD operation failed: {e}")
+            self.root.after(0, messagebox.showerror, "Error", f"DD operation failed: {e.stderr or e}")
         finally:
             self.process = None
 
     def cancel_dd(self):
+        self.cancelled = True
         if self.process:
             self.process.send_signal(signal.SIGINT)  # Send SIGINT to stop the process
             self.process = None
@@ -0,0 +1,132 @@
+"""Headless engine behind DD-GUI.py and dd_GUI_Mini.py.
+
+Nothing here imports tkinter. Names resolve to their submodule on first use,
+so `import dd_engine` costs next to nothing and a script only loads what it
+touches - hashing, sqlite, codecs and urllib come in with the operations
+that need them:
+
+    import os
+    import dd_engine
+
+    for disk in dd_engine.list_disks():
+        print(disk["path"], disk["size"], disk["model"])
+    size = os.path.getsize("debian.iso")
+    dd_engine.run_dd(dd_engine.dd_command("debian.iso", "/dev/sdb", conv="fdatasync"),
+                     progress=lambda n: print(dd_engine.copy_status(n, size)[1]))
+
+Long operations take a progress(done_bytes) callable and a should_stop()
+callable, and fail with OSError or ValueError.
+"""
+import importlib
+import os
+
+DATA_DIR = os.path.expanduser("~/.local/share/dd_gui")
+
+# Public names by the submodule that defines them
+API = {
+    "units": "ceil_div format_duration SIZE_SUFFIXES parse_size format_size copy_status",
+    "devices": """
+        FICLONE COPY_CHUNK is_block_device require_access loop_backing_file regular_file_source server_side_copy
+        open_for_write read_chunks write_stream block_name read_block_stat device_size open_direct
+        is_mounted pread_full pwrite_full read_queue_attr sysfs_size device_identity DISK_PREFIXES
+        list_disks blockdev_size read_at is_rotational
+    """,
+    "dd": "DD_PROGRESS dd_command dd_progress run_dd",
+    "iolimits": """
+        IONICE_CLASSES CGROUP_ROOT ADAPTIVE_LATENCY_MS ADAPTIVE_MIN_RATE RATE_LIMIT_MAX_MB IO_MAX_WRITE_DELAY
+        CGROUP_CREATE CGROUP_IO_MAX UNCAPPED_NOTE set_thread_ioprio RateLimiter throttled IoGovernor stream_copy
+    """,
+    "progress": """
+        KERNEL_SAMPLE_SECONDS device_stat_path read_counters read_proc_io process_tree KernelProgress
+        describe_counters
+    """,
+    "probe": """
+        PROBE_SEQ_BYTES PROBE_RANDOM_READS PROBE_BLOCK PROBE_MARKERS PROBE_MAGIC probe_device
+        probe_write_speed check_capacity describe_probe
+    """,
+    "discard": "BLKZEROOUT DISCARD_RANGE ZERO_CHUNK discard_zeroes clear_device is_zero write_nonzero",
+    "history": "HISTORY_DB HISTORY_CURVE_POINTS curve_time_at ThroughputHistory EtaTracker",
+    "metrics": """
+        METRICS_STATE METRICS_TEXTFILE_DIR OPERATION_LOG OPERATION_LOG_MAX_BYTES OPERATION_LOG_BACKUPS
+        LATENCY_BUCKETS THROUGHPUT_BUCKETS write_atomic new_histogram observe_histogram merge_histogram
+        JobMetrics MetricsExporter
+    """,
+    "partitions": """
+        MBR_EXTENDED_TYPES GPT_HEADER read_partition_table read_logical_partitions read_gpt BLKRRPART
+        trimmed_size gpt_relocation patched trimmed_stream fit_gpt_to_device
+    """,
+    "filesystems": """
+        EXT4_BLOCK_UNINIT EXT4_INCOMPAT_META_BG EXT4_INCOMPAT_64BIT last_set_bit fs_summary ext_superblock
+        ext_groups inspect_ext fat_allocation inspect_fat exfat_allocation inspect_exfat inspect_ntfs
+        inspect_btrfs inspect_xfs inspect_swap inspect_luks inspect_iso9660 FILESYSTEM_INSPECTORS
+        inspect_filesystem inspect_layout describe_layout
+    """,
+    "parallel": "parallel_workers run_parallel SharedProgress",
+    "partsets": """
+        PARTITION_SET_LAYOUT PARTITION_SET_TABLE PARTITION_ENCODINGS FALLOC_FL_KEEP_SIZE
+        FALLOC_FL_PUNCH_HOLE read_range merge_ranges nonzero_ranges ext_has_super allocated_ranges
+        table_regions plan_partition_image image_partition image_partitions load_partition_set data_segments
+        LIBC zero_range allocated_holes restore_partition restore_partitions
+    """,
+    "assembly": """
+        ASSEMBLY_ALIGN image_virtual_size plan_assembly assembly_table_command create_assembly_target
+        check_assembly_table image_pieces assemble_partition write_assembly
+    """,
+    "qcow2": """
+        QCOW2_MAGIC QCOW2_HEADER QCOW2_CLUSTER_BITS QCOW_OFLAG_COPIED QCOW_OFLAG_COMPRESSED QCOW_OFLAG_ZERO
+        QCOW2_OFFSET_MASK IMAGE_FORMATS is_qcow2 write_qcow2 read_qcow2_header qcow2_virtual_size
+        qcow2_stream
+    """,
+    "store": """
+        STORE_CHUNK MANIFEST_SUFFIX is_manifest chunk_path store_image load_manifest manifest_stream
+        flash_manifest
+    """,
+    "verify": """
+        CHECKSUM_DB VERIFY_CHUNK file_identity ChecksumCache ChunkHasher source_checksums is_plain_image
+        hashed verify_against MERKLE_SUFFIX MERKLE_MAGIC MERKLE_LEAF MERKLE_BATCH MERKLE_HEADER hash_leaves
+        hash_workers merkle_leaves merkle_root merkle_sidecar load_merkle build_merkle
+    """,
+    "sampling": """
+        SAMPLE_CHUNK SAMPLE_COUNT SAMPLE_TOLERANCE pattern_base pattern_chunk pattern_stream expect_zeros
+        expect_pattern expect_source sample_indexes log_choose miss_chance sample_confidence sample_verify
+        describe_sample
+    """,
+    "delta": """
+        DELTA_MAGIC DELTA_SUFFIX DELTA_CHUNK DELTA_HEADER DELTA_RECORD DELTA_END NO_DIGEST delta_leaves
+        create_delta read_delta_header delta_records check_delta apply_delta
+    """,
+    "mkfs": """
+        FLASH_ERASE_BLOCK FS_BLOCK read_sysfs_int device_topology fat_cluster_size fat_data_start
+        fat_reserved_sectors mkfs_tuning
+    """,
+    "luks": """
+        LUKS_BENCHMARK LUKS_UNLOCK_MS LUKS_MIN_MEMORY_KB ARGON2_MIN_ITERATIONS CIPHER_LINE ARGON2_LINE
+        cpu_flags luks_host_key parse_cryptsetup_benchmark luks_benchmark luks_cipher_name
+        luks_cipher_choices tune_pbkdf luks_format_command
+    """,
+    "hotcache": "HOT_CACHE_DIR default_hot_cache_budget HotImageCache",
+    "library": """
+        LIBRARY_DB LIBRARY_CONFIG LIBRARY_EXTENSIONS LIBRARY_RESCAN_SECONDS COMPRESSED_MAGICS
+        detect_image_format inspect_image_file inotify_wait ImageLibrary
+    """,
+    "url": """
+        URL_SEGMENT URL_CONNECTIONS URL_WINDOW URL_READ URL_TIMEOUT URL_RETRIES URL_AGENT
+        CHECKSUM_ALGORITHMS gzip_decompressor xz_decompressor bzip2_decompressor zstd_decompressor
+        STREAM_DECOMPRESSORS is_url url_open http_errors probe_url resolve_checksum fetch_range url_chunks
+        decompressed url_stream
+    """,
+}
+LOCATIONS = {name: module for module, names in API.items() for name in names.split()}
+
+__all__ = ["DATA_DIR", *LOCATIONS]
+
+def __getattr__(name):
+    module = LOCATIONS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(LOCATIONS))
@@ -0,0 +1,148 @@
+import os
+import json
+from functools import partial
+
+from .devices import COPY_CHUNK, device_size, is_block_device, open_for_write, pwrite_full
+from .discard import is_zero
+from .parallel import SharedProgress, parallel_workers, run_parallel
+from .partitions import read_partition_table
+from .partsets import data_segments, read_range, zero_range
+from .qcow2 import is_qcow2, qcow2_stream, qcow2_virtual_size
+from .units import ceil_div, format_size, parse_size
+
+# Disk images assembled from a layout spec: table type, sizes and one source image per partition
+ASSEMBLY_ALIGN = 1024 * 1024
+
+def image_virtual_size(path):
+    return qcow2_virtual_size(path) if is_qcow2(path) else os.path.getsize(path)
+
+def plan_assembly(spec_path, disk_size=None):
+    """Resolve a layout spec into partition offsets.
+
+    The spec is JSON: {"table": "gpt"|"msdos", "size": optional total,
+    "partitions": [{"name", "fs", "flags", "size", "image"}, ...]}. Image
+    paths are relative to the spec; a partition without a size gets the
+    size of its image, and the last one may use "fill". Partitions start
+    at 1 MiB and are MiB-aligned.
+    """
+    with open(spec_path) as f:
+        spec = json.load(f)
+    base = os.path.dirname(os.path.abspath(spec_path))
+    table = spec.get("table", "gpt")
+    if table not in ("gpt", "msdos"):
+        raise ValueError(f"Unknown table type {table!r}")
+    entries = spec.get("partitions") or []
+    if not entries:
+        raise ValueError("The layout has no partitions")
+    if table == "msdos" and len(entries) > 4:
+        raise ValueError("An msdos layout takes at most 4 partitions")
+    total = parse_size(spec["size"]) if "size" in spec else disk_size
+    tail = ASSEMBLY_ALIGN if table == "gpt" else 0  # room for the backup GPT
+    offset = ASSEMBLY_ALIGN
+    partitions = []
+    for number, entry in enumerate(entries, 1):
+        image = os.path.join(base, entry["image"]) if entry.get("image") else None
+        image_size = image_virtual_size(image) if image else 0
+        size = entry.get("size")
+        if size == "fill":
+            if number != len(entries) or total is None:
+                raise ValueError("Only the last partition can fill, and only with a known disk size")
+            size = (total - tail - offset) // ASSEMBLY_ALIGN * ASSEMBLY_ALIGN
+        else:
+            size = ceil_div(parse_size(size) if size is not None else image_size, ASSEMBLY_ALIGN) * ASSEMBLY_ALIGN
+        if size <= 0:
+            raise ValueError(f"Partition {number} needs a size or an image")
+        if image_size > size:
+            raise ValueError(f"{entry['image']} ({format_size(image_size)}) does not fit partition {number} "
+                             f"({format_size(size)})")
+        partitions.append({"number": number, "name": entry.get("name") or f"part{number}",
+                           "fs": entry.get("fs"), "flags": entry.get("flags", []),
+                           "start": offset, "size": size, "image": image, "image_size": image_size})
+        offset += size
+    if total is None:
+        total = offset + tail
+    if offset + tail > total:
+        raise ValueError(f"The partitions need {format_size(offset + tail)}, the disk has {format_size(total)}")
+    return {
+        "table": table,
+        "size": total,
+        "partitions": partitions,
+        "write_bytes": sum(p["image_size"] for p in partitions),
+    }
+
+def assembly_table_command(plan, dest):
+    """The parted call that lays out plan's partitions on dest, at plan's exact offsets."""
+    cmd = ["parted", "-s", "-a", "none", dest, "unit", "B", "mklabel", plan["table"]]
+    for p in plan["partitions"]:
+        cmd += ["mkpart", p["name"] if plan["table"] == "gpt" else "primary"]
+        if p["fs"]:
+            cmd.append(p["fs"])
+        cmd += [f"{p['start']}B", f"{p['start'] + p['size'] - 1}B"]
+        for flag in p["flags"]:
+            cmd += ["set", str(p["number"]), flag, "on"]
+    return cmd
+
+def create_assembly_target(plan, dest):
+    """Start an image file as one hole of the planned size; check that a disk is big enough."""
+    if is_block_device(dest):
+        if device_size(dest) < plan["size"]:
+            raise ValueError(f"{dest} is smaller than the layout ({format_size(plan['size'])})")
+        return
+    with open(dest, "wb") as f:
+        f.truncate(plan["size"])
+
+def check_assembly_table(plan, dest):
+    with open(dest, "rb") as f:
+        table = read_partition_table(f)
+    found = {p["number"]: (p["start"], p["size"]) for p in (table or {"partitions": []})["partitions"]}
+    for p in plan["partitions"]:
+        if found.get(p["number"]) != (p["start"], p["size"]):
+            raise ValueError(f"Partition {p['number']} was not created at {p['start']} (+{p['size']})")
+
+def image_pieces(path, should_stop=None):
+    """(offset, length, data) covering a raw or qcow2 image; data is None for holes."""
+    if is_qcow2(path):
+        offset = 0
+        for data in qcow2_stream(path, should_stop):
+            yield offset, len(data), data
+            offset += len(data)
+        return
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for offset, length, is_data in data_segments(f.fileno(), size):
+            if not is_data:
+                yield offset, length, None
+                continue
+            for data in read_range(path, offset, length, COPY_CHUNK, should_stop):
+                yield offset, len(data), data
+                offset += len(data)
+
+def assemble_partition(dest, partition, fresh, progress, should_stop=None):
+    # A fresh image file reads back as zeros already; a disk needs them written
+    start = partition["start"]
+    fd = open_for_write(dest, truncate=False)
+    try:
+        if not partition["image"]:
+            if not fresh:
+                zero_range(fd, start, min(ASSEMBLY_ALIGN, partition["size"]))  # no stale signatures
+            return
+        for offset, length, data in image_pieces(partition["image"], should_stop):
+            if should_stop and should_stop():
+                return
+            if data is None or is_zero(data):
+                if not fresh:
+                    zero_range(fd, start + offset, length)
+            else:
+                pwrite_full(fd, data, start + offset)
+            progress.add(length)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_assembly(plan, dest, fresh, progress=None, should_stop=None, workers=None):
+    """Write every partition image at its offset, several at a time."""
+    shared = SharedProgress(progress)
+    images = [p["image"] for p in plan["partitions"] if p["image"]]
+    workers = workers or parallel_workers([dest] + images, len(plan["partitions"]))
+    run_parallel([partial(assemble_partition, dest, p, fresh, shared, should_stop)
+                  for p in plan["partitions"]], workers)
@@ -0,0 +1,49 @@
+import subprocess
+import re
+
+# dd itself, with status=progress lines like "1048576 bytes (1.0 MB, 1.0 MiB) copied, 1 s, 1.0 MB/s"
+DD_PROGRESS = re.compile(r'(\d+) bytes')
+
+def dd_command(src, dest, block_size="4M", conv=None, sudo=True, wrap=None):
+    """dd argv copying src to dest; wrap(cmd) can put ionice/cgroup launchers in front of dd."""
+    cmd = ["dd", f"if={src}", f"of={dest}", f"bs={block_size}"]
+    if conv:
+        cmd.append(f"conv={conv}")
+    cmd.append("status=progress")
+    if wrap:
+        cmd = wrap(cmd)
+    return ["sudo", *cmd] if sudo else cmd
+
+def dd_progress(line):
+    """Bytes copied so far according to one dd status line, or None."""
+    match = DD_PROGRESS.search(line)
+    return int(match.group(1)) if match else None
+
+def run_dd(cmd, progress=None, should_stop=None, started=None):
+    """Run a dd command, calling progress(copied_bytes) for each status line.
+
+    started(process) gets the Popen as soon as it exists so a front-end can
+    signal it. Once should_stop() is true dd is terminated and the call just
+    returns; any other non-zero exit raises CalledProcessError carrying dd's
+    last message as stderr.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if started:
+        started(process)
+    message = ""
+    while True:
+        if should_stop and should_stop():
+            process.terminate()
+            break
+        line = process.stderr.readline()
+        if not line:
+            break
+        copied = dd_progress(line)
+        if copied is not None:
+            if progress:
+                progress(copied)
+        elif line.strip() and " records " not in line:
+            message = line.strip()
+    process.wait()
+    if process.returncode != 0 and not (should_stop and should_stop()):
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=message)
@@ -0,0 +1,182 @@
+import os
+import hashlib
+import struct
+import zlib
+
+from .devices import COPY_CHUNK, device_size, is_block_device, open_for_write, pwrite_full, read_at
+from .units import ceil_div, format_size
+from .verify import load_merkle
+
+# Block-level deltas between two images: changed chunks with the hashes they replace
+DELTA_MAGIC = b"DDDELTA1"
+DELTA_SUFFIX = ".dddelta"
+DELTA_CHUNK = 64 * 1024
+DELTA_HEADER = struct.Struct("<8sIQQ")  # magic, chunk size, old size, new size
+DELTA_RECORD = struct.Struct("<QII32s32s")  # chunk index, length, stored length, old sha256, new sha256
+DELTA_END = 0xFFFFFFFFFFFFFFFF  # trailer record: changed count, digest kind, old and new image digests
+NO_DIGEST = bytes(32)
+
+def delta_leaves(old, new):
+    """(leaf_size, roots, equal leaf indexes) when both images have tree
+    sidecars with the same leaf size, else None."""
+    old_tree, new_tree = load_merkle(old), load_merkle(new)
+    if not (old_tree and new_tree) or old_tree["leaf_size"] != new_tree["leaf_size"] \
+            or old_tree["leaf_size"] % DELTA_CHUNK:
+        return None
+    same = {i for i, (a, b) in enumerate(zip(old_tree["leaves"], new_tree["leaves"])) if a == b}
+    return old_tree["leaf_size"], (old_tree["root"], new_tree["root"]), same
+
+def create_delta(old, new, dest, progress=None, should_stop=None):
+    """Write a delta that turns old into new.
+
+    Each changed chunk carries the hash of the old bytes it replaces, so a
+    target can be checked before anything is written. When both images
+    have tree sidecars, leaves with equal hashes are not read at and the
+    trailer carries the tree roots instead of full SHA-256s. Returns
+    {"changed", "new_size", "patch_size", "skipped"}, or None when stopped.
+    """
+    old_size, new_size = device_size(old), device_size(new)
+    trees = delta_leaves(old, new)
+    leaf_size, same = (trees[0], trees[2]) if trees else (COPY_CHUNK, set())
+    old_hash, new_hash = hashlib.sha256(), hashlib.sha256()
+    changed = done = 0
+    partial_path = dest + ".part"
+    with open(partial_path, "wb") as out, open(old, "rb") as fold, open(new, "rb") as fnew:
+        out.write(DELTA_HEADER.pack(DELTA_MAGIC, DELTA_CHUNK, old_size, new_size))
+        for leaf in range(ceil_div(new_size, leaf_size)):
+            if should_stop and should_stop():
+                break
+            offset = leaf * leaf_size
+            length = min(leaf_size, new_size - offset)
+            if leaf not in same:
+                after = read_at(fnew, offset, length)
+                before = read_at(fold, offset, length)
+                if not trees:
+                    old_hash.update(before)
+                    new_hash.update(after)
+                for k in range(0, length, DELTA_CHUNK):
+                    data, prior = after[k:k + DELTA_CHUNK], before[k:k + DELTA_CHUNK]
+                    if prior == data:
+                        continue
+                    stored = zlib.compress(data, 6)
+                    if len(stored) >= len(data):
+                        stored = data
+                    old_digest = hashlib.sha256(prior).digest() if prior else NO_DIGEST
+                    out.write(DELTA_RECORD.pack((offset + k) // DELTA_CHUNK, len(data), len(stored), old_digest,
+                                                hashlib.sha256(data).digest()))
+                    out.write(stored)
+                    changed += 1
+            done += length
+            if progress:
+                progress(done)
+        if should_stop and should_stop():
+            out.close()
+            os.remove(partial_path)
+            return None
+        if trees:
+            old_digest, new_digest = trees[1]
+        else:
+            fold.seek(new_size)
+            for data in iter(lambda: fold.read(COPY_CHUNK), b""):
+                old_hash.update(data)
+            old_digest, new_digest = old_hash.digest(), new_hash.digest()
+        # The trailer's stored length says which digests it holds: 0 full SHA-256, 1 tree roots
+        out.write(DELTA_RECORD.pack(DELTA_END, changed, 1 if trees else 0, old_digest, new_digest))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(partial_path, dest)
+    return {"changed": changed, "new_size": new_size, "patch_size": os.path.getsize(dest),
+            "skipped": len(same) * leaf_size}
+
+def read_delta_header(f):
+    f.seek(0)
+    magic, chunk_size, old_size, new_size = DELTA_HEADER.unpack(f.read(DELTA_HEADER.size).ljust(DELTA_HEADER.size, b"\0"))
+    if magic != DELTA_MAGIC:
+        raise ValueError("Not an image delta")
+    f.seek(-DELTA_RECORD.size, os.SEEK_END)
+    index, changed, kind, old_digest, new_digest = DELTA_RECORD.unpack(f.read(DELTA_RECORD.size))
+    if index != DELTA_END:
+        raise ValueError("The delta is truncated")
+    f.seek(DELTA_HEADER.size)
+    return {"chunk_size": chunk_size, "old_size": old_size, "new_size": new_size, "changed": changed,
+            "digest": "merkle root" if kind else "sha256",
+            "old_digest": old_digest.hex(), "new_digest": new_digest.hex()}
+
+def delta_records(f, with_data=True):
+    """(index, length, old_digest, new_digest, stored) for each changed chunk, in order."""
+    while True:
+        index, length, stored_length, old_digest, new_digest = DELTA_RECORD.unpack(f.read(DELTA_RECORD.size))
+        if index == DELTA_END:
+            return
+        if with_data:
+            stored = f.read(stored_length)
+            yield index, length, old_digest, new_digest, zlib.decompress(stored) if stored_length < length else stored
+        else:
+            f.seek(stored_length, os.SEEK_CUR)
+            yield index, length, old_digest, new_digest, None
+
+def check_delta(patch, target, should_stop=None):
+    """Hash the blocks of target the delta touches, without writing.
+
+    Returns (pending, applied, mismatched): the count of chunks still
+    holding the old data, the indexes of chunks already holding the new
+    data (an interrupted earlier run) and the count holding neither.
+    """
+    pending = mismatched = 0
+    applied = set()
+    with open(patch, "rb") as f:
+        header = read_delta_header(f)
+        chunk = header["chunk_size"]
+        fd = os.open(target, os.O_RDONLY)
+        try:
+            for index, length, old_digest, new_digest, _ in delta_records(f, with_data=False):
+                if should_stop and should_stop():
+                    break
+                old_length = max(0, min(chunk, header["old_size"] - index * chunk))
+                current = os.pread(fd, max(length, old_length), index * chunk)
+                if hashlib.sha256(current[:length]).digest() == new_digest:
+                    applied.add(index)
+                elif old_digest == NO_DIGEST or hashlib.sha256(current[:old_length]).digest() == old_digest:
+                    pending += 1
+                else:
+                    mismatched += 1
+        finally:
+            os.close(fd)
+    return pending, applied, mismatched
+
+def apply_delta(patch, target, progress=None, should_stop=None):
+    """Write the changed chunks of a delta onto target (a device or an image file).
+
+    Refuses with ValueError, before writing anything, when a touched block
+    holds neither the old nor the new data. Chunks already carrying the new
+    data are skipped. Image files end up at the new size.
+    """
+    with open(patch, "rb") as f:
+        header = read_delta_header(f)
+    if is_block_device(target) and device_size(target) < header["new_size"]:
+        raise ValueError(f"{target} is smaller than the new image ({format_size(header['new_size'])})")
+    pending, applied, mismatched = check_delta(patch, target, should_stop)
+    if mismatched:
+        raise ValueError(f"{target} does not hold the old image: {mismatched} of "
+                         f"{header['changed']} touched blocks differ")
+    written = 0
+    fd = open_for_write(target, truncate=False)
+    try:
+        with open(patch, "rb") as f:
+            read_delta_header(f)
+            chunk = header["chunk_size"]
+            for index, length, old_digest, new_digest, data in delta_records(f):
+                if should_stop and should_stop():
+                    return None
+                if index in applied:
+                    continue
+                pwrite_full(fd, data, index * chunk)
+                written += length
+                if progress:
+                    progress(written)
+        if not is_block_device(target):
+            os.ftruncate(fd, header["new_size"])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return {"written": written, "pending": pending, "applied": len(applied)}
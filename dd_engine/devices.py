@@ -0,0 +1,251 @@
+import subprocess
+import os
+import stat
+import errno
+import fcntl
+import json
+
+# ioctl from <linux/fs.h>: share the extents of one file with another
+FICLONE = 0x40049409
+COPY_CHUNK = 4 * 1024 * 1024
+
+def is_block_device(path):
+    try:
+        return stat.S_ISBLK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+def require_access(read=(), write=()):
+    """Raise PermissionError for the first block device this process cannot open itself.
+
+    dd and blockdev run through sudo, but in-process engine work opens disks
+    directly, which needs root or membership of the device's group.
+    """
+    for paths, mode, what in ((read, os.R_OK, "read"), (write, os.R_OK | os.W_OK, "write")):
+        for path in paths:
+            if is_block_device(path) and not os.access(path, mode):
+                raise PermissionError(f"No {what} access to {path}: this operation opens the disk directly, "
+                                      f"so run DD GUI as root or add your user to the disk group")
+
+def loop_backing_file(device):
+    # A loop device without offset/sizelimit is byte-for-byte its backing file
+    name = os.path.basename(device)
+    if not name.startswith("loop"):
+        return None
+    sys_dir = f"/sys/block/{name}/loop"
+    try:
+        with open(os.path.join(sys_dir, "backing_file")) as f:
+            backing = f.read().strip()
+        for attr in ("offset", "sizelimit"):
+            with open(os.path.join(sys_dir, attr)) as f:
+                if int(f.read().strip() or 0) != 0:
+                    return None
+    except (OSError, ValueError):
+        return None
+    if backing.endswith(" (deleted)") or not os.path.isfile(backing):
+        return None
+    return backing
+
+def regular_file_source(path):
+    if os.path.isfile(path):
+        return path
+    return loop_backing_file(path)
+
+def server_side_copy(src, dest, progress=None):
+    """Copy src to dest without streaming the data through this process.
+
+    Tries a FICLONE reflink (btrfs, XFS, ...) first, then copy_file_range.
+    Returns "reflink" or "copy_file_range" on success and None when neither
+    is possible, in which case the caller falls back to a normal stream copy.
+    """
+    src_file = regular_file_source(src)
+    if not src_file or is_block_device(dest) or (os.path.exists(dest) and not os.path.isfile(dest)):
+        return None
+
+    total = os.path.getsize(src_file)
+    with open(src_file, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            if progress:
+                progress(total)
+            return "reflink"
+        except OSError:
+            pass
+
+        if not hasattr(os, "copy_file_range"):
+            return None
+        copied = 0
+        while copied < total:
+            try:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK, total - copied))
+            except OSError as e:
+                if copied == 0 and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                               errno.EOPNOTSUPP, errno.EPERM):
+                    return None
+                raise
+            if n == 0:
+                break
+            copied += n
+            if progress:
+                progress(copied)
+        return "copy_file_range"
+
+def open_for_write(dest, truncate=True):
+    flags = os.O_WRONLY
+    if not is_block_device(dest):
+        flags |= os.O_CREAT | (os.O_TRUNC if truncate else 0)
+    return os.open(dest, flags, 0o644)
+
+def read_chunks(path, chunk_size, should_stop=None, limit=None):
+    with open(path, "rb", buffering=0) as f:
+        remaining = limit
+        while True:
+            if should_stop and should_stop():
+                return
+            data = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                return
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+def write_stream(chunks, dest, progress=None):
+    fd = open_for_write(dest)
+    written = 0
+    try:
+        for data in chunks:
+            view = memoryview(data)
+            while view:
+                n = os.write(fd, view)
+                view = view[n:]
+            written += len(data)
+            if progress:
+                progress(written)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return written
+
+def block_name(path):
+    """Whole-disk kernel name for a device node (/dev/sdb1 -> sdb)."""
+    name = os.path.basename(os.path.realpath(path))
+    sys_path = f"/sys/class/block/{name}"
+    if os.path.exists(os.path.join(sys_path, "partition")):
+        name = os.path.basename(os.path.dirname(os.path.realpath(sys_path)))
+    return name if os.path.exists(f"/sys/class/block/{name}") else None
+
+def read_block_stat(name):
+    try:
+        with open(f"/sys/block/{name}/stat") as f:
+            return [int(v) for v in f.read().split()]
+    except (OSError, ValueError):
+        return None
+
+def device_size(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+def open_direct(path, flags):
+    # O_DIRECT keeps the page cache out of the measurement where supported
+    try:
+        return os.open(path, flags | os.O_DIRECT)
+    except OSError:
+        return os.open(path, flags)
+
+def is_mounted(path):
+    name = os.path.basename(os.path.realpath(path))
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                mounted = os.path.basename(os.path.realpath(line.split()[0]))
+                if mounted == name or (mounted.startswith(name) and mounted[len(name):].lstrip("p").isdigit()):
+                    return True
+    except OSError:
+        pass
+    return False
+
+def pread_full(fd, buf, offset):
+    """Fill buf from offset, stopping short only at end of file; returns the bytes read."""
+    view = memoryview(buf)
+    done = 0
+    while done < len(view):
+        n = os.preadv(fd, [view[done:]], offset + done)
+        if n == 0:
+            break
+        done += n
+    return done
+
+def pwrite_full(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+def read_queue_attr(name, attr):
+    try:
+        with open(f"/sys/block/{name}/queue/{attr}") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+def sysfs_size(path):
+    # Readable without root, unlike blockdev --getsize64
+    name = os.path.basename(os.path.realpath(path))
+    try:
+        with open(f"/sys/class/block/{name}/size") as f:
+            return int(f.read().strip()) * 512
+    except (OSError, ValueError):
+        return 0
+
+def device_identity(path):
+    identity = {"model": "", "serial": "", "transport": ""}
+    try:
+        output = subprocess.check_output(["lsblk", "-Jdno", "MODEL,SERIAL,TRAN", path],
+                                         stderr=subprocess.DEVNULL)
+        device = json.loads(output)["blockdevices"][0]
+        identity = {
+            "model": (device.get("model") or "").strip(),
+            "serial": (device.get("serial") or "").strip(),
+            "transport": device.get("tran") or "",
+        }
+    except (subprocess.CalledProcessError, OSError, ValueError, LookupError):
+        pass
+    return identity
+
+# Disks offered by the pickers: SCSI/SATA/USB disks, SD cards and loop devices
+DISK_PREFIXES = ("/dev/sd", "/dev/mmcblk", "/dev/loop")
+
+def list_disks():
+    """Whole disks from lsblk as dicts with path, size (as lsblk prints it), type and model."""
+    output = subprocess.check_output(["lsblk", "-dpno", "NAME,SIZE,TYPE,MODEL"]).decode().strip()
+    disks = []
+    for line in output.split("\n"):
+        if line.startswith(DISK_PREFIXES):
+            parts = line.split()
+            disks.append({
+                "path": parts[0],
+                "size": parts[1],
+                "type": parts[2],
+                "model": " ".join(parts[3:]) if len(parts) > 3 else "Unknown",
+            })
+    return disks
+
+def blockdev_size(path):
+    return int(subprocess.check_output(["sudo", "blockdev", "--getsize64", path]).strip())
+
+def read_at(f, offset, length):
+    f.seek(offset)
+    return f.read(length)
+
+def is_rotational(path):
+    if is_block_device(path):
+        name = block_name(path)
+    else:
+        st = os.stat(path)
+        node = os.path.basename(os.path.realpath(f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}"))
+        name = block_name(f"/dev/{node}")
+    return bool(name and read_queue_attr(name, "rotational"))
@@ -0,0 +1,63 @@
+import os
+import fcntl
+import struct
+
+from .devices import COPY_CHUNK, block_name, is_block_device, open_for_write, pwrite_full, read_queue_attr
+
+# Discard-then-write flashing: clear the whole target, then write only non-zero chunks
+BLKZEROOUT = 0x127f
+DISCARD_RANGE = 1024 ** 3
+ZERO_CHUNK = bytes(COPY_CHUNK)
+
+def discard_zeroes(path):
+    """Whether the device can be cleared to zeros without writing every block.
+
+    Plain discards never guarantee zeros (discard_zeroes_data always reads 0),
+    so this needs offloaded BLKZEROOUT, which the kernel may serve by
+    unmapping the blocks.
+    """
+    name = block_name(path)
+    if not name or not is_block_device(path):
+        return False
+    return bool(read_queue_attr(name, "write_zeroes_max_bytes"))
+
+def clear_device(path, progress=None, should_stop=None):
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        # Ranged requests keep cancel and progress responsive on large devices
+        for start in range(0, size, DISCARD_RANGE):
+            if should_stop and should_stop():
+                return start
+            fcntl.ioctl(fd, BLKZEROOUT, struct.pack("QQ", start, min(DISCARD_RANGE, size - start)))
+            if progress:
+                progress(min(start + DISCARD_RANGE, size), size)
+    finally:
+        os.close(fd)
+    return size
+
+def is_zero(data):
+    # startswith compares in place, so neither ZERO_CHUNK nor data is sliced into a copy
+    view = memoryview(data).cast("B")
+    step = len(ZERO_CHUNK)
+    return all(ZERO_CHUNK.startswith(view[i:i + step]) for i in range(0, len(view), step))
+
+def write_nonzero(chunks, dest, progress=None):
+    """Write the stream to an already zeroed dest, skipping all-zero chunks.
+
+    Returns (bytes written, bytes covered).
+    """
+    fd = open_for_write(dest, truncate=False)
+    offset = written = 0
+    try:
+        for data in chunks:
+            if not is_zero(data):
+                pwrite_full(fd, data, offset)
+                written += len(data)
+            offset += len(data)
+            if progress:
+                progress(offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return written, offset
@@ -0,0 +1,264 @@
+import os
+import struct
+import time
+from array import array
+
+from .devices import read_at
+from .partitions import MBR_EXTENDED_TYPES, read_partition_table
+from .units import ceil_div, format_size
+
+# Filesystem inspection from superblocks and allocation summaries (no full read)
+EXT4_BLOCK_UNINIT = 0x2
+EXT4_INCOMPAT_META_BG = 0x10
+EXT4_INCOMPAT_64BIT = 0x80
+
+def last_set_bit(bitmap):
+    """Index of the highest set bit in a little-endian bitmap, or -1."""
+    end = len(bitmap.rstrip(b"\0"))
+    if not end:
+        return -1
+    return (end - 1) * 8 + bitmap[end - 1].bit_length() - 1
+
+def fs_summary(fs, label, size, used, last_used):
+    return {"fs": fs, "label": label.strip(), "used": used,
+            "free": None if used is None else max(size - used, 0), "last_used": last_used}
+
+def ext_superblock(f, start):
+    sb = read_at(f, start + 1024, 1024)
+    if len(sb) < 1024 or struct.unpack_from("<H", sb, 0x38)[0] != 0xEF53:
+        return None
+    first_data_block, log_block, _, blocks_per_group = struct.unpack_from("<IIII", sb, 0x14)
+    incompat = struct.unpack_from("<I", sb, 0x60)[0]
+    wide = incompat & EXT4_INCOMPAT_64BIT
+    blocks = struct.unpack_from("<I", sb, 0x04)[0] | (struct.unpack_from("<I", sb, 0x150)[0] << 32 if wide else 0)
+    return {
+        "block": 1024 << log_block,
+        "blocks": blocks,
+        "free": struct.unpack_from("<I", sb, 0x0C)[0] | (struct.unpack_from("<I", sb, 0x158)[0] << 32 if wide else 0),
+        "first_data_block": first_data_block,
+        "blocks_per_group": blocks_per_group,
+        "groups": ceil_div(blocks - first_data_block, blocks_per_group),
+        "desc_size": max(struct.unpack_from("<H", sb, 0xFE)[0], 32) if wide else 32,
+        "incompat": incompat,
+        "sparse_super": struct.unpack_from("<I", sb, 0x64)[0] & 0x1,
+        "reserved_gdt": struct.unpack_from("<H", sb, 0xCE)[0],
+        "fs": "ext4" if incompat & 0x2C0 else "ext3" if struct.unpack_from("<I", sb, 0x5C)[0] & 0x4 else "ext2",
+        "label": sb[0x78:0x88].decode("utf-8", "ignore").rstrip("\0"),
+    }
+
+def ext_groups(f, start, geometry):
+    """(first block, blocks, free blocks, bitmap block, flags) for every block group."""
+    desc_size = geometry["desc_size"]
+    table = read_at(f, start + (geometry["first_data_block"] + 1) * geometry["block"],
+                    geometry["groups"] * desc_size)
+    groups = []
+    for group in range(min(geometry["groups"], len(table) // desc_size)):
+        desc = table[group * desc_size:(group + 1) * desc_size]
+        first = geometry["first_data_block"] + group * geometry["blocks_per_group"]
+        group_free = struct.unpack_from("<H", desc, 0x0C)[0]
+        bitmap_block = struct.unpack_from("<I", desc, 0x00)[0]
+        if desc_size >= 64:
+            group_free |= struct.unpack_from("<H", desc, 0x2C)[0] << 16
+            bitmap_block |= struct.unpack_from("<I", desc, 0x20)[0] << 32
+        groups.append((first, min(geometry["blocks_per_group"], geometry["blocks"] - first),
+                       group_free, bitmap_block, struct.unpack_from("<H", desc, 0x12)[0]))
+    return groups
+
+def inspect_ext(f, start, size):
+    geometry = ext_superblock(f, start)
+    if not geometry:
+        return None
+    block = geometry["block"]
+    total = geometry["blocks"] * block
+    used = (geometry["blocks"] - geometry["free"]) * block
+    if geometry["incompat"] & EXT4_INCOMPAT_META_BG:
+        return fs_summary(geometry["fs"], geometry["label"], total, used, None)
+
+    # The last group holding data, from the group descriptors, then its block bitmap
+    last_used = None
+    for first, in_group, group_free, bitmap_block, flags in reversed(ext_groups(f, start, geometry)):
+        if flags & EXT4_BLOCK_UNINIT or group_free >= in_group:
+            continue
+        bit = last_set_bit(read_at(f, start + bitmap_block * block, ceil_div(in_group, 8)))
+        last_used = (first + (bit + 1 if bit >= 0 else in_group)) * block
+        break
+    return fs_summary(geometry["fs"], geometry["label"], total, used, last_used)
+
+def fat_allocation(f, start):
+    """FAT geometry and the cluster entries (index 0 = cluster 2), or None."""
+    bs = read_at(f, start, 512)
+    if len(bs) < 512 or bs[510:512] != b"\x55\xaa" or bs[3:11] in (b"NTFS    ", b"EXFAT   "):
+        return None
+    bps, spc, reserved, fats, root_entries, total16, _, fat16 = struct.unpack_from("<HBHBHHBH", bs, 0x0B)
+    if bps not in (512, 1024, 2048, 4096) or spc == 0 or spc & (spc - 1) or fats not in (1, 2) or not reserved:
+        return None
+    total = total16 or struct.unpack_from("<I", bs, 0x20)[0]
+    fat_sectors = fat16 or struct.unpack_from("<I", bs, 0x24)[0]
+    data_start = reserved + fats * fat_sectors + ceil_div(root_entries * 32, bps)
+    if not total or total <= data_start:
+        return None
+    clusters = (total - data_start) // spc
+    fs = "fat12" if clusters < 4085 else "fat16" if clusters < 65525 else "fat32"
+    label = bs[0x47:0x52] if fs == "fat32" else bs[0x2B:0x36]
+    entry_bits = {"fat12": 12, "fat16": 16, "fat32": 32}[fs]
+    fat = read_at(f, start + reserved * bps, ceil_div((clusters + 2) * entry_bits, 8))
+    if fs == "fat12":
+        entries = array("H", [(int.from_bytes(fat[i * 3 // 2:i * 3 // 2 + 2], "little") >> (4 * (i & 1))) & 0xFFF
+                              for i in range(2, clusters + 2)])
+    else:
+        entries = array("I" if fs == "fat32" else "H", fat[:(clusters + 2) * entry_bits // 8])[2:]
+    return {"fs": fs, "label": label.decode("ascii", "ignore"), "total": total * bps,
+            "data_start": data_start * bps, "cluster": spc * bps, "entries": entries}
+
+def inspect_fat(f, start, size):
+    fat = fat_allocation(f, start)
+    if not fat:
+        return None
+    entries = fat["entries"]
+    last = ceil_div(len(entries.tobytes().rstrip(b"\0")), entries.itemsize) - 1
+    used = fat["data_start"] + (len(entries) - entries.count(0)) * fat["cluster"]
+    return fs_summary(fat["fs"], fat["label"], fat["total"], used,
+                      fat["data_start"] + (last + 1) * fat["cluster"])
+
+def exfat_allocation(f, start):
+    """exFAT geometry and its allocation bitmap (bit 0 = cluster 2; None if not found)."""
+    bs = read_at(f, start, 512)
+    if bs[3:11] != b"EXFAT   ":
+        return None
+    volume_sectors, = struct.unpack_from("<Q", bs, 0x48)
+    heap, cluster_count, root_cluster = struct.unpack_from("<III", bs, 0x58)
+    sector = 1 << bs[0x6C]
+    cluster_bytes = sector << bs[0x6D]
+    cluster_offset = lambda cluster: start + heap * sector + (cluster - 2) * cluster_bytes
+    label = ""
+    bitmap = None
+    root = read_at(f, cluster_offset(root_cluster), cluster_bytes)
+    for offset in range(0, len(root) - 31, 32):
+        entry_type = root[offset]
+        if entry_type == 0x83:
+            label = root[offset + 2:offset + 2 + 2 * root[offset + 1]].decode("utf-16-le", "ignore")
+        elif entry_type == 0x81 and bitmap is None:
+            first, length = struct.unpack_from("<IQ", root, offset + 20)
+            bitmap = read_at(f, cluster_offset(first), min(length, ceil_div(cluster_count, 8)))
+        elif entry_type == 0:
+            break
+    return {"label": label, "total": volume_sectors * sector, "data_start": heap * sector,
+            "cluster": cluster_bytes, "bitmap": bitmap}
+
+def inspect_exfat(f, start, size):
+    exfat = exfat_allocation(f, start)
+    if not exfat:
+        return None
+    bitmap = exfat["bitmap"]
+    if bitmap is None:
+        return fs_summary("exfat", exfat["label"], exfat["total"], None, None)
+    used = exfat["data_start"] + int.from_bytes(bitmap, "little").bit_count() * exfat["cluster"]
+    return fs_summary("exfat", exfat["label"], exfat["total"], used,
+                      exfat["data_start"] + (last_set_bit(bitmap) + 1) * exfat["cluster"])
+
+def inspect_ntfs(f, start, size):
+    bs = read_at(f, start, 512)
+    if bs[3:11] != b"NTFS    ":
+        return None
+    # Used space lives in the $Bitmap file; its size makes it a full-read job, so it is not counted
+    bps, = struct.unpack_from("<H", bs, 0x0B)
+    total, = struct.unpack_from("<Q", bs, 0x28)
+    return fs_summary("ntfs", "", total * bps, None, None)
+
+def inspect_btrfs(f, start, size):
+    sb = read_at(f, start + 0x10000, 0x1000)
+    if sb[0x40:0x48] != b"_BHRfS_M":
+        return None
+    total, used = struct.unpack_from("<QQ", sb, 0x70)
+    return fs_summary("btrfs", sb[0x12B:0x22B].decode("utf-8", "ignore").rstrip("\0"), total, used, None)
+
+def inspect_xfs(f, start, size):
+    sb = read_at(f, start, 512)
+    if sb[:4] != b"XFSB":
+        return None
+    block, blocks = struct.unpack_from(">IQ", sb, 4)
+    free, = struct.unpack_from(">Q", sb, 0x90)
+    return fs_summary("xfs", sb[0x6C:0x78].decode("utf-8", "ignore").rstrip("\0"),
+                      blocks * block, (blocks - free) * block, None)
+
+def inspect_swap(f, start, size):
+    for page in (4096, 16384, 65536):
+        if read_at(f, start + page - 10, 10) == b"SWAPSPACE2":
+            return fs_summary("swap", "", size, page, page)
+    return None
+
+def inspect_luks(f, start, size):
+    if read_at(f, start, 6) != b"LUKS\xba\xbe":
+        return None
+    return fs_summary("luks", "", size, size, size)
+
+def inspect_iso9660(f, start, size):
+    descriptor = read_at(f, start + 0x8000, 2048)
+    if descriptor[1:6] != b"CD001":
+        return None
+    blocks, = struct.unpack_from("<I", descriptor, 80)
+    block, = struct.unpack_from("<H", descriptor, 128)
+    return fs_summary("iso9660", descriptor[40:72].decode("ascii", "ignore"), blocks * block,
+                      blocks * block, blocks * block)
+
+FILESYSTEM_INSPECTORS = [inspect_iso9660, inspect_luks, inspect_ext, inspect_btrfs, inspect_xfs,
+                         inspect_exfat, inspect_ntfs, inspect_fat, inspect_swap]
+
+def inspect_filesystem(f, start, size):
+    """Filesystem type and allocation of the region at start.
+
+    used/free are None when the filesystem keeps no cheap summary;
+    last_used (relative to start) is None when it is unknown.
+    """
+    for inspector in FILESYSTEM_INSPECTORS:
+        try:
+            result = inspector(f, start, size)
+        except (struct.error, IndexError, ValueError, ZeroDivisionError):
+            result = None
+        if result:
+            return result
+    return fs_summary(None, "", size, None, None)
+
+def inspect_layout(path):
+    """Partition table plus per-filesystem used/free space of a disk or raw image.
+
+    last_used is the byte offset after which the disk holds no data; it
+    falls back to the partition end wherever a filesystem cannot tell.
+    """
+    started = time.monotonic()
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        table = read_partition_table(f)
+        whole = inspect_iso9660(f, 0, size)  # hybrid ISOs carry an MBR that only wraps the ISO
+        if table and table["partitions"] and not whole:
+            partitions = [dict(p) for p in table["partitions"]
+                          if table["table"] == "gpt" or int(p["type"], 16) not in MBR_EXTENDED_TYPES]
+        else:
+            partitions = [{"number": 0, "start": 0, "size": size, "type": ""}]
+        for partition in partitions:
+            partition.update(inspect_filesystem(f, partition["start"], partition["size"]))
+    used = sum(p["size"] if p["used"] is None else p["used"] for p in partitions)
+    last_used = max(p["start"] + (p["size"] if p["last_used"] is None else p["last_used"])
+                    for p in partitions)
+    return {
+        "size": size,
+        "table": (table or {}).get("table") if not whole else None,
+        "table_info": table,
+        "partitions": partitions,
+        "used": min(used, size),
+        "last_used": min(last_used, size),
+        "elapsed_ms": (time.monotonic() - started) * 1000,
+    }
+
+def describe_layout(report):
+    lines = []
+    for p in report["partitions"]:
+        name = f"#{p['number']} " if p["number"] else ""
+        label = f" \"{p['label']}\"" if p["label"] else ""
+        usage = "used space unknown" if p["used"] is None else f"{format_size(p['used'])} used"
+        lines.append(f"{name}{p['fs'] or 'unknown'}{label}, {format_size(p['size'])}: {usage}")
+    table = report["table"].upper() if report["table"] else "No partition table"
+    lines.append(f"{table}; data: {format_size(report['used'])} of {format_size(report['size'])}, "
+                 f"last data at {format_size(report['last_used'])} "
+                 f"(inspected in {report['elapsed_ms']:.0f} ms)")
+    return "\n".join(lines)
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import sqlite3
+from datetime import datetime
+
+from . import DATA_DIR
+
+# Completed operations with their throughput curves, used for ETA prediction
+HISTORY_DB = os.path.join(DATA_DIR, "history.sqlite")
+HISTORY_CURVE_POINTS = 64
+
+def curve_time_at(curve, fraction):
+    """Normalized time (0..1) at which a recorded run reached fraction of its bytes."""
+    total_time, total_bytes = curve[-1]
+    target = fraction * total_bytes
+    prev_t, prev_b = 0.0, 0
+    for t, b in curve:
+        if b >= target:
+            if b == prev_b:
+                return t / total_time
+            return (prev_t + (t - prev_t) * (target - prev_b) / (b - prev_b)) / total_time
+        prev_t, prev_b = t, b
+    return 1.0
+
+class ThroughputHistory:
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS operations (
+            id INTEGER PRIMARY KEY,
+            finished TEXT, operation TEXT, model TEXT, serial TEXT, transport TEXT,
+            block_size INTEGER, bytes INTEGER, seconds REAL, curve TEXT)""")
+        return conn
+
+    def record(self, identity, operation, block_size, nbytes, seconds, curve):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO operations (finished, operation, model, serial, transport,"
+                    " block_size, bytes, seconds, curve) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (datetime.now().isoformat(timespec="seconds"), operation, identity["model"],
+                     identity["serial"], identity["transport"], block_size, nbytes, seconds,
+                     json.dumps(curve)))
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error recording throughput history: {e}")
+
+    def similar(self, identity, operation, limit=20):
+        """Recent runs of the same operation on the same model, else the same transport."""
+        try:
+            conn = self._connect()
+            rows = []
+            for column in ("model", "transport"):
+                if identity[column]:
+                    rows = conn.execute(
+                        f"SELECT bytes, seconds, curve FROM operations WHERE operation = ? AND {column} = ?"
+                        " AND seconds > 0 ORDER BY id DESC LIMIT ?",
+                        (operation, identity[column], limit)).fetchall()
+                if rows:
+                    break
+            conn.close()
+        except sqlite3.Error:
+            return []
+        return [(b, sec, json.loads(curve)) for b, sec, curve in rows]
+
+class EtaTracker:
+    """Predicts a job's duration from history and corrects it from live progress."""
+
+    def __init__(self, history, identity, operation, block_size, total_bytes):
+        self.history = history
+        self.identity = identity
+        self.operation = operation
+        self.block_size = block_size
+        self.total_bytes = total_bytes
+        self.records = history.similar(identity, operation) if total_bytes else []
+        self.start = None
+        self.samples = []
+        self.done = 0
+
+    def predicted_total(self):
+        if not self.records:
+            return None
+        rates = sorted(b / sec for b, sec, _ in self.records)
+        return self.total_bytes / rates[len(rates) // 2]
+
+    def update(self, done_bytes):
+        """Record progress; returns the estimated seconds remaining or None."""
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        self.done = done_bytes
+        elapsed = now - self.start
+        if not self.samples or elapsed - self.samples[-1][0] >= 1:
+            self.samples.append((elapsed, done_bytes))
+        fraction = done_bytes / self.total_bytes if self.total_bytes else 0
+        if fraction < 0.02 or elapsed <= 0:
+            total = self.predicted_total()
+            return None if total is None else max(total - elapsed, 0)
+        if self.records:
+            # Scale the averaged historical time profile (e.g. SLC cache slowdowns) to this run
+            profile = sum(curve_time_at(curve, fraction) for _, _, curve in self.records) / len(self.records)
+            if profile > 0:
+                return max(elapsed / profile - elapsed, 0)
+        return elapsed * (1 - fraction) / fraction
+
+    def finish(self):
+        if self.start is None or not self.done:
+            return
+        elapsed = time.monotonic() - self.start
+        samples = self.samples + [(elapsed, self.done)]
+        step = max(1, len(samples) // HISTORY_CURVE_POINTS)
+        curve = [list(sample) for sample in samples[::step]]
+        if curve[-1] != [elapsed, self.done]:
+            curve.append([elapsed, self.done])
+        self.history.record(self.identity, self.operation, self.block_size, self.done, elapsed, curve)
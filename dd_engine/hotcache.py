@@ -0,0 +1,136 @@
+import threading
+import os
+import mmap
+import ctypes
+
+from .verify import file_identity
+
+# RAM (tmpfs) staging cache for images that are flashed again and again
+HOT_CACHE_DIR = os.environ.get("DD_GUI_HOT_CACHE_DIR", "/dev/shm/dd_gui_cache")
+
+def default_hot_cache_budget():
+    budget = int(os.environ.get("DD_GUI_HOT_CACHE_BYTES", "0"))
+    if budget:
+        return budget
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024 // 4
+    except (OSError, ValueError):
+        pass
+    return 2 * 1024 ** 3
+
+class HotImageCache:
+    """Copies of source images on tmpfs with a size budget and LRU eviction.
+
+    Entries are named after the source's (device, inode, size, mtime) so a
+    changed image never hits a stale copy; the cached file's mtime records
+    its last use. Cached files are mmap'ed and mlock'ed when the process
+    is allowed to, so they cannot be swapped out.
+    """
+
+    def __init__(self, directory=HOT_CACHE_DIR, budget=None):
+        self.directory = directory
+        self.budget = budget or default_hot_cache_budget()
+        self.lock = threading.Lock()
+        self.pinned = {}  # cache path -> mmap
+        self.libc = None
+        try:
+            self.libc = ctypes.CDLL(None, use_errno=True)
+        except OSError:
+            pass
+
+    def entry_path(self, path):
+        dev, ino, size, mtime_ns, _ = file_identity(path)
+        return os.path.join(self.directory, f"{dev:x}-{ino:x}-{size:x}-{mtime_ns:x}.img")
+
+    def lookup(self, path):
+        try:
+            cached = self.entry_path(path)
+        except OSError:
+            return None
+        if not os.path.exists(cached):
+            return None
+        os.utime(cached)
+        self.pin(cached)
+        return cached
+
+    def entries(self):
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith(".img")]
+        except OSError:
+            return []
+        result = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        return sorted(result)
+
+    def make_room(self, size):
+        if size > self.budget:
+            return False
+        with self.lock:
+            entries = self.entries()
+            used = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, path in entries:  # least recently used first
+                if used + size <= self.budget:
+                    break
+                self.unpin(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                used -= entry_size
+            return used + size <= self.budget
+
+    def pin(self, path):
+        if path in self.pinned or not self.libc:
+            return
+        try:
+            with open(path, "r+b") as f:
+                # Shared, so mlock pins the tmpfs pages themselves; a private writable mapping
+                # would be copied into anonymous memory. ctypes needs it writable for the address.
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+        except (OSError, ValueError):
+            return
+        view = ctypes.c_char.from_buffer(mapped)
+        address = ctypes.addressof(view)
+        del view
+        if self.libc.mlock(ctypes.c_void_p(address), ctypes.c_size_t(len(mapped))) != 0:
+            mapped.close()  # no CAP_IPC_LOCK / RLIMIT_MEMLOCK too small: tmpfs alone has to do
+            return
+        self.pinned[path] = mapped
+
+    def unpin(self, path):
+        mapped = self.pinned.pop(path, None)
+        if mapped:
+            mapped.close()
+
+    def fill(self, path, chunks):
+        """Pass chunks through while writing them to the cache; the entry only
+        becomes visible when the whole, unchanged image went through."""
+        identity = file_identity(path)
+        cached = self.entry_path(path)
+        if not self.make_room(identity[2]):
+            yield from chunks
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{cached}.part{threading.get_native_id()}"
+        written = 0
+        try:
+            with open(tmp, "wb") as f:
+                for data in chunks:
+                    f.write(data)
+                    written += len(data)
+                    yield data
+            if written == identity[2] and file_identity(path) == identity:
+                os.replace(tmp, cached)
+                self.pin(cached)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
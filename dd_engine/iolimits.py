@@ -0,0 +1,213 @@
+import subprocess
+import threading
+import os
+import time
+
+from .devices import COPY_CHUNK, block_name, is_block_device, read_block_stat, read_chunks, write_stream
+
+# I/O priority classes offered in the I/O Limits screen -> ionice arguments
+IONICE_CLASSES = {
+    "default": None,
+    "best-effort (low)": ["-c", "2", "-n", "7"],
+    "idle": ["-c", "3"],
+    "realtime": ["-c", "1", "-n", "4"],
+}
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Average per-request latency (ms) on other disks above which adaptive mode backs off
+ADAPTIVE_LATENCY_MS = 40
+ADAPTIVE_MIN_RATE = 4 * 1024 * 1024
+# Upper end of the bandwidth limit controls (MB/s)
+RATE_LIMIT_MAX_MB = 10000
+# Rate changes within this many seconds collapse into one io.max write
+IO_MAX_WRITE_DELAY = 0.3
+# cgroupfs is root-only; these run through sudo like dd itself
+CGROUP_CREATE = 'mkdir -p "$1" && echo +io > "$1/cgroup.subtree_control" && mkdir -p "$2"'
+CGROUP_IO_MAX = 'io_max="$1/io.max"; shift; for line; do echo "$line" > "$io_max" || exit 1; done'
+# Result note for dd jobs that ran without their cgroup
+UNCAPPED_NOTE = "Bandwidth cap not enforced: could not set up a cgroup v2 io.max for dd (ionice still applied)"
+
+def set_thread_ioprio(io_class):
+    args = IONICE_CLASSES.get(io_class)
+    if args:
+        subprocess.run(["ionice", *args, "-p", str(threading.get_native_id())],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class RateLimiter:
+    """Token bucket for the in-process copy loops; the rate can change at any time."""
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = rate  # bytes per second, 0 = unlimited
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = max(0, int(rate))
+
+    def throttle(self, nbytes):
+        with self.lock:
+            self._refill()
+            if self.rate <= 0:
+                self.tokens = 0.0
+                return
+            self.tokens -= nbytes
+        while True:
+            with self.lock:
+                self._refill()
+                if self.rate <= 0 or self.tokens >= 0:
+                    return
+                wait = -self.tokens / self.rate
+            time.sleep(min(wait, 0.2))
+
+def throttled(chunks, limiter):
+    for data in chunks:
+        limiter.throttle(len(data))
+        yield data
+
+class IoGovernor:
+    """Applies one job's I/O policy: ionice class, bandwidth cap, adaptive back-off.
+
+    dd child processes are capped through a cgroup v2 io.max entry, set up
+    through sudo, when the io controller is available; in-process copies use
+    the token bucket.
+    """
+
+    def __init__(self, io_class="default", rate=0, adaptive=False):
+        self.io_class = io_class
+        self.max_rate = rate
+        self.adaptive = adaptive
+        self.limiter = RateLimiter(rate)
+        self.cgroup = None
+        self.devices = []
+        self.rate_changed = threading.Event()
+
+    @staticmethod
+    def _sudo_sh(script, *args):
+        try:
+            return subprocess.run(["sudo", "sh", "-c", script, "sh", *args],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+        except OSError:
+            return False
+
+    @property
+    def limited(self):
+        return self.max_rate > 0 or self.adaptive
+
+    def set_rate(self, rate):
+        """Change the current rate; cheap enough for slider callbacks, io.max follows in the background."""
+        self.limiter.set_rate(rate)
+        if self.cgroup:
+            self.rate_changed.set()
+
+    def set_cap(self, rate):
+        """A new user limit: also bounds how far adaptive mode grows the rate back."""
+        self.max_rate = max(0, int(rate))
+        self.set_rate(self.max_rate)
+
+    def _write_io_max(self, cgroup, rate):
+        # The kernel takes one device per write
+        value = str(int(rate)) if rate > 0 else "max"
+        return self._sudo_sh(CGROUP_IO_MAX, cgroup,
+                             *(f"{numbers} rbps={value} wbps={value}" for numbers in self.devices))
+
+    def _io_max_writer(self, cgroup):
+        while True:
+            self.rate_changed.wait()
+            time.sleep(IO_MAX_WRITE_DELAY)
+            self.rate_changed.clear()
+            if self.cgroup != cgroup:
+                return
+            self._write_io_max(cgroup, self.limiter.rate)
+
+    def attach_cgroup(self, paths):
+        """Create a job cgroup with io.max for the given devices; False if impossible."""
+        self.devices = []
+        try:
+            for path in paths:
+                name = block_name(path) if is_block_device(path) else None
+                if name:
+                    with open(f"/sys/class/block/{name}/dev") as f:
+                        self.devices.append(f.read().strip())
+            with open(os.path.join(CGROUP_ROOT, "cgroup.subtree_control")) as f:
+                if "io" not in f.read().split():
+                    return False
+        except OSError:
+            return False
+        if not self.devices:
+            return False
+        parent = os.path.join(CGROUP_ROOT, "dd_gui")
+        self.cgroup = os.path.join(parent, f"job-{os.getpid()}-{threading.get_native_id()}")
+        if not (self._sudo_sh(CGROUP_CREATE, parent, self.cgroup)
+                and self._write_io_max(self.cgroup, self.limiter.rate)):
+            self.release()
+            return False
+        threading.Thread(target=self._io_max_writer, args=(self.cgroup,), daemon=True).start()
+        return True
+
+    def wrap_command(self, cmd):
+        """Prefix a command (to be run after sudo) with ionice and the cgroup join."""
+        args = IONICE_CLASSES.get(self.io_class)
+        if args:
+            cmd = ["ionice", *args, *cmd]
+        if self.cgroup:
+            cmd = ["sh", "-c", 'echo $$ > "$0/cgroup.procs" && exec "$@"', self.cgroup, *cmd]
+        return cmd
+
+    def release(self):
+        if self.cgroup:
+            cgroup, self.cgroup = self.cgroup, None
+            self.rate_changed.set()  # lets the io.max writer exit
+            self._sudo_sh('rmdir "$1"', cgroup)
+
+    def watch(self, job_paths, should_stop):
+        """AIMD loop: halve the rate when other disks see high latency, grow it back slowly."""
+        if not self.adaptive:
+            return
+        own = {block_name(p) for p in job_paths if is_block_device(p)}
+        previous = {}
+        peak = 0
+        while not should_stop():
+            time.sleep(1)
+            worst = 0.0
+            throughput = 0
+            for name in os.listdir("/sys/block"):
+                stat_fields = read_block_stat(name)
+                if not stat_fields or len(stat_fields) < 8:
+                    continue
+                before = previous.get(name)
+                previous[name] = stat_fields
+                if not before:
+                    continue
+                if name in own:
+                    throughput += (stat_fields[2] - before[2] + stat_fields[6] - before[6]) * 512
+                    continue
+                ios = stat_fields[0] - before[0] + stat_fields[4] - before[4]
+                if ios > 0:
+                    ticks = stat_fields[3] - before[3] + stat_fields[7] - before[7]
+                    worst = max(worst, ticks / ios)
+            peak = max(peak, throughput)
+            rate = self.limiter.rate
+            if worst > ADAPTIVE_LATENCY_MS:
+                base = rate if rate > 0 else max(throughput, ADAPTIVE_MIN_RATE)
+                self.set_rate(max(ADAPTIVE_MIN_RATE, base // 2))
+            elif rate > 0:
+                rate = int(rate * 1.25)
+                if self.max_rate:
+                    rate = min(rate, self.max_rate)
+                elif peak and rate >= 2 * peak:
+                    rate = 0
+                self.set_rate(rate)
+
+def stream_copy(src, dest, progress=None, should_stop=None, limiter=None):
+    chunks = read_chunks(src, COPY_CHUNK, should_stop)
+    if limiter:
+        chunks = throttled(chunks, limiter)
+    return write_stream(chunks, dest, progress)
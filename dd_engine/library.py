@@ -0,0 +1,221 @@
+import threading
+import os
+import json
+import select
+import ctypes
+import sqlite3
+
+from . import DATA_DIR
+from .metrics import write_atomic
+from .partitions import read_partition_table
+from .qcow2 import QCOW2_MAGIC
+from .store import MANIFEST_SUFFIX
+from .verify import ChecksumCache, source_checksums
+
+# Indexed image library for the File to Disk source picker
+LIBRARY_DB = os.path.join(DATA_DIR, "library.sqlite")
+LIBRARY_CONFIG = os.path.join(DATA_DIR, "library.json")
+LIBRARY_EXTENSIONS = (".img", ".iso", ".raw", ".bin", ".qcow2", ".gz", ".xz", ".zst", ".bz2", MANIFEST_SUFFIX)
+LIBRARY_RESCAN_SECONDS = 300
+COMPRESSED_MAGICS = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"BZh", "bzip2"),
+]
+IN_CREATE, IN_DELETE, IN_CLOSE_WRITE = 0x100, 0x200, 0x8
+IN_MOVED_FROM, IN_MOVED_TO = 0x40, 0x80
+
+def detect_image_format(path):
+    if path.endswith(MANIFEST_SUFFIX):
+        return "manifest"
+    with open(path, "rb") as f:
+        head = f.read(8)
+        if head.startswith(QCOW2_MAGIC):
+            return "qcow2"
+        for magic, name in COMPRESSED_MAGICS:
+            if head.startswith(magic):
+                return name
+        f.seek(0x8001)
+        if f.read(5) == b"CD001":
+            return "iso"
+    return "raw"
+
+def inspect_image_file(path):
+    """Cheap metadata from the image headers: format, ISO label, partition layout."""
+    image_format = detect_image_format(path)
+    label = ""
+    layout = None
+    if image_format in ("raw", "iso"):
+        with open(path, "rb") as f:
+            if image_format == "iso":
+                f.seek(0x8028)
+                label = f.read(32).decode("ascii", "ignore").strip()
+            layout = read_partition_table(f)
+    return {"format": image_format, "label": label, "layout": layout}
+
+def inotify_wait(directories, timeout, wake_fd=None):
+    """Block until something changes in one of the directories, wake_fd becomes readable or timeout expires.
+
+    Returns False when inotify is unavailable (the caller then simply polls).
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return False
+    if fd < 0:
+        return False
+    try:
+        mask = IN_CREATE | IN_DELETE | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        for directory in directories:
+            for root, _, _ in os.walk(directory):
+                libc.inotify_add_watch(fd, root.encode(), mask)
+        watched = [fd] if wake_fd is None else [fd, wake_fd]
+        readable, _, _ = select.select(watched, [], [], timeout)
+        for ready in readable:
+            try:
+                os.read(ready, 65536)
+            except BlockingIOError:
+                pass
+        return True
+    finally:
+        os.close(fd)
+
+class ImageLibrary:
+    """On-disk index of the images in the configured directories.
+
+    Entries are keyed by path and invalidated when (inode, size, mtime)
+    change; content hashes are filled in afterwards by the scanner thread.
+    """
+
+    def __init__(self, db_path=LIBRARY_DB, config_path=LIBRARY_CONFIG, checksums=None):
+        self.db_path = db_path
+        self.config_path = config_path
+        self.checksums = checksums or ChecksumCache()
+        self.stop = threading.Event()
+        self.rescan = threading.Event()
+        # Self-pipe so add_directory and shutdown can interrupt the inotify select
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+
+    def wake(self):
+        try:
+            os.write(self.wake_w, b"\0")
+        except BlockingIOError:
+            pass  # pipe already full, the scanner is due to wake anyway
+
+    def shutdown(self):
+        self.stop.set()
+        self.rescan.set()
+        self.wake()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS images (
+            path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER,
+            format TEXT, label TEXT, layout TEXT, sha256 TEXT)""")
+        return conn
+
+    def directories(self):
+        try:
+            with open(self.config_path) as f:
+                return json.load(f).get("directories", [])
+        except (OSError, ValueError):
+            return []
+
+    def add_directory(self, directory):
+        directories = self.directories()
+        if directory not in directories:
+            directories.append(directory)
+            write_atomic(self.config_path, json.dumps({"directories": directories}))
+        self.rescan.set()
+        self.wake()
+
+    def entries(self):
+        conn = self._connect()
+        rows = conn.execute("SELECT path, size, format, label, layout, sha256 FROM images ORDER BY path").fetchall()
+        conn.close()
+        return [{"path": path, "size": size, "format": image_format, "label": label,
+                 "layout": json.loads(layout) if layout else None, "sha256": sha256}
+                for path, size, image_format, label, layout, sha256 in rows]
+
+    def scan(self):
+        """Index new and changed images, drop vanished ones; True if anything changed."""
+        changed = False
+        conn = self._connect()
+        known = {path: (inode, size, mtime_ns) for path, inode, size, mtime_ns
+                 in conn.execute("SELECT path, inode, size, mtime_ns FROM images")}
+        seen = set()
+        for directory in self.directories():
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    if not name.lower().endswith(LIBRARY_EXTENSIONS):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                        seen.add(path)
+                        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+                        if known.get(path) == key:
+                            continue
+                        meta = inspect_image_file(path)
+                    except OSError:
+                        continue
+                    with conn:
+                        conn.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                                     (path, *key, meta["format"], meta["label"], json.dumps(meta["layout"])))
+                    changed = True
+        for path in set(known) - seen:
+            with conn:
+                conn.execute("DELETE FROM images WHERE path = ?", (path,))
+            changed = True
+        conn.close()
+        return changed
+
+    def hash_pending(self):
+        conn = self._connect()
+        pending = conn.execute("SELECT path, inode, size, mtime_ns FROM images WHERE sha256 IS NULL").fetchall()
+        changed = False
+        for path, inode, size, mtime_ns in pending:
+            if self.stop.is_set() or self.rescan.is_set():
+                break
+            try:
+                # Goes through the checksum cache, so later verifies find the reference hashes
+                result = source_checksums(path, self.checksums,
+                                          should_stop=lambda: self.stop.is_set() or self.rescan.is_set())
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest = result[0] if result else None
+            if digest and (st.st_ino, st.st_size, st.st_mtime_ns) == (inode, size, mtime_ns):
+                with conn:
+                    conn.execute("UPDATE images SET sha256 = ? WHERE path = ?", (digest, path))
+                changed = True
+        conn.close()
+        return changed
+
+    def run(self, on_change=None):
+        # Scanner thread: scan, hash, then sleep until inotify fires or the rescan interval passes
+        while not self.stop.is_set():
+            self.rescan.clear()
+            try:
+                os.read(self.wake_r, 65536)  # drop wakeups this pass already covers
+            except BlockingIOError:
+                pass
+            if self.scan() and on_change:
+                on_change()
+            if self.hash_pending() and on_change:
+                on_change()
+            if self.rescan.is_set():
+                continue
+            directories = [d for d in self.directories() if os.path.isdir(d)]
+            if not directories or not inotify_wait(directories, LIBRARY_RESCAN_SECONDS, self.wake_r):
+                self.rescan.wait(LIBRARY_RESCAN_SECONDS)
+            else:
+                self.rescan.wait(2)  # let copies finish before rescanning
+
+    def start(self, on_change=None):
+        threading.Thread(target=self.run, args=(on_change,), daemon=True).start()
@@ -0,0 +1,130 @@
+import subprocess
+import re
+import os
+import json
+
+from . import DATA_DIR
+from .metrics import write_atomic
+
+# LUKS parameters from a `cryptsetup benchmark` run once per host
+LUKS_BENCHMARK = os.path.join(DATA_DIR, "luks_benchmark.json")
+LUKS_UNLOCK_MS = 2000
+LUKS_MIN_MEMORY_KB = 32 * 1024
+ARGON2_MIN_ITERATIONS = 4
+CIPHER_LINE = re.compile(r"^\s*(\S+)\s+(\d+)b\s+([\d.]+)\s+MiB/s\s+([\d.]+)\s+MiB/s")
+ARGON2_LINE = re.compile(r"^(argon2id?)\s+(\d+) iterations, (\d+) memory, (\d+) parallel threads.*requested (\d+) ms")
+
+def cpu_flags():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("flags", "Features")):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def luks_host_key():
+    # Results stay valid until the machine, CPU or cryptsetup changes
+    parts = []
+    for path in ("/etc/machine-id", "/proc/sys/kernel/hostname"):
+        try:
+            with open(path) as f:
+                parts.append(f.read().strip())
+        except OSError:
+            parts.append("")
+    try:
+        with open("/proc/cpuinfo") as f:
+            parts.append(next((l.split(":", 1)[1].strip() for l in f if l.startswith("model name")), ""))
+    except OSError:
+        parts.append("")
+    try:
+        version = subprocess.run(["cryptsetup", "--version"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        version = ""
+    return "|".join(parts + [version])
+
+def parse_cryptsetup_benchmark(text):
+    result = {"ciphers": [], "argon2id": None}
+    for line in text.splitlines():
+        match = CIPHER_LINE.match(line)
+        if match:
+            name, bits, enc, dec = match.groups()
+            result["ciphers"].append({"name": name, "key_bits": int(bits),
+                                      "encrypt": float(enc), "decrypt": float(dec)})
+            continue
+        match = ARGON2_LINE.match(line)
+        if match and match.group(1) == "argon2id":
+            iterations, memory, threads, ms = (int(v) for v in match.groups()[1:])
+            result["argon2id"] = {"iterations": iterations, "memory_kb": memory,
+                                  "threads": threads, "time_ms": ms}
+    return result
+
+def luks_benchmark(refresh=False):
+    """Benchmark results for this host, from the cache when it still applies."""
+    key = luks_host_key()
+    if not refresh:
+        try:
+            with open(LUKS_BENCHMARK) as f:
+                cached = json.load(f)
+            if cached.get("host") == key:
+                return cached
+        except (OSError, ValueError):
+            pass
+    try:
+        output = subprocess.run(["cryptsetup", "benchmark"], capture_output=True, text=True).stdout
+    except OSError:
+        return None
+    result = parse_cryptsetup_benchmark(output)
+    if not result["ciphers"]:
+        return None
+    result["host"] = key
+    result["aes_ni"] = "aes" in cpu_flags()
+    os.makedirs(DATA_DIR, exist_ok=True)
+    write_atomic(LUKS_BENCHMARK, json.dumps(result, indent=1))
+    return result
+
+def luks_cipher_name(name):
+    # Benchmark rows name the mode; luksFormat wants the IV generator too
+    return f"{name}-plain64"
+
+def luks_cipher_choices(bench):
+    """Usable (cipher, key bits, MiB/s) rows, fastest first.
+
+    CBC rows are left out (ESSIV watermarking); on CPUs with AES-NI only
+    AES modes are offered since those are the accelerated ones.
+    """
+    rows = [c for c in bench["ciphers"] if c["name"].endswith(("-xts", "-adiantum"))]
+    if bench.get("aes_ni"):
+        rows = [c for c in rows if c["name"].startswith("aes-")] or rows
+    rows.sort(key=lambda c: min(c["encrypt"], c["decrypt"]), reverse=True)
+    return [(luks_cipher_name(c["name"]), c["key_bits"], min(c["encrypt"], c["decrypt"])) for c in rows]
+
+def tune_pbkdf(bench, target_ms=LUKS_UNLOCK_MS):
+    """Argon2id cost that takes about target_ms to unlock on this host.
+
+    Cost scales with iterations times memory; iterations go down to the
+    minimum first, then memory is reduced.
+    """
+    argon = bench and bench.get("argon2id")
+    if not argon:
+        return None
+    scaled = argon["iterations"] * target_ms / argon["time_ms"]
+    if scaled >= ARGON2_MIN_ITERATIONS:
+        iterations, memory = round(scaled), argon["memory_kb"]
+    else:
+        iterations = ARGON2_MIN_ITERATIONS
+        memory = max(LUKS_MIN_MEMORY_KB, int(argon["memory_kb"] * scaled / ARGON2_MIN_ITERATIONS))
+    return {"iterations": iterations, "memory_kb": memory, "threads": argon["threads"]}
+
+def luks_format_command(device, cipher=None, key_bits=None, pbkdf=None):
+    # The passphrase is fed on stdin (--key-file -), so no confirmation prompt is needed
+    cmd = ["cryptsetup", "luksFormat", "--batch-mode", "--type", "luks2"]
+    if cipher:
+        cmd += ["--cipher", cipher, "--key-size", str(key_bits)]
+    if pbkdf:
+        cmd += ["--pbkdf", "argon2id",
+                "--pbkdf-force-iterations", str(pbkdf["iterations"]),
+                "--pbkdf-memory", str(pbkdf["memory_kb"]),
+                "--pbkdf-parallel", str(pbkdf["threads"])]
+    return cmd + ["--key-file", "-", device]
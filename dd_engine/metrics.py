@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from datetime import datetime
+
+from . import DATA_DIR
+
+# Metrics for monitoring: node-exporter textfile + JSON-lines operation log
+METRICS_STATE = os.path.join(DATA_DIR, "metrics.json")
+METRICS_TEXTFILE_DIR = os.environ.get("DD_GUI_TEXTFILE_DIR", "/var/lib/prometheus/node-exporter")
+OPERATION_LOG = os.path.join(DATA_DIR, "operations.jsonl")
+OPERATION_LOG_MAX_BYTES = 5 * 1024 * 1024
+OPERATION_LOG_BACKUPS = 5
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+THROUGHPUT_BUCKETS = [1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6, 500e6, 1e9, 2e9]
+
+def write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb" if isinstance(text, bytes) else "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def new_histogram(buckets):
+    return {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+
+def observe_histogram(hist, bounds, value):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            hist["buckets"][i] += 1
+            break
+    hist["sum"] += value
+    hist["count"] += 1
+
+def merge_histogram(total, part):
+    total["buckets"] = [a + b for a, b in zip(total["buckets"], part["buckets"])]
+    total["sum"] += part["sum"]
+    total["count"] += part["count"]
+
+class JobMetrics:
+    """Per-job counters; a "chunk" is the span between two progress updates."""
+
+    def __init__(self, operation, device, reads=True, writes=True):
+        self.operation = operation
+        self.device = device
+        self.reads = reads
+        self.writes = writes
+        self.started = time.time()
+        self.bytes_done = 0
+        self.bytes_verified = 0
+        self.errors = 0
+        self.latency = new_histogram(LATENCY_BUCKETS)
+        self.throughput = new_histogram(THROUGHPUT_BUCKETS)
+        self.last = None
+
+    def observe(self, done_bytes):
+        now = time.monotonic()
+        if self.last and done_bytes > self.last[1]:
+            seconds = now - self.last[0]
+            observe_histogram(self.latency, LATENCY_BUCKETS, seconds)
+            if seconds > 0:
+                observe_histogram(self.throughput, THROUGHPUT_BUCKETS, (done_bytes - self.last[1]) / seconds)
+        if not self.last or done_bytes > self.last[1]:
+            self.last = (now, done_bytes)
+        self.bytes_done = max(self.bytes_done, done_bytes)
+
+    def add_verified(self, nbytes):
+        self.bytes_verified += nbytes
+
+    def add_error(self):
+        self.errors += 1
+
+class MetricsExporter:
+    def __init__(self, state_path=METRICS_STATE, textfile_dir=METRICS_TEXTFILE_DIR, log_path=OPERATION_LOG):
+        self.state_path = state_path
+        self.textfile = os.path.join(textfile_dir, "dd_gui.prom")
+        self.log_path = log_path
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"counters": {"bytes_read": 0, "bytes_written": 0, "bytes_verified": 0, "errors": 0},
+                    "jobs": {}, "latency": {}, "throughput": {}, "last_throughput": {}}
+
+    def record_job(self, job, outcome):
+        seconds = time.time() - job.started
+        state = self._load_state()
+        counters = state["counters"]
+        counters["bytes_read"] += job.bytes_done if job.reads else 0
+        counters["bytes_written"] += job.bytes_done if job.writes else 0
+        counters["bytes_verified"] += job.bytes_verified
+        counters["errors"] += job.errors + (outcome == "failed")
+        key = "|".join((job.operation, job.device, outcome))
+        state["jobs"][key] = state["jobs"].get(key, 0) + 1
+        for name, bounds in (("latency", LATENCY_BUCKETS), ("throughput", THROUGHPUT_BUCKETS)):
+            total = state[name].setdefault(job.operation, new_histogram(bounds))
+            merge_histogram(total, getattr(job, name))
+        if outcome == "success" and seconds > 0:
+            state["last_throughput"][f"{job.operation}|{job.device}"] = job.bytes_done / seconds
+
+        try:
+            write_atomic(self.state_path, json.dumps(state))
+        except OSError as e:
+            print(f"Error saving metrics state: {e}")
+        try:
+            write_atomic(self.textfile, self.render(state))
+        except OSError:
+            pass  # no node-exporter textfile directory on this machine
+        self.log({
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "operation": job.operation,
+            "device": job.device,
+            "outcome": outcome,
+            "bytes": job.bytes_done,
+            "bytes_verified": job.bytes_verified,
+            "errors": job.errors,
+            "seconds": round(seconds, 3),
+            "throughput": job.bytes_done / seconds if seconds > 0 else 0,
+            "latency": job.latency,
+            "throughput_histogram": job.throughput,
+        })
+
+    def log(self, entry):
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > OPERATION_LOG_MAX_BYTES:
+                for i in range(OPERATION_LOG_BACKUPS - 1, 0, -1):
+                    if os.path.exists(f"{self.log_path}.{i}"):
+                        os.replace(f"{self.log_path}.{i}", f"{self.log_path}.{i + 1}")
+                os.replace(self.log_path, f"{self.log_path}.1")
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing operation log: {e}")
+
+    @staticmethod
+    def render(state):
+        lines = []
+        counters = state["counters"]
+        for name, help_text in (("bytes_read", "Bytes read by disk operations"),
+                                ("bytes_written", "Bytes written by disk operations"),
+                                ("bytes_verified", "Bytes verified after disk operations"),
+                                ("errors", "Failed disk operations and I/O errors")):
+            lines += [f"# HELP dd_gui_{name}_total {help_text}.",
+                      f"# TYPE dd_gui_{name}_total counter",
+                      f"dd_gui_{name}_total {counters[name]}"]
+        lines += ["# HELP dd_gui_jobs_total Finished jobs by operation, device and outcome.",
+                  "# TYPE dd_gui_jobs_total counter"]
+        for key, count in sorted(state["jobs"].items()):
+            operation, device, outcome = key.split("|")
+            lines.append(f'dd_gui_jobs_total{{operation="{operation}",device="{device}",outcome="{outcome}"}} {count}')
+        lines += ["# HELP dd_gui_last_job_throughput_bytes_per_second Average throughput of the last successful job.",
+                  "# TYPE dd_gui_last_job_throughput_bytes_per_second gauge"]
+        for key, value in sorted(state["last_throughput"].items()):
+            operation, device = key.split("|")
+            lines.append(f'dd_gui_last_job_throughput_bytes_per_second{{operation="{operation}",device="{device}"}} {value:.0f}')
+        for name, metric, bounds, help_text in (
+                ("latency", "dd_gui_chunk_latency_seconds", LATENCY_BUCKETS, "Time between progress updates."),
+                ("throughput", "dd_gui_chunk_throughput_bytes_per_second", THROUGHPUT_BUCKETS,
+                 "Throughput between progress updates.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for operation, hist in sorted(state[name].items()):
+                cumulative = 0
+                for bound, count in zip(bounds, hist["buckets"]):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{operation="{operation}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{operation="{operation}",le="+Inf"}} {hist["count"]}')
+                lines.append(f'{metric}_sum{{operation="{operation}"}} {hist["sum"]}')
+                lines.append(f'{metric}_count{{operation="{operation}"}} {hist["count"]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,118 @@
+import os
+
+from .devices import block_name, read_queue_attr, sysfs_size
+from .units import ceil_div
+
+# Filesystem tuning from the block device's I/O topology
+FLASH_ERASE_BLOCK = 4 * 1024 * 1024  # typical SD/USB allocation unit when the device does not say
+FS_BLOCK = 4096
+
+def read_sysfs_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+def device_topology(path):
+    """I/O sizes, erase block and partition offset of a disk or partition, in bytes."""
+    node = os.path.basename(os.path.realpath(path))
+    name = block_name(path) or node
+    topology = {
+        "logical": read_queue_attr(name, "logical_block_size") or 512,
+        "physical": read_queue_attr(name, "physical_block_size") or 512,
+        "min_io": read_queue_attr(name, "minimum_io_size"),
+        "opt_io": read_queue_attr(name, "optimal_io_size"),
+        "rotational": bool(read_queue_attr(name, "rotational")),
+        "removable": bool(read_sysfs_int(f"/sys/block/{name}/removable")),
+        "start": read_sysfs_int(f"/sys/class/block/{node}/start") * 512,
+        "size": sysfs_size(path),
+    }
+    # eMMC/SD through an MMC host report the erase size; card readers do not
+    erase = read_sysfs_int(f"/sys/block/{name}/device/preferred_erase_size")
+    if not erase:
+        granularity = read_queue_attr(name, "discard_granularity")
+        erase = granularity if granularity >= 64 * 1024 else 0
+    if not erase and not topology["rotational"]:
+        erase = FLASH_ERASE_BLOCK
+    topology["erase"] = erase
+    topology["align"] = max(erase, topology["opt_io"], topology["min_io"], FS_BLOCK)
+    return topology
+
+def fat_cluster_size(fs_type, topology):
+    size = topology["size"]
+    cluster = 32 * 1024 if not topology["rotational"] else max(FS_BLOCK, topology["min_io"])
+    if fs_type == "fat32":
+        while cluster > 512 and size // cluster < 65525:  # below that it is not FAT32
+            cluster //= 2
+    else:
+        while cluster < 64 * 1024 and size // cluster > 65524:
+            cluster *= 2
+    return cluster
+
+def fat_data_start(fs_type, sectors, sector_size, cluster_sectors, reserved):
+    """Sector where mkfs.fat (with its default alignment) starts the data area."""
+    align = lambda n: ceil_div(n, cluster_sectors) * cluster_sectors
+    reserved = align(reserved)
+    if fs_type == "fat32":
+        data = sectors - reserved
+        clusters = (data * sector_size + 2 * 8) // (cluster_sectors * sector_size + 2 * 4)
+        fat = align(ceil_div((clusters + 2) * 4, sector_size))
+        return reserved + 2 * fat
+    root = align(512 * 32 // sector_size)
+    data = sectors - root - reserved
+    clusters = (data * sector_size + 2 * 4) // (cluster_sectors * sector_size + 2 * 2)
+    fat = align(ceil_div((clusters + 2) * 2, sector_size))
+    return reserved + 2 * fat + root
+
+def fat_reserved_sectors(fs_type, topology, cluster):
+    """Reserved sector count that puts the FAT data area on an erase-block boundary."""
+    sector = topology["logical"]
+    sectors = topology["size"] // sector
+    cluster_sectors = cluster // sector
+    first = 32 if fs_type == "fat32" else 1
+    for reserved in range(first, first + 2 * topology["align"] // sector + cluster_sectors, cluster_sectors):
+        data_start = fat_data_start(fs_type, sectors, sector, cluster_sectors, reserved)
+        if (topology["start"] + data_start * sector) % topology["align"] == 0:
+            return ceil_div(reserved, cluster_sectors) * cluster_sectors
+    return None
+
+def mkfs_tuning(fs_type, topology, lazy_init=True, nodiscard=False):
+    """Extra mkfs arguments for the device topology, plus a one-line summary."""
+    if fs_type.startswith("ext"):
+        stride = max(1, topology["min_io"] // FS_BLOCK)
+        stripe = topology["opt_io"] // FS_BLOCK
+        if not stripe and not topology["rotational"]:
+            stripe = topology["erase"] // FS_BLOCK
+        extended = []
+        if stride > 1 or stripe > 1:
+            extended += [f"stride={stride}", f"stripe_width={max(stripe, stride)}"]
+        if lazy_init:
+            extended.append("lazy_itable_init=1")
+            if fs_type != "ext2":
+                extended.append("lazy_journal_init=1")
+        if nodiscard:
+            extended.append("nodiscard")
+        args = ["-b", str(FS_BLOCK)] + (["-E", ",".join(extended)] if extended else [])
+        return args, f"4 KiB blocks, stride {stride}, stripe width {max(stripe, stride)} blocks"
+    if fs_type.startswith("fat"):
+        cluster = fat_cluster_size(fs_type, topology)
+        args = ["-s", str(cluster // topology["logical"]), "-h", str(topology["start"] // topology["logical"])]
+        reserved = fat_reserved_sectors(fs_type, topology, cluster)
+        if reserved is not None:
+            args += ["-R", str(reserved)]
+        return args, (f"{cluster // 1024} KiB clusters, data area aligned to "
+                      f"{topology['align'] // 1024} KiB" if reserved is not None else
+                      f"{cluster // 1024} KiB clusters")
+    if fs_type == "exfat":
+        cluster = 128 * 1024 if topology["size"] > 32 * 1024 ** 3 else 32 * 1024
+        return (["-c", str(cluster), "-b", str(topology["align"])],
+                f"{cluster // 1024} KiB clusters, aligned to {topology['align'] // 1024} KiB")
+    if fs_type == "btrfs":
+        # Duplicated metadata doubles writes on removable flash; keep it on disks and SSDs
+        metadata = "single" if topology["removable"] and not topology["rotational"] else "dup"
+        args = ["-s", str(FS_BLOCK), "-d", "single", "-m", metadata]
+        if nodiscard:
+            args.append("-K")
+        return args, f"data single, metadata {metadata}"
+    return [], ""
@@ -0,0 +1,38 @@
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .devices import is_rotational
+
+# Independent jobs (partitions, offsets, sample reads) side by side where the disks allow it
+def parallel_workers(paths, jobs):
+    # Concurrent streams only pay off where seeks are free
+    if any(is_rotational(path) for path in paths if os.path.exists(path)):
+        return 1
+    return max(1, min(jobs, os.cpu_count() or 1, 4))
+
+def run_parallel(tasks, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(task) for task in tasks]
+        for future in futures:
+            future.result()
+
+class SharedProgress:
+    """Sums progress from several worker threads into one callback."""
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.done = 0
+
+    def add(self, n):
+        with self.lock:
+            self.done += n
+            done = self.done
+        if self.progress:
+            self.progress(done)
+
+    def counted(self, chunks):
+        for data in chunks:
+            self.add(len(data))
+            yield data
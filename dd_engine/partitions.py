@@ -0,0 +1,180 @@
+import os
+import fcntl
+import struct
+import uuid
+import zlib
+
+from .devices import read_at, read_chunks
+from .units import ceil_div
+
+# Partition tables (MBR and GPT), read from the first sectors only
+MBR_EXTENDED_TYPES = (0x05, 0x0F, 0x85)
+GPT_HEADER = struct.Struct("<8sIIIIQQQQ16sQIII")
+
+def read_partition_table(f):
+    """Parse the partition table of an open image or device.
+
+    Returns {"table": "gpt"|"msdos", "sector_size": n, "partitions": [...]}
+    with byte offsets, or None when there is no recognizable table.
+    """
+    f.seek(0)
+    mbr = f.read(512)
+    if len(mbr) < 512 or mbr[510:512] != b"\x55\xaa":
+        return None
+    entries = [struct.unpack_from("<B3sB3sII", mbr, 446 + 16 * i) for i in range(4)]
+    if any(entry[2] == 0xEE for entry in entries):
+        for sector_size in (512, 4096):
+            f.seek(sector_size)
+            header = f.read(GPT_HEADER.size)
+            if header[:8] == b"EFI PART":
+                return read_gpt(f, header, sector_size)
+
+    partitions = []
+    for number, (_, _, ptype, _, lba, sectors) in enumerate(entries, 1):
+        if ptype == 0 or sectors == 0:
+            continue
+        partitions.append({"number": number, "start": lba * 512, "size": sectors * 512,
+                           "type": f"0x{ptype:02x}"})
+        if ptype in MBR_EXTENDED_TYPES:
+            partitions += read_logical_partitions(f, lba)
+    return {"table": "msdos", "sector_size": 512, "partitions": partitions}
+
+def read_logical_partitions(f, extended_lba):
+    partitions = []
+    ebr_lba = extended_lba
+    number = 5
+    while ebr_lba and number < 128:
+        f.seek(ebr_lba * 512)
+        ebr = f.read(512)
+        if len(ebr) < 512 or ebr[510:512] != b"\x55\xaa":
+            break
+        _, _, ptype, _, lba, sectors = struct.unpack_from("<B3sB3sII", ebr, 446)
+        if ptype and sectors:
+            partitions.append({"number": number, "start": (ebr_lba + lba) * 512, "size": sectors * 512,
+                               "type": f"0x{ptype:02x}", "ebr": ebr_lba * 512})
+            number += 1
+        _, _, next_type, _, next_lba, _ = struct.unpack_from("<B3sB3sII", ebr, 462)
+        ebr_lba = extended_lba + next_lba if next_type else 0
+    return partitions
+
+def read_gpt(f, header, sector_size):
+    (_, _, header_size, _, _, current_lba, backup_lba, first_usable, last_usable, disk_guid,
+     entries_lba, entry_count, entry_size, _) = GPT_HEADER.unpack(header)
+    f.seek(entries_lba * sector_size)
+    data = f.read(entry_count * entry_size)
+    partitions = []
+    for i in range(entry_count):
+        offset = i * entry_size
+        type_guid = data[offset:offset + 16]
+        if len(type_guid) < 16 or type_guid == bytes(16):
+            continue
+        first, last = struct.unpack_from("<QQ", data, offset + 32)
+        name = data[offset + 56:offset + 128].decode("utf-16-le", "ignore").rstrip("\0")
+        partitions.append({"number": i + 1, "start": first * sector_size,
+                           "size": (last - first + 1) * sector_size,
+                           "type": str(uuid.UUID(bytes_le=type_guid)), "name": name})
+    return {
+        "table": "gpt",
+        "sector_size": sector_size,
+        "partitions": partitions,
+        "gpt": {"header_size": header_size, "backup_lba": backup_lba, "first_usable": first_usable,
+                "last_usable": last_usable, "disk_guid": str(uuid.UUID(bytes_le=disk_guid)),
+                "entries_lba": entries_lba, "entry_count": entry_count, "entry_size": entry_size},
+    }
+
+# Images that end with the last partition; GPT gets its backup header moved to the new end
+BLKRRPART = 0x125F
+
+def trimmed_size(table):
+    """Bytes an image needs to hold every partition, plus the relocated backup GPT."""
+    sector = table["sector_size"]
+    end = max((p["start"] + p["size"] for p in table["partitions"]), default=sector)
+    if table["table"] == "gpt":
+        gpt = table["gpt"]
+        end = max(end, gpt["first_usable"] * sector)
+        end += (ceil_div(gpt["entry_count"] * gpt["entry_size"], sector) + 1) * sector
+    return ceil_div(end, sector) * sector
+
+def gpt_relocation(f, table, total_sectors):
+    """[(offset, bytes)] that make the GPT of f describe a disk of total_sectors.
+
+    The protective MBR and the primary header get the new size; the backup
+    entries and header are written at the new end. The partition entries
+    themselves are unchanged, so their CRC stays valid.
+    """
+    sector = table["sector_size"]
+    gpt = table["gpt"]
+    entries = read_at(f, gpt["entries_lba"] * sector, gpt["entry_count"] * gpt["entry_size"])
+    entry_sectors = ceil_div(len(entries), sector)
+    backup_lba = total_sectors - 1
+    backup_entries_lba = backup_lba - entry_sectors
+    header = read_at(f, sector, gpt["header_size"])
+
+    def sealed(current_lba, other_lba, entries_lba):
+        h = bytearray(header)
+        struct.pack_into("<IIQQ", h, 16, 0, 0, current_lba, other_lba)
+        struct.pack_into("<Q", h, 48, backup_entries_lba - 1)  # last usable LBA
+        struct.pack_into("<Q", h, 72, entries_lba)
+        struct.pack_into("<I", h, 16, zlib.crc32(h))
+        return bytes(h).ljust(sector, b"\0")
+
+    mbr = bytearray(read_at(f, 0, 512))
+    for i in range(4):
+        if mbr[446 + 16 * i + 4] == 0xEE:
+            struct.pack_into("<I", mbr, 446 + 16 * i + 12, min(total_sectors - 1, 0xFFFFFFFF))
+    return [
+        (0, bytes(mbr)),
+        (sector, sealed(1, backup_lba, gpt["entries_lba"])),
+        (backup_entries_lba * sector, entries.ljust(entry_sectors * sector, b"\0")),
+        (backup_lba * sector, sealed(backup_lba, 1, backup_entries_lba)),
+    ]
+
+def patched(chunks, patches):
+    offset = 0
+    for data in chunks:
+        end = offset + len(data)
+        hits = [(pos, blob) for pos, blob in patches if pos < end and pos + len(blob) > offset]
+        if hits:
+            data = bytearray(data)
+            for pos, blob in hits:
+                lo, hi = max(pos, offset), min(pos + len(blob), end)
+                data[lo - offset:hi - offset] = blob[lo - pos:hi - pos]
+        offset = end
+        yield data
+
+def trimmed_stream(path, table, size, chunk_size, should_stop=None):
+    """The first size bytes of path, with the GPT relocated to fit them."""
+    patches = []
+    if table["table"] == "gpt":
+        with open(path, "rb") as f:
+            patches = gpt_relocation(f, table, size // table["sector_size"])
+    return patched(read_chunks(path, chunk_size, should_stop, limit=size), patches)
+
+def fit_gpt_to_device(path):
+    """Move the backup GPT to the end of the device when it sits elsewhere,
+    e.g. after writing an image of a different size.
+
+    Returns True when the table was rewritten.
+    """
+    with open(path, "r+b") as f:
+        table = read_partition_table(f)
+        if not table or table["table"] != "gpt":
+            return False
+        sector = table["sector_size"]
+        total_sectors = f.seek(0, os.SEEK_END) // sector
+        gpt = table["gpt"]
+        if gpt["backup_lba"] == total_sectors - 1:
+            return False
+        last_usable = total_sectors - ceil_div(gpt["entry_count"] * gpt["entry_size"], sector) - 2
+        if any(p["start"] + p["size"] > (last_usable + 1) * sector for p in table["partitions"]):
+            return False
+        for offset, blob in gpt_relocation(f, table, total_sectors):
+            f.seek(offset)
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+        try:
+            fcntl.ioctl(f.fileno(), BLKRRPART)  # let the kernel see the new size; fails on files or while in use
+        except OSError:
+            pass
+    return True
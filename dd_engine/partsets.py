@@ -0,0 +1,314 @@
+import os
+import stat
+import errno
+import fcntl
+import json
+import struct
+import ctypes
+from functools import partial
+
+from .devices import COPY_CHUNK, device_size, is_block_device, open_for_write, pwrite_full, read_at
+from .discard import BLKZEROOUT, is_zero
+from .filesystems import (EXT4_BLOCK_UNINIT, EXT4_INCOMPAT_META_BG, exfat_allocation, ext_groups,
+                          ext_superblock, fat_allocation, inspect_filesystem)
+from .metrics import write_atomic
+from .parallel import SharedProgress, parallel_workers, run_parallel
+from .partitions import MBR_EXTENDED_TYPES, fit_gpt_to_device, read_partition_table
+from .qcow2 import qcow2_stream, write_qcow2
+from .units import ceil_div, format_size
+
+# Partition sets: a directory with the table regions and one image per partition
+PARTITION_SET_LAYOUT = "layout.json"
+PARTITION_SET_TABLE = "table.bin"
+PARTITION_ENCODINGS = {"used blocks": ".img", "sparse": ".img", "qcow2": ".qcow2", "qcow2 (compressed)": ".qcow2"}
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
+def read_range(path, offset, length, chunk_size, should_stop=None):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        end = offset + length
+        while offset < end:
+            if should_stop and should_stop():
+                return
+            data = os.pread(fd, min(chunk_size, end - offset), offset)
+            if not data:
+                return
+            offset += len(data)
+            yield data
+    finally:
+        os.close(fd)
+
+def merge_ranges(ranges, limit=None):
+    merged = []
+    for start, length in sorted(ranges):
+        end = start + length if limit is None else min(start + length, limit)
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end - start) for start, end in merged]
+
+def nonzero_ranges(data, scale, base, granule=64):
+    """Byte ranges whose allocation entries in data are not all zero.
+
+    Each byte of data covers scale bytes of the volume; the result is
+    coarsened to granule bytes of data, which is what keeps this fast.
+    """
+    zero = bytes(granule)
+    ranges = []
+    for i in range(0, len(data), granule):
+        piece = data[i:i + granule]
+        if piece != zero[:len(piece)]:
+            ranges.append((base + i * scale, len(piece) * scale))
+    return merge_ranges(ranges)
+
+def ext_has_super(group, sparse_super):
+    if not sparse_super or group <= 1:
+        return True
+    for base in (3, 5, 7):
+        n = base
+        while n < group:
+            n *= base
+        if n == group:
+            return True
+    return False
+
+def allocated_ranges(f, start, size):
+    """Byte ranges (relative to start) a filesystem uses, or None when unknown."""
+    geometry = ext_superblock(f, start)
+    if geometry:
+        if geometry["incompat"] & EXT4_INCOMPAT_META_BG:
+            return None
+        block = geometry["block"]
+        backup = 1 + ceil_div(geometry["groups"] * geometry["desc_size"], block) + geometry["reserved_gdt"]
+        flex_bg = geometry["incompat"] & 0x200
+        ranges = [(0, (geometry["first_data_block"] + 1) * block)]
+        for group, (first, in_group, group_free, bitmap_block, flags) in enumerate(ext_groups(f, start, geometry)):
+            if flags & EXT4_BLOCK_UNINIT:
+                # Uninitialized bitmap: only superblock/GDT backups (and, without flex_bg, the group's own metadata)
+                if not flex_bg:
+                    ranges.append((first * block, in_group * block))
+                elif ext_has_super(group, geometry["sparse_super"]):
+                    ranges.append((first * block, min(backup, in_group) * block))
+                continue
+            if group_free >= in_group:
+                continue
+            bitmap = read_at(f, start + bitmap_block * block, ceil_div(in_group, 8))
+            ranges += nonzero_ranges(bitmap, 8 * block, first * block)
+        return merge_ranges(ranges, min(size, geometry["blocks"] * block))
+    fat = fat_allocation(f, start)
+    if fat:
+        entries = fat["entries"]
+        ranges = [(0, fat["data_start"])]
+        ranges += nonzero_ranges(entries.tobytes(), fat["cluster"] // entries.itemsize, fat["data_start"])
+        return merge_ranges(ranges, min(size, fat["total"]))
+    exfat = exfat_allocation(f, start)
+    if exfat and exfat["bitmap"] is not None:
+        ranges = [(0, exfat["data_start"])]
+        ranges += nonzero_ranges(exfat["bitmap"], 8 * exfat["cluster"], exfat["data_start"])
+        return merge_ranges(ranges, min(size, exfat["total"]))
+    return None
+
+def table_regions(table, size):
+    """Byte ranges outside the partitions that belong to the table: everything
+    before the first partition, EBRs and the backup GPT."""
+    first = min(p["start"] for p in table["partitions"])
+    regions = [(0, first)]
+    regions += [(p["ebr"], 512) for p in table["partitions"] if "ebr" in p]
+    if table["table"] == "gpt":
+        sector = table["sector_size"]
+        gpt = table["gpt"]
+        entry_sectors = ceil_div(gpt["entry_count"] * gpt["entry_size"], sector)
+        if (gpt["backup_lba"] + 1) * sector <= size:
+            regions.append(((gpt["backup_lba"] - entry_sectors) * sector, (entry_sectors + 1) * sector))
+    return merge_ranges(regions, size)
+
+def plan_partition_image(source, encoding):
+    """What imaging source partition by partition will read, before reading it."""
+    with open(source, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        table = read_partition_table(f)
+        if not table or not table["partitions"]:
+            raise ValueError(f"No partition table on {source}")
+        partitions = []
+        for p in table["partitions"]:
+            if table["table"] == "msdos" and int(p["type"], 16) in MBR_EXTENDED_TYPES:
+                continue  # the container; its logical partitions are imaged on their own
+            ranges = allocated_ranges(f, p["start"], p["size"]) if encoding == "used blocks" else None
+            part_encoding = "sparse" if encoding == "used blocks" and ranges is None else encoding
+            partitions.append(dict(p, encoding=part_encoding, ranges=ranges,
+                                   fs=inspect_filesystem(f, p["start"], p["size"])["fs"],
+                                   file=f"part{p['number']}{PARTITION_ENCODINGS[part_encoding]}"))
+    return {
+        "source": source,
+        "size": size,
+        "table": table["table"],
+        "sector_size": table["sector_size"],
+        "regions": table_regions(table, size),
+        "partitions": partitions,
+        "read_bytes": sum(sum(n for _, n in p["ranges"]) if p["ranges"] is not None else p["size"]
+                          for p in partitions),
+    }
+
+def image_partition(source, directory, partition, progress, should_stop=None):
+    path = os.path.join(directory, partition["file"])
+    start, size = partition["start"], partition["size"]
+    if partition["encoding"].startswith("qcow2"):
+        chunks = progress.counted(read_range(source, start, size, COPY_CHUNK, should_stop))
+        write_qcow2(chunks, path, size, compress=partition["encoding"] == "qcow2 (compressed)")
+        return
+    # Raw with holes: unallocated ranges ("used blocks") and zero chunks are never written
+    ranges = partition["ranges"] if partition["ranges"] is not None else [(0, size)]
+    fd = open_for_write(path)
+    try:
+        os.ftruncate(fd, size)
+        for offset, length in ranges:
+            for data in progress.counted(read_range(source, start + offset, length, COPY_CHUNK, should_stop)):
+                if not is_zero(data):
+                    pwrite_full(fd, data, offset)
+                offset += len(data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def image_partitions(plan, directory, progress=None, should_stop=None, workers=None):
+    """Write plan's table regions and one image per partition into directory."""
+    source = plan["source"]
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, PARTITION_SET_TABLE), "wb") as out:
+        for offset, length in plan["regions"]:
+            out.write(b"".join(read_range(source, offset, length, COPY_CHUNK)))
+    shared = SharedProgress(progress)
+    workers = workers or parallel_workers([source, directory], len(plan["partitions"]))
+    run_parallel([partial(image_partition, source, directory, p, shared, should_stop)
+                  for p in plan["partitions"]], workers)
+    layout = {key: plan[key] for key in ("source", "size", "table", "sector_size", "regions")}
+    layout["version"] = 1
+    layout["partitions"] = plan["partitions"]
+    write_atomic(os.path.join(directory, PARTITION_SET_LAYOUT), json.dumps(layout, indent=1))
+    return layout
+
+def load_partition_set(directory):
+    with open(os.path.join(directory, PARTITION_SET_LAYOUT)) as f:
+        layout = json.load(f)
+    if layout.get("version") != 1:
+        raise ValueError(f"Unsupported partition set version {layout.get('version')}")
+    return layout
+
+def data_segments(fd, size):
+    """(offset, length, is_data) covering [0, size), from SEEK_DATA/SEEK_HOLE."""
+    offset = 0
+    while offset < size:
+        try:
+            data = min(os.lseek(fd, offset, os.SEEK_DATA), size)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+            data = size
+        if data > offset:
+            yield offset, data - offset, False
+        if data >= size:
+            return
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        yield data, hole - data, True
+        offset = hole
+
+LIBC = ctypes.CDLL(None, use_errno=True)
+
+def zero_range(fd, offset, length):
+    """Make a range read back as zeros: BLKZEROOUT on devices, a punched hole in files."""
+    if stat.S_ISBLK(os.fstat(fd).st_mode):
+        fcntl.ioctl(fd, BLKZEROOUT, struct.pack("QQ", offset, length))
+        return
+    if LIBC.fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
+                      ctypes.c_long(offset), ctypes.c_long(length)) == 0:
+        return
+    zero = bytes(COPY_CHUNK)
+    end = offset + length
+    while offset < end:
+        n = min(COPY_CHUNK, end - offset)
+        pwrite_full(fd, zero[:n], offset)
+        offset += n
+
+def allocated_holes(partition, offset, length):
+    """Parts of the image hole [offset, offset + length) that must read back as zeros."""
+    ranges = partition.get("ranges")
+    if partition["encoding"] != "used blocks" or ranges is None:
+        return [(offset, length)]  # sets written without their ranges: zero every hole
+    end = offset + length
+    return [(max(offset, r), min(end, r + n) - max(offset, r)) for r, n in ranges if r < end and r + n > offset]
+
+def restore_partition(directory, dest, partition, progress, should_stop=None):
+    path = os.path.join(directory, partition["file"])
+    start, size = partition["start"], partition["size"]
+    fd = open_for_write(dest, truncate=False)
+    try:
+        if partition["encoding"].startswith("qcow2"):
+            offset = 0
+            for data in progress.counted(qcow2_stream(path, should_stop)):
+                if is_zero(data):
+                    zero_range(fd, start + offset, len(data))
+                else:
+                    pwrite_full(fd, data, start + offset)
+                offset += len(data)
+        else:
+            with open(path, "rb") as f:
+                for offset, length, is_data in data_segments(f.fileno(), size):
+                    if should_stop and should_stop():
+                        return
+                    if not is_data:
+                        # Holes of a sparse image are zeros; of a used-blocks image, free space
+                        # except where they fall inside allocated ranges (zero chunks are not stored)
+                        for hole, n in allocated_holes(partition, offset, length):
+                            zero_range(fd, start + hole, n)
+                        progress.add(length)
+                        continue
+                    for data in progress.counted(read_range(path, offset, length, COPY_CHUNK, should_stop)):
+                        pwrite_full(fd, data, start + offset)
+                        offset += len(data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def restore_partitions(directory, dest, numbers=None, progress=None, should_stop=None, workers=None):
+    """Restore a partition set onto dest.
+
+    With numbers=None the table regions are written and every partition
+    restored; otherwise only those partitions, which must already exist
+    on dest with the same start and size, and nothing else is touched.
+    """
+    layout = load_partition_set(directory)
+    partitions = [p for p in layout["partitions"] if numbers is None or p["number"] in numbers]
+    if numbers is None:
+        needed = max(p["start"] + p["size"] for p in partitions)
+        if not is_block_device(dest) and (not os.path.exists(dest) or os.path.getsize(dest) < layout["size"]):
+            with open(dest, "ab") as f:
+                f.truncate(layout["size"])
+        if device_size(dest) < needed:
+            raise ValueError(f"{dest} is smaller than the partitions ({format_size(needed)})")
+        fd = open_for_write(dest, truncate=False)
+        try:
+            with open(os.path.join(directory, PARTITION_SET_TABLE), "rb") as table:
+                for offset, length in layout["regions"]:
+                    data = table.read(length)
+                    if offset + length <= device_size(dest):
+                        pwrite_full(fd, data, offset)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    else:
+        with open(dest, "rb") as f:
+            current = {p["number"]: p for p in (read_partition_table(f) or {"partitions": []})["partitions"]}
+        for p in partitions:
+            match = current.get(p["number"])
+            if not match or (match["start"], match["size"]) != (p["start"], p["size"]):
+                raise ValueError(f"Partition {p['number']} on {dest} does not match the image set")
+    shared = SharedProgress(progress)
+    workers = workers or parallel_workers([directory, dest], len(partitions))
+    run_parallel([partial(restore_partition, directory, dest, p, shared, should_stop) for p in partitions], workers)
+    if numbers is None and layout["table"] == "gpt":
+        fit_gpt_to_device(dest)
+    return partitions
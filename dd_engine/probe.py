@@ -0,0 +1,139 @@
+import os
+import time
+import mmap
+import random
+
+from .devices import COPY_CHUNK, device_size, is_mounted, open_direct, pread_full, pwrite_full
+from .units import format_duration
+
+# Quick device probe shown in the disk picker
+PROBE_SEQ_BYTES = 64 * 1024 * 1024
+PROBE_RANDOM_READS = 256
+PROBE_BLOCK = 4096
+PROBE_MARKERS = 32
+PROBE_MAGIC = b"DDGUI-PROBE\0"
+
+def probe_device(path, allow_write=False):
+    """Short read (and optionally write) benchmark plus a capacity-fraud check.
+
+    Write tests only run with allow_write on an unmounted device; the blocks
+    they touch are read first and written back afterwards.
+    Returns a dict with seq_read/seq_write in bytes/s, random_iops and
+    capacity_ok (None when not tested or the device cannot do O_DIRECT).
+    """
+    size = device_size(path)
+    result = {"size": size, "seq_read": 0, "random_iops": 0, "seq_write": None, "capacity_ok": None}
+    blocks = size // PROBE_BLOCK
+    seq_len = min(PROBE_SEQ_BYTES, blocks * PROBE_BLOCK)
+    buf = mmap.mmap(-1, COPY_CHUNK)
+    small = mmap.mmap(-1, PROBE_BLOCK)
+
+    fd = open_direct(path, os.O_RDONLY)
+    try:
+        start = time.monotonic()
+        done = 0
+        while done < seq_len:
+            n = pread_full(fd, buf, done)
+            if n <= 0:
+                break
+            done += n
+        result["seq_read"] = done / max(time.monotonic() - start, 1e-6)
+
+        if blocks:
+            start = time.monotonic()
+            for _ in range(PROBE_RANDOM_READS):
+                pread_full(fd, small, random.randrange(blocks) * PROBE_BLOCK)
+            result["random_iops"] = PROBE_RANDOM_READS / max(time.monotonic() - start, 1e-6)
+    finally:
+        os.close(fd)
+
+    if allow_write and blocks and not is_mounted(path):
+        result["seq_write"] = probe_write_speed(path, size, seq_len)
+        result["capacity_ok"] = check_capacity(path, blocks)
+    return result
+
+def probe_write_speed(path, size, length):
+    offset = (size // 2) // PROBE_BLOCK * PROBE_BLOCK
+    length = min(length, (size - offset) // PROBE_BLOCK * PROBE_BLOCK)
+    saved = bytearray(length)
+    buf = mmap.mmap(-1, COPY_CHUNK)
+    pattern = os.urandom(COPY_CHUNK)
+    fd = open_direct(path, os.O_RDWR)
+    try:
+        for pos in range(0, length, COPY_CHUNK):
+            n = pread_full(fd, buf, offset + pos)
+            saved[pos:pos + n] = buf[:n]
+        start = time.monotonic()
+        for pos in range(0, length, COPY_CHUNK):
+            buf[:] = pattern
+            pwrite_full(fd, memoryview(buf)[:min(COPY_CHUNK, length - pos)], offset + pos)
+        os.fsync(fd)
+        elapsed = max(time.monotonic() - start, 1e-6)
+        for pos in range(0, length, COPY_CHUNK):
+            n = min(COPY_CHUNK, length - pos)
+            buf[:n] = saved[pos:pos + n]
+            pwrite_full(fd, memoryview(buf)[:n], offset + pos)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return length / elapsed
+
+def check_capacity(path, blocks):
+    """Write unique markers at scattered offsets and read them back.
+
+    Fake-capacity media wrap writes beyond their real size onto lower
+    addresses, so some markers come back overwritten. The read-back has to
+    bypass the page cache, which would hand back the markers just written,
+    so without O_DIRECT the check returns None.
+    """
+    nonce = os.urandom(16)
+    step = max(1, blocks // PROBE_MARKERS)
+    offsets = sorted({min(blocks - 1, i * step + random.randrange(step)) * PROBE_BLOCK
+                      for i in range(PROBE_MARKERS)} | {(blocks - 1) * PROBE_BLOCK})
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_DIRECT)
+    except OSError:
+        return None
+    buf = mmap.mmap(-1, PROBE_BLOCK)
+    try:
+        saved = {}
+        for offset in offsets:
+            pread_full(fd, buf, offset)
+            saved[offset] = bytes(buf)
+
+        def marker(offset):
+            head = PROBE_MAGIC + nonce + offset.to_bytes(8, "little")
+            return (head * (PROBE_BLOCK // len(head) + 1))[:PROBE_BLOCK]
+
+        for offset in offsets:
+            buf[:] = marker(offset)
+            pwrite_full(fd, buf, offset)
+        os.fsync(fd)
+        intact = True
+        for offset in offsets:
+            pread_full(fd, buf, offset)
+            if bytes(buf) != marker(offset):
+                intact = False
+        for offset in reversed(offsets):
+            buf[:] = saved[offset]
+            pwrite_full(fd, buf, offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return intact
+
+def describe_probe(result, op_bytes=None):
+    parts = [f"{result['seq_read'] / 1e6:.0f} MB/s read", f"{result['random_iops']:.0f} IOPS"]
+    rate = result["seq_read"]
+    if result["seq_write"]:
+        parts.append(f"{result['seq_write'] / 1e6:.0f} MB/s write")
+        rate = result["seq_write"]
+    if result["capacity_ok"] is False:
+        parts.append("FAKE CAPACITY?")
+    elif result["capacity_ok"]:
+        parts.append("capacity OK")
+    elif result["seq_write"] is not None:
+        parts.append("capacity check unsupported")
+    if op_bytes and rate:
+        parts.append(f"est. {format_duration(op_bytes / rate)}")
+    return ", ".join(parts)
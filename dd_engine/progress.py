@@ -0,0 +1,102 @@
+import os
+import stat
+import time
+
+# Progress from kernel counters: /proc/<pid>/io of the tool, /sys/class/block/<dev>/stat of the device
+KERNEL_SAMPLE_SECONDS = 0.5
+
+def device_stat_path(path):
+    node = os.path.basename(os.path.realpath(path))
+    stat_path = f"/sys/class/block/{node}/stat"
+    return stat_path if os.path.exists(stat_path) else None
+
+def read_counters(path):
+    try:
+        with open(path) as f:
+            return [int(v) for v in f.read().split()]
+    except (OSError, ValueError):
+        return None
+
+def read_proc_io(pid):
+    # Other users' processes (sudo runs the tool as root) are not readable; callers fall back to the device
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return None
+
+def process_tree(pid):
+    pids = [pid]
+    for current in pids:
+        try:
+            tasks = os.listdir(f"/proc/{current}/task")
+        except OSError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except (OSError, ValueError):
+                pass
+    return pids
+
+class KernelProgress:
+    """Samples I/O counters of the target devices and the tool's process tree.
+
+    Device counters give bytes, IOPS, average queue depth and utilization
+    over the last interval; the process counters give what the tool itself
+    read and wrote, which survives the tool exiting before the last sample.
+    """
+
+    def __init__(self, devices, pid_source=None, interval=KERNEL_SAMPLE_SECONDS):
+        self.stat_paths = [p for p in map(device_stat_path, devices) if p]
+        self.pid_source = pid_source
+        self.interval = interval
+        self.process_bytes = {}  # pid -> (read_bytes, write_bytes)
+        self.first = self.last = [read_counters(p) for p in self.stat_paths]
+        self.last_time = time.monotonic()
+
+    def sample(self):
+        now = time.monotonic()
+        current = [read_counters(p) for p in self.stat_paths]
+        elapsed_ms = max((now - self.last_time) * 1000, 1)
+        result = {"read_bytes": 0, "write_bytes": 0, "iops": 0.0, "queue_depth": 0.0,
+                  "utilization": 0.0, "in_flight": 0, "process_read": None, "process_write": None}
+        for first, last, counters in zip(self.first, self.last, current):
+            if not (first and last and counters):
+                continue
+            result["read_bytes"] += (counters[2] - first[2]) * 512
+            result["write_bytes"] += (counters[6] - first[6]) * 512
+            ios = counters[0] + counters[4] - last[0] - last[4]
+            if len(counters) > 11:
+                ios += counters[11] - last[11]  # discards
+            result["iops"] += ios * 1000 / elapsed_ms
+            result["queue_depth"] += (counters[10] - last[10]) / elapsed_ms
+            result["utilization"] = max(result["utilization"], min((counters[9] - last[9]) / elapsed_ms, 1.0))
+            result["in_flight"] += counters[8]
+        self.last, self.last_time = current, now
+
+        pid = self.pid_source() if self.pid_source else None
+        if pid:
+            for child in process_tree(pid):
+                io = read_proc_io(child)
+                if io:
+                    self.process_bytes[child] = (io.get("read_bytes", 0), io.get("write_bytes", 0))
+        if self.process_bytes:
+            result["process_read"] = sum(r for r, _ in self.process_bytes.values())
+            result["process_write"] = sum(w for _, w in self.process_bytes.values())
+        return result
+
+    def run(self, callback, should_stop):
+        while not should_stop():
+            time.sleep(self.interval)
+            callback(self.sample())
+
+def describe_counters(sample):
+    mb = 1024 * 1024
+    text = (f"Device: {sample['write_bytes'] // mb} MB written, {sample['read_bytes'] // mb} MB read, "
+            f"{sample['iops']:.0f} IOPS, queue depth {sample['queue_depth']:.1f}, "
+            f"{sample['utilization']:.0%} busy")
+    if sample["process_write"] is not None:
+        text += f"\nTool: {sample['process_write'] // mb} MB written, {sample['process_read'] // mb} MB read"
+    return text
@@ -0,0 +1,209 @@
+import struct
+import zlib
+from array import array
+
+from .devices import COPY_CHUNK
+from .units import ceil_div
+
+# qcow2 (v3) images, see docs/interop/qcow2.txt in the QEMU tree
+QCOW2_MAGIC = b"QFI\xfb"
+QCOW2_HEADER = struct.Struct(">4sIQIIQIIQQIIQQQQII")
+QCOW2_CLUSTER_BITS = 16
+QCOW_OFLAG_COPIED = 1 << 63
+QCOW_OFLAG_COMPRESSED = 1 << 62
+QCOW_OFLAG_ZERO = 1
+QCOW2_OFFSET_MASK = 0x00fffffffffffe00
+
+# Image format choices on the Create Disk Image screen -> file extension
+IMAGE_FORMATS = {"raw": ".img", "qcow2": ".qcow2", "qcow2 (compressed)": ".qcow2"}
+
+def is_qcow2(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == QCOW2_MAGIC
+    except OSError:
+        return False
+
+def write_qcow2(chunks, dest, virtual_size, compress=False, progress=None):
+    """Write the byte stream from chunks into dest as a qcow2 image.
+
+    All-zero clusters are left unallocated. With compress=True every
+    cluster that deflates to less than a cluster is stored compressed.
+    Returns the number of input bytes consumed.
+    """
+    cs = 1 << QCOW2_CLUSTER_BITS
+    l2_entries = cs // 8
+    refs_per_block = cs // 2  # refcount_order 4: 16-bit refcounts
+    l1_size = max(1, ceil_div(virtual_size, cs * l2_entries))
+    l1_clusters = ceil_div(l1_size * 8, cs)
+
+    # Size the refcount table for the worst case: every cluster allocated
+    rt_clusters = 1
+    while True:
+        bound = 1 + l1_clusters + rt_clusters + l1_size + ceil_div(virtual_size, cs)
+        bound += ceil_div(bound, refs_per_block) + 1
+        needed = ceil_div(ceil_div(bound, refs_per_block) * 8, cs)
+        if needed <= rt_clusters:
+            break
+        rt_clusters = needed
+
+    l1_offset = cs
+    rt_offset = l1_offset + l1_clusters * cs
+    refcounts = array("H", [1] * (1 + l1_clusters + rt_clusters))
+    l1 = [0] * l1_size
+    zero = bytes(cs)
+    csize_shift = 62 - (QCOW2_CLUSTER_BITS - 8)
+
+    def alloc():
+        refcounts.append(1)
+        return (len(refcounts) - 1) * cs
+
+    with open(dest, "wb") as f:
+        l2 = None
+        l2_index = -1
+        compressed_cursor = 0
+
+        def flush_l2():
+            if l2 is not None:
+                offset = alloc()
+                f.seek(offset)
+                f.write(struct.pack(f">{l2_entries}Q", *l2))
+                l1[l2_index] = offset | QCOW_OFLAG_COPIED
+
+        pending = bytearray()
+        consumed = 0
+        cluster_index = 0
+
+        def put_cluster(data):
+            nonlocal l2, l2_index, compressed_cursor
+            if data == zero:
+                return
+            if cluster_index // l2_entries != l2_index:
+                flush_l2()
+                l2_index = cluster_index // l2_entries
+                l2 = [0] * l2_entries
+            if compress:
+                packer = zlib.compressobj(6, zlib.DEFLATED, -12)
+                packed = packer.compress(data) + packer.flush()
+                if len(packed) < cs:
+                    if compressed_cursor % cs == 0 or compressed_cursor % cs + len(packed) > cs:
+                        compressed_cursor = alloc()
+                        refcounts[-1] = 0
+                    f.seek(compressed_cursor)
+                    f.write(packed)
+                    refcounts[compressed_cursor // cs] += 1
+                    extra_sectors = (compressed_cursor + len(packed) - 1) // 512 - compressed_cursor // 512
+                    l2[cluster_index % l2_entries] = (QCOW_OFLAG_COMPRESSED
+                                                      | (extra_sectors << csize_shift)
+                                                      | compressed_cursor)
+                    compressed_cursor += len(packed)
+                    return
+            offset = alloc()
+            f.seek(offset)
+            f.write(data)
+            l2[cluster_index % l2_entries] = offset | QCOW_OFLAG_COPIED
+
+        for data in chunks:
+            pending += data
+            consumed += len(data)
+            while len(pending) >= cs and cluster_index * cs < virtual_size:
+                put_cluster(bytes(pending[:cs]))
+                del pending[:cs]
+                cluster_index += 1
+            if progress:
+                progress(consumed)
+        if pending and cluster_index * cs < virtual_size:
+            put_cluster(bytes(pending) + zero[len(pending):])
+        flush_l2()
+
+        # Refcount blocks go last; they have to count themselves too
+        blocks = ceil_div(len(refcounts), refs_per_block)
+        while ceil_div(len(refcounts) + blocks, refs_per_block) > blocks:
+            blocks += 1
+        first_block = len(refcounts)
+        for _ in range(blocks):
+            refcounts.append(1)
+        refcounts.extend([0] * (blocks * refs_per_block - len(refcounts)))
+        refcounts.byteswap()  # refcount blocks are big-endian
+        f.seek(first_block * cs)
+        f.write(refcounts.tobytes())
+        table = [(first_block + i) * cs for i in range(blocks)]
+        f.seek(rt_offset)
+        f.write(struct.pack(f">{len(table)}Q", *table))
+
+        f.seek(l1_offset)
+        f.write(struct.pack(f">{l1_size}Q", *l1))
+        f.seek(0)
+        f.write(QCOW2_HEADER.pack(QCOW2_MAGIC, 3, 0, 0, QCOW2_CLUSTER_BITS, virtual_size,
+                                  0, l1_size, l1_offset, rt_offset, rt_clusters,
+                                  0, 0, 0, 0, 0, 4, QCOW2_HEADER.size))
+        f.write(bytes(8))  # header extension end marker
+        f.truncate((first_block + blocks) * cs)
+    return consumed
+
+def read_exactly(f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) < length:
+        raise ValueError("Truncated qcow2 image")
+    return data
+
+def read_qcow2_header(f):
+    (magic, version, backing_offset, _, cluster_bits, size, crypt_method, l1_size,
+     l1_offset, _, _, _, _, incompatible, _, _, _, _) = QCOW2_HEADER.unpack(read_exactly(f, 0, QCOW2_HEADER.size))
+    if magic != QCOW2_MAGIC or version not in (2, 3):
+        raise ValueError("Not a qcow2 image")
+    if version == 2:
+        incompatible = 0
+    if backing_offset or crypt_method or incompatible & ~1:
+        raise ValueError("qcow2 images with backing files, encryption or extended features are not supported")
+    return cluster_bits, size, l1_size, l1_offset
+
+def qcow2_virtual_size(path):
+    with open(path, "rb") as f:
+        return read_qcow2_header(f)[1]
+
+def qcow2_stream(path, should_stop=None):
+    """Yield the virtual disk of a qcow2 image in order, in COPY_CHUNK pieces."""
+    with open(path, "rb") as f:
+        cluster_bits, size, l1_size, l1_offset = read_qcow2_header(f)
+        cs = 1 << cluster_bits
+        l2_entries = cs // 8
+        csize_shift = 62 - (cluster_bits - 8)
+        zero = bytes(cs)
+        l1 = struct.unpack(f">{l1_size}Q", read_exactly(f, l1_offset, l1_size * 8))
+
+        out = bytearray()
+        remaining = size
+        for l1_entry in l1:
+            l2_offset = l1_entry & QCOW2_OFFSET_MASK
+            if l2_offset:
+                l2 = struct.unpack(f">{l2_entries}Q", read_exactly(f, l2_offset, cs))
+            else:
+                l2 = (0,) * l2_entries
+            for entry in l2:
+                if remaining <= 0:
+                    break
+                if entry & QCOW_OFLAG_COMPRESSED:
+                    offset = entry & ((1 << csize_shift) - 1)
+                    sectors = ((entry >> csize_shift) & ((1 << (cluster_bits - 8)) - 1)) + 1
+                    f.seek(offset)
+                    raw = f.read(sectors * 512 - (offset & 511))
+                    inflate = zlib.decompressobj(-12)
+                    data = inflate.decompress(raw, cs)
+                    if len(data) < cs and not inflate.eof:
+                        raise ValueError("Truncated qcow2 image")
+                    data += zero[len(data):]
+                elif entry & QCOW_OFLAG_ZERO or not entry & QCOW2_OFFSET_MASK:
+                    data = zero
+                else:
+                    data = read_exactly(f, entry & QCOW2_OFFSET_MASK, min(cs, remaining))
+                out += data[:remaining]
+                remaining -= cs
+                if len(out) >= COPY_CHUNK:
+                    if should_stop and should_stop():
+                        return
+                    yield bytes(out)
+                    out.clear()
+        if out:
+            yield bytes(out)
@@ -0,0 +1,146 @@
+import os
+import hashlib
+import struct
+import random
+import math
+from functools import partial
+
+from .discard import is_zero
+from .parallel import SharedProgress, parallel_workers, run_parallel
+from .units import ceil_div
+from .verify import VERIFY_CHUNK, load_merkle
+
+# Sampled read-back: random chunks plus the first and last chunks and partition table areas
+SAMPLE_CHUNK = 1024 * 1024
+SAMPLE_COUNT = 3000  # ~95% confidence of catching 0.1% bad chunks, whatever the disk size
+SAMPLE_TOLERANCE = 0.001  # bad-chunk fraction the confidence figure refers to
+
+def pattern_base(seed):
+    return hashlib.shake_128(struct.pack("<Q", seed)).digest(SAMPLE_CHUNK)
+
+def pattern_chunk(base, index, length):
+    """Chunk index of a seeded pattern: the base block rotated and stamped per
+    index, so a chunk that lands in the wrong place does not match."""
+    turn = index * 2654435761 % len(base)
+    data = bytearray(base[turn:])
+    data += base[:turn]
+    struct.pack_into("<Q", data, 0, index)
+    return data[:length]
+
+def pattern_stream(seed, size, should_stop=None):
+    base = pattern_base(seed)
+    for index in range(ceil_div(size, SAMPLE_CHUNK)):
+        if should_stop and should_stop():
+            return
+        yield pattern_chunk(base, index, min(SAMPLE_CHUNK, size - index * SAMPLE_CHUNK))
+
+def expect_zeros():
+    return lambda index, data: is_zero(data)
+
+def expect_pattern(seed):
+    base = pattern_base(seed)
+    return lambda index, data: data == pattern_chunk(base, index, len(data))
+
+def expect_source(path, cache):
+    """(chunk_size, check) comparing with a source image: against its tree
+    or cached chunk hashes when there are any, else against the same bytes
+    read from it."""
+    tree = load_merkle(path)
+    if tree:
+        leaves = tree["leaves"]
+        return tree["leaf_size"], lambda index, data: hashlib.sha256(data).digest() == leaves[index]
+    cached = cache.get(path)
+    if cached:
+        digests = cached[1]
+        return VERIFY_CHUNK, lambda index, data: hashlib.sha256(data).digest() == digests[index]
+
+    def check(index, data):
+        with open(path, "rb") as f:
+            f.seek(index * SAMPLE_CHUNK)
+            return f.read(len(data)) == data
+    return SAMPLE_CHUNK, check
+
+def sample_indexes(size, chunk_size, count, regions=(), rng=None):
+    """(required, random) chunk index sets: the first and last chunks and
+    those overlapping regions, plus count others drawn at random."""
+    total = ceil_div(size, chunk_size)
+    required = {0, total - 1}
+    for offset, length in regions:
+        required.update(range(offset // chunk_size, min(total, ceil_div(offset + length, chunk_size))))
+    count = min(count, total - len(required))
+    drawn = (rng or random.SystemRandom()).sample(range(total), min(total, count + len(required)))
+    return required, set([i for i in drawn if i not in required][:count])
+
+def log_choose(n, k):
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+def miss_chance(population, bad, drawn):
+    """Chance that drawing without replacement misses every one of bad chunks."""
+    if population - bad < drawn:
+        return 0.0
+    return math.exp(log_choose(population - bad, drawn) - log_choose(population, drawn))
+
+def sample_confidence(population, drawn, total):
+    """(confidence, bound) for a clean random sample: the chance of having hit
+    a bad chunk if SAMPLE_TOLERANCE of them were bad, and the largest bad
+    fraction that a 95% confidence level cannot rule out."""
+    if drawn >= population:
+        return 1.0, 0.0
+    confidence = 1 - miss_chance(population, max(1, math.ceil(SAMPLE_TOLERANCE * total)), drawn)
+    lo, hi = 1, population
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if miss_chance(population, mid, drawn) <= 0.05:
+            hi = mid
+        else:
+            lo = mid + 1
+    return confidence, (lo - 1) / total
+
+def sample_verify(dest, size, chunk_size, check, count=SAMPLE_COUNT, regions=(), progress=None,
+                  should_stop=None, workers=None):
+    """Read a sample of dest's chunks in parallel and check(index, data) each.
+
+    Returns {"checked", "total", "bad", "coverage", "confidence", "bound"},
+    the last two from sample_confidence() over the randomly drawn part.
+    """
+    required, drawn = sample_indexes(size, chunk_size, count, regions)
+    indexes = sorted(required | drawn)
+    workers = workers or parallel_workers([dest], len(indexes))
+    shared = SharedProgress(progress)
+    bad = []
+
+    def read_part(part):
+        fd = os.open(dest, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            for index in part:
+                if should_stop and should_stop():
+                    return
+                offset = index * chunk_size
+                data = os.pread(fd, min(chunk_size, size - offset), offset)
+                if not check(index, data):
+                    bad.append(index)
+                shared.add(len(data))
+        finally:
+            os.close(fd)
+
+    # Each worker keeps ascending offsets; interleaving spreads them over the disk
+    run_parallel([partial(read_part, indexes[i::workers]) for i in range(workers)], workers)
+    total = ceil_div(size, chunk_size)
+    confidence, bound = sample_confidence(total - len(required), len(drawn), total)
+    return {
+        "checked": len(indexes),
+        "total": total,
+        "bad": sorted(bad),
+        "coverage": shared.done / size if size else 1.0,
+        "confidence": confidence,
+        "bound": bound,
+    }
+
+def describe_sample(result, chunk_size):
+    if result["bad"]:
+        return (f"{len(result['bad'])} of {result['checked']} sampled chunks differ "
+                f"(first at offset {result['bad'][0] * chunk_size})")
+    return (f"Sampled {result['checked']} of {result['total']} chunks ({result['coverage']:.2%} of the data): "
+            f"{result['confidence']:.1%} confidence that under {SAMPLE_TOLERANCE:.1%} are bad, "
+            f"95% bound {result['bound']:.3%}")
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from .devices import read_chunks, write_stream
+from .iolimits import throttled
+
+# Content-addressed image store: <store>/chunks/<aa>/<sha256> + <store>/manifests/*.json
+STORE_CHUNK = 1024 * 1024
+MANIFEST_SUFFIX = ".manifest.json"
+
+def is_manifest(path):
+    return bool(path) and path.endswith(MANIFEST_SUFFIX) and os.path.isfile(path)
+
+def chunk_path(store_dir, digest):
+    return os.path.join(store_dir, "chunks", digest[:2], digest)
+
+def store_image(source, store_dir, name, progress=None, should_stop=None, limiter=None):
+    """Split source into fixed chunks and add the unseen ones to the store.
+
+    All-zero chunks are not stored at all. Returns (manifest_path,
+    new_chunks, total_chunks); nothing is written to manifests/ when the
+    run is stopped early.
+    """
+    zero = bytes(STORE_CHUNK)
+    chunks = []
+    size = 0
+    new_chunks = 0
+    source_chunks = read_chunks(source, STORE_CHUNK, should_stop)
+    if limiter:
+        source_chunks = throttled(source_chunks, limiter)
+    for data in source_chunks:
+        size += len(data)
+        if data == zero[:len(data)]:
+            chunks.append(None)
+        else:
+            digest = hashlib.sha256(data).hexdigest()
+            path = chunk_path(store_dir, digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.tmp{os.getpid()}"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                new_chunks += 1
+            chunks.append(digest)
+        if progress:
+            progress(size)
+    if should_stop and should_stop():
+        return None, new_chunks, len(chunks)
+
+    manifest = {
+        "version": 1,
+        "name": name,
+        "source": source,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "size": size,
+        "chunk_size": STORE_CHUNK,
+        "chunks": chunks,
+    }
+    manifest_dir = os.path.join(store_dir, "manifests")
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest_path = os.path.join(manifest_dir, name + MANIFEST_SUFFIX)
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+    return manifest_path, new_chunks, len(chunks)
+
+def load_manifest(manifest_path):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != 1:
+        raise ValueError(f"Unsupported manifest version in {manifest_path}")
+    # Manifests live in <store>/manifests/
+    manifest["store"] = os.path.dirname(os.path.dirname(os.path.abspath(manifest_path)))
+    return manifest
+
+def manifest_stream(manifest, should_stop=None):
+    zero = bytes(manifest["chunk_size"])
+    remaining = manifest["size"]
+    for digest in manifest["chunks"]:
+        if should_stop and should_stop():
+            return
+        length = min(manifest["chunk_size"], remaining)
+        if digest is None:
+            data = zero[:length]
+        else:
+            with open(chunk_path(manifest["store"], digest), "rb") as f:
+                data = f.read()
+            if len(data) != length:
+                raise ValueError(f"Chunk {digest} in store is damaged")
+        remaining -= length
+        yield data
+
+def flash_manifest(manifest_path, dest, progress=None, should_stop=None):
+    manifest = load_manifest(manifest_path)
+    return write_stream(manifest_stream(manifest, should_stop), dest, progress)
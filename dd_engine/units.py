@@ -0,0 +1,35 @@
+import re
+
+# Sizes, durations and progress lines as the front-ends show them
+def ceil_div(a, b):
+    return -(-a // b)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+SIZE_SUFFIXES = " KMGT"
+
+def parse_size(value):
+    """Bytes from an int or a string like "512MiB", "4G" or "2048"."""
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)(?:i?B)?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Bad size {value!r}")
+    return int(match.group(1)) << (10 * SIZE_SUFFIXES.index(match.group(2).upper() or " "))
+
+def format_size(nbytes):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if nbytes < 1024 or unit == "TB":
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{nbytes} B"
+        nbytes /= 1024
+
+def copy_status(done, total, prefix="Copied"):
+    """Percentage and the "Copied: N MB, P% Done" line for done of total bytes."""
+    percent = min(done / total * 100, 100) if total > 0 else 0
+    return percent, f"{prefix}: {done // (1024 * 1024)} MB, {percent:.0f}% Done"
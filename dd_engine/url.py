@@ -0,0 +1,199 @@
+import os
+import hashlib
+import time
+import collections
+import zlib
+import contextlib
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from .devices import COPY_CHUNK
+from .library import COMPRESSED_MAGICS
+from .verify import hashed
+
+# Flashing straight from HTTP(S): concurrent range requests reassembled in order
+URL_SEGMENT = 8 * 1024 * 1024
+URL_CONNECTIONS = 4
+URL_WINDOW = 8  # segments fetched ahead of the writer; bounds memory to URL_WINDOW * URL_SEGMENT
+URL_READ = 256 * 1024
+URL_TIMEOUT = 30
+URL_RETRIES = 4
+URL_AGENT = "dd_py_GUI"
+CHECKSUM_ALGORITHMS = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}  # by hex digest length
+
+# Codecs load on first use; each factory returns a decompressor and the error it raises on bad input
+def gzip_decompressor():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS), zlib.error
+
+def xz_decompressor():
+    import lzma
+    return lzma.LZMADecompressor(), lzma.LZMAError
+
+def bzip2_decompressor():
+    import bz2
+    return bz2.BZ2Decompressor(), OSError
+
+def zstd_decompressor():
+    from compression import zstd  # Python 3.14+
+    return zstd.ZstdDecompressor(), zstd.ZstdError
+
+STREAM_DECOMPRESSORS = {
+    "gzip": gzip_decompressor,
+    "xz": xz_decompressor,
+    "bzip2": bzip2_decompressor,
+    "zstd": zstd_decompressor,
+}
+
+def is_url(path):
+    return bool(path) and path.startswith(("http://", "https://"))
+
+def url_open(url, headers=None):
+    import urllib.request  # with http.client and ssl, the bulk of a cold start; only load it to download
+    request = urllib.request.Request(url, headers={"User-Agent": URL_AGENT, **(headers or {})})
+    return urllib.request.urlopen(request, timeout=URL_TIMEOUT)
+
+@contextlib.contextmanager
+def http_errors(url):
+    # http.client's protocol errors (IncompleteRead, ...) surface as OSError, like the socket errors around them
+    import http.client
+    try:
+        yield
+    except http.client.HTTPException as e:
+        raise OSError(f"{url}: {type(e).__name__} {e}") from None
+
+def probe_url(url):
+    """Size, range support and compression of the resource behind url, from its first 64 KiB."""
+    with http_errors(url), url_open(url, {"Range": "bytes=0-65535"}) as resp:
+        head = resp.read(65536)
+        final_url = resp.geturl()  # range requests go straight to the redirect target
+        total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+        if resp.status == 206 and total.isdigit():
+            size, ranges = int(total), True
+        else:
+            size, ranges = int(resp.headers.get("Content-Length") or 0) or None, False
+    compression = next((name for magic, name in COMPRESSED_MAGICS if head.startswith(magic)), None)
+    if compression:
+        try:
+            STREAM_DECOMPRESSORS[compression]()
+        except ImportError:
+            raise ValueError(f"{compression} streams need a newer Python") from None
+    return {"url": final_url, "size": size, "ranges": ranges, "compression": compression}
+
+def resolve_checksum(value, url):
+    """A hex digest, given directly or looked up for url in a checksum file (e.g. SHA256SUMS) at value."""
+    value = value.strip()
+    if is_url(value):
+        with http_errors(value), url_open(value) as resp:
+            lines = resp.read(1024 * 1024).decode("utf-8", "replace").splitlines()
+        name = os.path.basename(urllib.parse.urlparse(url).path)
+        lines = [line for line in lines if name in line.split() or f"*{name}" in line.split() or f"({name})" in line] \
+            or (lines if len(lines) == 1 else [])
+        digests = [token for line in lines for token in line.split() if len(token) in CHECKSUM_ALGORITHMS]
+        if not digests:
+            raise ValueError(f"No checksum for {name} in {value}")
+        value = digests[0]
+    if len(value) not in CHECKSUM_ALGORITHMS or not all(c in "0123456789abcdefABCDEF" for c in value):
+        raise ValueError(f"Not a checksum: {value!r}")
+    return value.lower()
+
+def fetch_range(url, start, end, should_stop=None):
+    """Bytes [start, end) of url, resuming where a dropped connection stopped."""
+    parts = []
+    got = start
+    error = "connection closed early"
+    for attempt in range(URL_RETRIES):
+        try:
+            with http_errors(url), url_open(url, {"Range": f"bytes={got}-{end - 1}"}) as resp:
+                if resp.status != 206 or not resp.headers.get("Content-Range", "").startswith(f"bytes {got}-"):
+                    raise ValueError(f"{url} ignored the range request")
+                while got < end:
+                    if should_stop and should_stop():
+                        return b"".join(parts)
+                    data = resp.read(min(URL_READ, end - got))
+                    if not data:
+                        break
+                    parts.append(data)
+                    got += len(data)
+            if got == end:
+                return b"".join(parts)
+        except OSError as e:
+            error = e
+        time.sleep(attempt)
+    raise OSError(f"Download of {url} failed at byte {got}: {error}")
+
+def url_chunks(info, progress=None, should_stop=None, connections=URL_CONNECTIONS):
+    """The resource in order. With range support, segments are fetched
+    concurrently and handed on in offset order as each one completes."""
+    url, size = info["url"], info["size"]
+    done = 0
+    if not info["ranges"]:
+        with http_errors(url), url_open(url) as resp:
+            for data in iter(lambda: resp.read(COPY_CHUNK), b""):
+                if should_stop and should_stop():
+                    return
+                done += len(data)
+                if progress:
+                    progress(done)
+                yield data
+        return
+    pool = ThreadPoolExecutor(max_workers=connections)
+    pending = collections.deque()  # futures in offset order: the reassembly buffer
+    offset = 0
+    try:
+        while pending or offset < size:
+            while offset < size and len(pending) < URL_WINDOW:
+                end = min(offset + URL_SEGMENT, size)
+                pending.append(pool.submit(fetch_range, url, offset, end, should_stop))
+                offset = end
+            data = pending.popleft().result()
+            if should_stop and should_stop():
+                return
+            done += len(data)
+            if progress:
+                progress(done)
+            yield data
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+def decompressed(chunks, compression, should_stop=None):
+    """Decompress a chunk stream, at most COPY_CHUNK of output per step so
+    highly compressed images never inflate in memory at once."""
+    new = STREAM_DECOMPRESSORS[compression]
+    d, error = new()
+    for data in chunks:
+        while data or not (d.eof or getattr(d, "needs_input", True)):
+            if d.eof:
+                d, error = new()  # next member of a concatenated stream (pigz, pbzip2, xz -T)
+            try:
+                out = d.decompress(data, COPY_CHUNK)
+            except error as e:
+                raise ValueError(f"Corrupt {compression} stream: {e}") from None
+            data = d.unused_data if d.eof else getattr(d, "unconsumed_tail", b"")
+            if out:
+                yield out
+    if compression == "gzip":
+        rest = d.flush()
+        if rest:
+            yield rest
+    if not d.eof and not (should_stop and should_stop()):
+        raise ValueError("The compressed stream ends early")
+
+def url_stream(info, checksum=None, progress=None, should_stop=None):
+    """The image behind a probed URL as chunks: downloaded in parallel,
+    decompressed when needed, and checked against checksum, which may be
+    the digest of the download or of the image itself."""
+    chunks = url_chunks(info, progress, should_stop)
+    if checksum:
+        algorithm = CHECKSUM_ALGORITHMS[len(checksum)]
+        download_hash, image_hash = hashlib.new(algorithm), hashlib.new(algorithm)
+        chunks = hashed(chunks, download_hash)
+    if info["compression"]:
+        chunks = decompressed(chunks, info["compression"], should_stop)
+    if checksum:
+        chunks = hashed(chunks, image_hash)
+    yield from chunks
+    if checksum and not (should_stop and should_stop()) \
+            and checksum not in (download_hash.hexdigest(), image_hash.hexdigest()):
+        raise ValueError(f"Checksum mismatch: {info['url']} does not match {checksum}")
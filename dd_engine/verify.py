@@ -0,0 +1,228 @@
+import os
+import hashlib
+import struct
+import sqlite3
+
+from . import DATA_DIR
+from .devices import COPY_CHUNK, is_block_device, is_rotational, read_chunks
+from .metrics import write_atomic
+from .qcow2 import is_qcow2
+from .store import is_manifest
+from .units import ceil_div
+
+# Reference checksums of source images, reused by every later verify
+CHECKSUM_DB = os.path.join(DATA_DIR, "checksums.sqlite")
+VERIFY_CHUNK = 4 * 1024 * 1024
+
+def file_identity(path):
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+class ChecksumCache:
+    """Full SHA-256 plus per-chunk SHA-256 of regular files.
+
+    Keyed by (device, inode); an entry only counts while size, mtime and
+    ctime are unchanged.
+    """
+
+    def __init__(self, path=CHECKSUM_DB):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS checksums (
+            dev INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, ctime_ns INTEGER,
+            chunk_size INTEGER, sha256 TEXT, chunks BLOB, PRIMARY KEY (dev, inode))""")
+        return conn
+
+    def get(self, path, chunk_size=VERIFY_CHUNK):
+        """(sha256, [chunk digests]) for an unchanged file, else None."""
+        try:
+            identity = file_identity(path)
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT size, mtime_ns, ctime_ns, chunk_size, sha256, chunks FROM checksums"
+                " WHERE dev = ? AND inode = ?", identity[:2]).fetchone()
+            conn.close()
+        except (OSError, sqlite3.Error):
+            return None
+        if not row or tuple(row[:3]) != identity[2:] or row[3] != chunk_size:
+            return None
+        chunks = row[5]
+        return row[4], [chunks[i:i + 32] for i in range(0, len(chunks), 32)]
+
+    def put(self, path, identity, sha256, chunk_digests, chunk_size=VERIFY_CHUNK):
+        # identity is taken before hashing; a file that changed meanwhile is not cached
+        try:
+            if file_identity(path) != identity:
+                return
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (*identity, chunk_size, sha256, b"".join(chunk_digests)))
+            conn.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error saving checksums: {e}")
+
+class ChunkHasher:
+    """Feeds a byte stream and collects the full and per-chunk SHA-256."""
+
+    def __init__(self, chunk_size=VERIFY_CHUNK):
+        self.chunk_size = chunk_size
+        self.full = hashlib.sha256()
+        self.current = hashlib.sha256()
+        self.filled = 0
+        self.digests = []
+
+    def update(self, data):
+        self.full.update(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.chunk_size - self.filled)
+            self.current.update(view[:take])
+            self.filled += take
+            view = view[take:]
+            if self.filled == self.chunk_size:
+                self.digests.append(self.current.digest())
+                self.current = hashlib.sha256()
+                self.filled = 0
+
+    def result(self):
+        digests = list(self.digests)
+        if self.filled:
+            digests.append(self.current.digest())
+        return self.full.hexdigest(), digests
+
+def source_checksums(path, cache, progress=None, should_stop=None):
+    """Reference hashes for a source file, from the cache or by reading it once."""
+    cached = cache.get(path)
+    if cached:
+        return cached
+    identity = file_identity(path)
+    hasher = ChunkHasher()
+    done = 0
+    for data in read_chunks(path, COPY_CHUNK, should_stop):
+        hasher.update(data)
+        done += len(data)
+        if progress:
+            progress(done)
+    if should_stop and should_stop():
+        return None
+    sha256, digests = hasher.result()
+    cache.put(path, identity, sha256, digests)
+    return sha256, digests
+
+def is_plain_image(path):
+    # Raw/ISO files whose bytes are exactly what ends up on the disk
+    return bool(path) and os.path.isfile(path) and not is_manifest(path) and not is_qcow2(path)
+
+def hashed(chunks, hasher):
+    for data in chunks:
+        hasher.update(data)
+        yield data
+
+def verify_against(dest, chunk_digests, size, progress=None, should_stop=None, chunk_size=VERIFY_CHUNK):
+    """Read size bytes back from dest and return the indexes of chunks that differ."""
+    digests = merkle_leaves(dest, size, chunk_size, progress, should_stop)
+    if digests is None:
+        return []
+    return [index for index, (found, expected) in enumerate(zip(digests, chunk_digests)) if found != expected]
+
+# Merkle trees over fixed leaves, hashed across a process pool and kept in <image>.merkle
+MERKLE_SUFFIX = ".merkle"
+MERKLE_MAGIC = b"DDMERKL1"
+MERKLE_LEAF = VERIFY_CHUNK  # leaves are plain chunk SHA-256s, the same as the checksum cache's
+MERKLE_BATCH = 16  # leaves per pool task
+MERKLE_HEADER = struct.Struct("<8sIQQ32s")  # magic, leaf size, image size, image mtime_ns, root
+
+def hash_leaves(path, first, count, leaf_size, size):
+    # Runs in a pool process: reads and hashes its own range
+    digests = []
+    with open(path, "rb", buffering=0) as f:
+        if is_block_device(path):
+            # The read-back has to come from the device, not the page cache
+            os.posix_fadvise(f.fileno(), first * leaf_size, count * leaf_size, os.POSIX_FADV_DONTNEED)
+        for index in range(first, first + count):
+            offset = index * leaf_size
+            digests.append(hashlib.sha256(os.pread(f.fileno(), min(leaf_size, size - offset), offset)).digest())
+    return digests
+
+def hash_workers(path):
+    # One reader on a spinning disk; elsewhere the CPU is the limit
+    return 1 if os.path.exists(path) and is_rotational(path) else os.cpu_count() or 1
+
+def merkle_leaves(path, size, leaf_size=MERKLE_LEAF, progress=None, should_stop=None, workers=None):
+    """Leaf digests of the first size bytes of path, or None when stopped."""
+    count = ceil_div(size, leaf_size)
+    batches = [(first, min(MERKLE_BATCH, count - first)) for first in range(0, count, MERKLE_BATCH)]
+    workers = min(workers or hash_workers(path), len(batches))
+    leaves = [None] * count
+    done = 0
+    if workers <= 1:
+        for first, n in batches:
+            if should_stop and should_stop():
+                return None
+            leaves[first:first + n] = hash_leaves(path, first, n, leaf_size, size)
+            done += min(n * leaf_size, size - first * leaf_size)
+            if progress:
+                progress(done)
+        return leaves
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    # spawn: forking a process that runs Tk and other threads is not safe
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = {pool.submit(hash_leaves, path, first, n, leaf_size, size): (first, n) for first, n in batches}
+        for future in as_completed(futures):
+            first, n = futures[future]
+            leaves[first:first + n] = future.result()
+            done += min(n * leaf_size, size - first * leaf_size)
+            if progress:
+                progress(done)
+            if should_stop and should_stop():
+                return None
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return leaves
+
+def merkle_root(leaves):
+    # Inner nodes are tagged so a leaf can never pass for one; an odd node moves up unchanged
+    level = list(leaves) or [hashlib.sha256(b"").digest()]
+    while len(level) > 1:
+        level = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+def merkle_sidecar(path):
+    return path + MERKLE_SUFFIX
+
+def load_merkle(path, leaf_size=None):
+    """The tree of an image file from its sidecar, or None when missing or stale."""
+    try:
+        st = os.stat(path)
+        with open(merkle_sidecar(path), "rb") as f:
+            magic, leaf, size, mtime_ns, root = MERKLE_HEADER.unpack(f.read(MERKLE_HEADER.size))
+            data = f.read()
+    except (OSError, struct.error):
+        return None
+    if magic != MERKLE_MAGIC or (size, mtime_ns) != (st.st_size, st.st_mtime_ns) or \
+            (leaf_size and leaf != leaf_size) or len(data) != ceil_div(size, leaf) * 32:
+        return None
+    leaves = [data[i:i + 32] for i in range(0, len(data), 32)]
+    if merkle_root(leaves) != root:
+        return None
+    return {"leaf_size": leaf, "size": size, "root": root, "leaves": leaves}
+
+def build_merkle(path, progress=None, should_stop=None, workers=None):
+    """Hash an image file into a tree and write its sidecar; None when stopped."""
+    st = os.stat(path)
+    leaves = merkle_leaves(path, st.st_size, MERKLE_LEAF, progress, should_stop, workers)
+    if leaves is None:
+        return None
+    root = merkle_root(leaves)
+    if os.stat(path).st_mtime_ns == st.st_mtime_ns:  # changed while hashing: keep no sidecar
+        write_atomic(merkle_sidecar(path),
+                     MERKLE_HEADER.pack(MERKLE_MAGIC, MERKLE_LEAF, st.st_size, st.st_mtime_ns, root)
+                     + b"".join(leaves))
+    return {"leaf_size": MERKLE_LEAF, "size": st.st_size, "root": root, "leaves": leaves}